@@ -0,0 +1,165 @@
+# coding: utf8
+
+"""Measure download_missing_trades of each broker on a local mock exchange.
+
+For each broker, report trades/sec, requests/sec and CPU time per trade of
+the downloading process (the mock exchange runs in another process), and the
+time per trade spent in each stage of the download (see brokers.telemetry).
+
+The history of the mock exchange ends now. With several workers, Kraken
+time shards are scaled to this short history: 4 shards per worker.
+
+Usage (from the root of the repository):
+$ python -m benchmarks.bench_download [-h] [--trades N] [--latency SECONDS]
+                                      [--throttle-rate RATE] [--workers N]
+                                      [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tests.mock_exchange import MockExchange
+import src.download_trades as dwnld
+from src.brokers import http_session, telemetry
+from src.brokers.rate_limit import RateLimiter
+
+
+def serve(exchange_kwargs, urls, stop):
+    """Run a mock exchange until stop is set.
+
+    Positional arguments:
+    exchange_kwargs -- The arguments of MockExchange
+    urls            -- A queue where the GDAX and Kraken URLs are put
+    stop            -- An event stopping the exchange
+    """
+    with MockExchange(**exchange_kwargs) as exchange:
+        urls.put((exchange.gdax_url, exchange.kraken_url))
+        stop.wait()
+
+
+def measure(broker, pair, file_path, workers):
+    """Download all trades of the mock exchange and return a dictionnary
+    with the measures.
+
+    Positional arguments:
+    broker    -- The broker (with BASE_URL set to the mock exchange)
+    pair      -- The pair to download
+    file_path -- The output file
+    workers   -- The number of pages (GDAX) or time shards (Kraken) fetched
+                 at the same time
+    """
+    stats = http_session.get_session().stats
+    requests_before = stats.requests
+    registry = telemetry.reset()
+    times_before = os.times()
+    start = time.time()
+
+    # Do not measure the printing of each page
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        broker.download_missing_trades(file_path, pair, workers=workers)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    elapsed = time.time() - start
+    times_after = os.times()
+    cpu = sum(times_after[:2]) - sum(times_before[:2])
+    nb_requests = stats.requests - requests_before
+
+    with open(file_path, 'r') as csv_file:
+        nb_trades = sum(1 for _ in csv_file) - 1
+
+    [snapshot] = registry.snapshot()['pairs']
+    stages = dict((stage, histogram['sum'] / nb_trades * 1e6)
+                  for stage, histogram in snapshot['stages'].items())
+
+    return dict(trades=nb_trades, requests=nb_requests, seconds=elapsed,
+                trades_per_sec=nb_trades / elapsed,
+                requests_per_sec=nb_requests / elapsed,
+                cpu_us_per_trade=cpu / nb_trades * 1e6,
+                stage_us_per_trade=stages)
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--trades', type=int, default=20000,
+                        help='Number of trades of the history '
+                             '(default: 20000)')
+    parser.add_argument('--latency', type=float, default=0.,
+                        help='Latency of each answer in seconds '
+                             '(default: 0)')
+    parser.add_argument('--throttle-rate', type=float, default=0.,
+                        help='Proportion of throttled requests (default: 0)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of GDAX pages or Kraken time shards '
+                             'fetched at the same time (default: 1)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    # The history ends now, so Kraken shards end with it
+    interval = 0.01
+    exchange_kwargs = dict(nb_trades=args.trades, latency=args.latency,
+                           throttle_rate=args.throttle_rate,
+                           kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS,
+                           start=time.time() - args.trades * interval,
+                           interval=interval)
+    dwnld.Kraken.SHARD_DURATION = max(
+        1, int(args.trades * interval * 1e9) // (4 * args.workers))
+    urls = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve,
+                                     args=(exchange_kwargs, urls, stop))
+    server.start()
+
+    directory = tempfile.mkdtemp()
+    results = {}
+
+    try:
+        gdax_url, kraken_url = urls.get(timeout=10)
+        http_session.configure(pool_size=max(args.workers,
+                                             http_session.DEFAULT_POOL_SIZE))
+
+        benchmarks = [(dwnld.GDAX, 'BTC-EUR', gdax_url),
+                      (dwnld.Kraken, 'XBTEUR', kraken_url)]
+
+        for broker, pair, url in benchmarks:
+            # Measure the client, not the published rate limits
+            broker.BASE_URL = url
+            broker.RATE_LIMITER = RateLimiter(10000, burst=100,
+                                              backoff_base=0.01)
+
+            file_path = os.path.join(directory, broker.__name__ + '.csv')
+            results[broker.__name__] = measure(broker, pair, file_path,
+                                               args.workers)
+    finally:
+        stop.set()
+        server.join()
+        shutil.rmtree(directory)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    for name in sorted(results):
+        result = results[name]
+        print('%-6s %8d trades in %6.2fs - %9.0f trades/s - %7.1f requests/s'
+              ' - %6.1f us CPU/trade' %
+              (name, result['trades'], result['seconds'],
+               result['trades_per_sec'], result['requests_per_sec'],
+               result['cpu_us_per_trade']))
+        print('       us/trade - ' +
+              ', '.join('%s: %.1f' % (stage,
+                                      result['stage_us_per_trade'][stage])
+                        for stage in telemetry.STAGES))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# coding: utf8
+
+"""Compare load_file of resample.py with the former read_csv path.
+
+For GDAX and Kraken files of synthetic trades, report trades/sec and peak
+RSS of:
+- read_csv: pandas.read_csv with parse_dates (the former load_file)
+- load_file: times parsed by datetime_column
+- compact  : load_file with compact=True (float32 prices and sizes)
+
+Each measure runs in its own process, so peak RSS are not mixed.
+
+Usage (from the root of the repository):
+$ python -m benchmarks.bench_load [-h] [--trades N]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from tests.mock_exchange import MockExchange
+import src.download_trades as dwnld
+import src.resample as resample
+from src.brokers.trade_writer import CsvTradeWriter
+
+
+METHODS = ['read_csv', 'load_file', 'compact']
+
+
+def write_files(directory, nb_trades):
+    """Write a GDAX and a Kraken file of nb_trades synthetic trades, and
+    return their paths.
+
+    Positional arguments:
+    directory -- The directory of the files
+    nb_trades -- The number of trades of each file
+    """
+    exchange = MockExchange(nb_trades=nb_trades, gdax_page_size=10000,
+                            kraken_page_size=10000, interval=0.0123)
+    gdax_path = os.path.join(directory, 'BTC-EUR.csv')
+    kraken_path = os.path.join(directory, 'XBTEUR.csv')
+
+    with CsvTradeWriter(gdax_path, dwnld.GDAX.COLUMNS,
+                        format_rows=dwnld.GDAX.format_trades) as writer:
+        for after in range(10001, nb_trades + 10001, 10000):
+            trades = exchange.gdax_trades(min(after, nb_trades + 1))
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+    with CsvTradeWriter(kraken_path, dwnld.Kraken.COLUMNS,
+                        format_rows=dwnld.Kraken.format_trades) as writer:
+        since = 0
+        while True:
+            answer = exchange.kraken_trades('XXBTZEUR', since)
+            trades = answer['result']['XXBTZEUR']
+            if not trades:
+                break
+
+            since = int(answer['result']['last'])
+            writer.write_columns(dwnld.Kraken.decode_trades(
+                trades, answer['result']['last']))
+
+    return gdax_path, kraken_path
+
+
+def measure(method, file_path):
+    """Load a file, and return (trades/sec, peak RSS increase in MiB).
+
+    Positional arguments:
+    method    -- One of METHODS
+    file_path -- The path of the CSV file
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+
+    if method == 'read_csv':
+        df = pd.read_csv(file_path, usecols=['time', 'price', 'size'],
+                         index_col='time', parse_dates=True)
+    else:
+        df = resample.load_file(file_path, compact=method == 'compact')
+
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in KiB on Linux
+    return len(df) / elapsed, (peak - rss) / 1024.
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=1000000,
+                        help='The number of trades of each file')
+    parser.add_argument('--measure', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        for broker, file_path in zip(['GDAX', 'Kraken'],
+                                     write_files(directory, args.trades)):
+            results = {}
+            for method in METHODS:
+                output = subprocess.check_output(
+                    [sys.executable, '-m', 'benchmarks.bench_load',
+                     '--measure', method, file_path])
+                results[method] = json.loads(output)
+
+                print('%-6s %-9s %9.0f trades/s (x%4.1f) - peak RSS: '
+                      '%6.1f MiB' %
+                      (broker, method, results[method][0],
+                       results[method][0] / results['read_csv'][0],
+                       results[method][1]))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
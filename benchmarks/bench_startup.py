@@ -0,0 +1,139 @@
+# coding: utf8
+
+"""Measure the startup of the download CLI, resuming a file from a local mock
+exchange.
+
+Each run is a new process running download_trades.main, which resumes a GDAX
+file after --new-trades trades were added to the mock exchange. Report the
+best of --repeat runs of:
+- python        : Running an empty Python program
+- import pandas : Running a program importing pandas only
+- first request : Time from the process start to the first request received
+                  by the mock exchange
+- resume        : Time from the process start to its exit, the new trades
+                  being written and checked
+
+and whether the download process imported pandas.
+
+Usage (from the root of the repository):
+$ python -m benchmarks.bench_startup [-h] [--trades N] [--new-trades N]
+                                     [--repeat N] [--json]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.mock_exchange import MockExchange
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src')
+
+# Program run by each process: download_trades.main resuming a GDAX file
+# from the mock exchange given as first argument, then printing whether
+# pandas was imported
+RESUME_PROGRAM = '''import json
+import sys
+sys.path.insert(0, %r)
+import download_trades
+download_trades.GDAX.BASE_URL = sys.argv[1]
+sys.argv = ['download_trades.py', 'GDAX', 'BTC-EUR', sys.argv[2], '-q']
+download_trades.main()
+print(json.dumps('pandas' in sys.modules))
+''' % SRC_DIR
+
+
+def run_program(program, *args):
+    """Run a Python program in a new process, and return (its elapsed time
+    in seconds, its output).
+
+    Positional arguments:
+    program -- The code of the program
+    args    -- The arguments of the program
+    """
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', program] +
+                                     list(args))
+
+    return time.time() - start, output
+
+
+def measure(exchange, output_dir, new_trades, repeat):
+    """Return a dictionnary with the best times (in seconds) of several
+    runs, and whether the download process imported pandas.
+
+    Positional arguments:
+    exchange   -- The running MockExchange
+    output_dir -- The output directory, with the GDAX file to resume
+    new_trades -- The number of trades added before each run
+    repeat     -- The number of runs
+    """
+    times = dict(python=[], import_pandas=[], first_request=[], resume=[])
+    pandas_imported = False
+
+    for _ in range(repeat):
+        times['python'].append(run_program('pass')[0])
+        times['import_pandas'].append(run_program('import pandas')[0])
+
+        exchange.nb_trades += new_trades
+        exchange.first_request = None
+        start = time.time()
+        elapsed, output = run_program(RESUME_PROGRAM, exchange.gdax_url,
+                                      output_dir)
+        times['resume'].append(elapsed)
+        times['first_request'].append(exchange.first_request - start)
+        pandas_imported |= json.loads(output.splitlines()[-1])
+
+    result = dict((name, min(values)) for name, values in times.items())
+    result['pandas_imported'] = pandas_imported
+
+    return result
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--trades', type=int, default=1000,
+                        help='Number of trades of the file to resume '
+                             '(default: 1000)')
+    parser.add_argument('--new-trades', type=int, default=100,
+                        help='Number of trades added before each run '
+                             '(default: 100)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs, the best one being kept '
+                             '(default: 5)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp()
+    try:
+        with MockExchange(nb_trades=args.trades,
+                          start=time.time() - args.trades) as exchange:
+            # Download the history once, so each run only resumes the file
+            run_program(RESUME_PROGRAM, exchange.gdax_url, output_dir)
+            result = measure(exchange, output_dir, args.new_trades,
+                             args.repeat)
+    finally:
+        shutil.rmtree(output_dir)
+
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return
+
+    for name, label in [('python', 'python'),
+                        ('import_pandas', 'import pandas'),
+                        ('first_request', 'first request'),
+                        ('resume', 'resume')]:
+        print('%-13s: %6.3fs' % (label, result[name]))
+    print('pandas imported by the download: ' +
+          ('yes' if result['pandas_imported'] else 'no'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+# coding: utf8
+
+"""Measure loading, resampling and checking synthetic trade files, and
+compare the results with a baseline.
+
+GDAX and Kraken files of synthetic trades are generated deterministically
+(the same seed gives the same bytes), at the requested numbers of rows. They
+are written in a data directory and reused by the next runs if it is kept
+(--data-dir).
+
+For each file, report rows/sec and peak RSS increase of:
+- load        : resample.load_file
+- resample-P  : resample.resample at period P, on the loaded trades
+- check       : check_file_consistency of the broker
+
+Each measure runs in its own process, so peak RSS are not mixed, and is
+repeated (--repeat) to keep its best rows/sec.
+
+With --save-baseline FILE, the results are saved as a baseline. With
+--baseline FILE, each result is compared with the baseline: a measure whose
+rows/sec dropped, or whose peak RSS grew, by more than --tolerance is a
+regression, and the exit status is 1.
+
+Usage (from the root of the repository):
+$ python -m benchmarks.bench_suite [-h] [--rows N [N ...]]
+                                   [--periods P [P ...]] [--data-dir DIR]
+                                   [--baseline FILE] [--save-baseline FILE]
+                                   [--tolerance RATIO] [--repeat N] [--json]
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import src.download_trades as dwnld
+import src.resample as resample
+from src.brokers.trade_writer import CsvTradeWriter
+
+
+BROKERS = dict(GDAX=dwnld.GDAX, Kraken=dwnld.Kraken)
+
+# Time of the first synthetic trade (2015-01-01, in micro-seconds)
+START_US = 1420070400 * 10**6
+
+# Mean time between two synthetic trades (in micro-seconds)
+MEAN_INTERVAL_US = 1e6
+
+# Number of rows generated at once
+GENERATE_ROWS = 100000
+
+# Peak RSS increases (in MiB) lower than this are not regressions
+RSS_SLACK_MIB = 16
+
+
+def generate_columns(random, first, nb_rows, time_us, price):
+    """Return (columns, last time, last price) of synthetic trades, as
+    returned by decode_trades of both brokers.
+
+    Positional arguments:
+    random  -- The numpy RandomState generating the trades
+    first   -- The number of the first trade (trade ID on GDAX)
+    nb_rows -- The number of trades
+    time_us -- The time of the previous trade (in micro-seconds)
+    price   -- The price of the previous trade
+    """
+    # Kraken times have 4 decimals, several trades could have the same one
+    times = time_us + np.cumsum(
+        random.exponential(MEAN_INTERVAL_US, nb_rows).astype(np.int64))
+    times -= times % 100
+    prices = np.maximum(0.01, np.round(
+        price * np.exp(np.cumsum(random.normal(0, 1e-4, nb_rows))), 2))
+    sizes = np.maximum(1e-8, np.round(random.exponential(0.5, nb_rows), 8))
+    sides = random.randint(0, 2, nb_rows).astype(np.uint8)
+
+    nanos = times * 1000
+    time_texts = [text + 'Z' for text in
+                  np.datetime_as_string(nanos.view('datetime64[ns]'),
+                                        unit='us').tolist()]
+    price_texts = ['%.1f' % value for value in prices.tolist()]
+    size_texts = ['%.8f' % value for value in sizes.tolist()]
+
+    columns = dict(trade_id=np.arange(first, first + nb_rows, dtype=np.int64),
+                   price=prices, size=sizes, side=sides,
+                   time=nanos.view('datetime64[ns]'),
+                   time_text=np.array(time_texts, dtype=object),
+                   timestamp=nanos,
+                   type=random.randint(0, 2, nb_rows).astype(np.uint8),
+                   price_text=np.array(price_texts, dtype=object),
+                   size_text=np.array(size_texts, dtype=object),
+                   misc=np.array([''] * nb_rows, dtype=object))
+
+    return columns, times[-1].item(), prices[-1].item()
+
+
+def write_trade_file(broker_name, file_path, nb_rows, seed=0):
+    """Write a CSV file of nb_rows synthetic trades of a broker.
+
+    Positional arguments:
+    broker_name -- 'GDAX' or 'Kraken'
+    file_path   -- The path of the file
+    nb_rows     -- The number of trades
+
+    Keyword arguments:
+    seed        -- The seed of the trades
+    """
+    broker = BROKERS[broker_name]
+    random = np.random.RandomState(seed)
+    time_us, price = START_US, 300.
+
+    temp_path = file_path + '.tmp'
+    with CsvTradeWriter(temp_path, broker.COLUMNS,
+                        format_rows=broker.format_trades) as writer:
+        for first in range(1, nb_rows + 1, GENERATE_ROWS):
+            columns, time_us, price = generate_columns(
+                random, first, min(GENERATE_ROWS, nb_rows + 1 - first),
+                time_us, price)
+            writer.write_columns(columns)
+
+    for suffix in ['', '.commit']:
+        os.rename(temp_path + suffix, file_path + suffix)
+
+
+def trade_file(data_dir, broker_name, nb_rows):
+    """Return the path of a synthetic trade file, generating it if needed.
+
+    Positional arguments:
+    data_dir    -- The data directory
+    broker_name -- 'GDAX' or 'Kraken'
+    nb_rows     -- The number of trades
+    """
+    file_path = os.path.join(data_dir, broker_name + '-' + str(nb_rows) +
+                             '.csv')
+
+    if not os.path.exists(file_path):
+        start = time.time()
+        write_trade_file(broker_name, file_path, nb_rows)
+        sys.stderr.write('Generated "' + file_path + '" in %.1fs\n' %
+                         (time.time() - start))
+
+    return file_path
+
+
+def measure(broker_name, task, file_path, repeat=1):
+    """Run a task on a file, and return (rows/sec, peak RSS increase in
+    MiB), rows/sec being the best of several runs.
+
+    Positional arguments:
+    broker_name -- 'GDAX' or 'Kraken'
+    task        -- 'load', 'resample-PERIOD' or 'check'
+    file_path   -- The path of the CSV file
+
+    Keyword arguments:
+    repeat      -- The number of runs
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if task.startswith('resample-'):
+        df = resample.load_file(file_path)
+        nb_rows = len(df)
+        run = functools.partial(resample.resample, df,
+                                task[len('resample-'):])
+    elif task == 'load':
+        run = functools.partial(resample.load_file, file_path)
+        nb_rows = len(run())
+    else:
+        run = functools.partial(
+            BROKERS[broker_name].check_file_consistency, file_path)
+        assert not run()
+        with open(file_path, 'rb') as csv_file:
+            nb_rows = sum(1 for _ in csv_file) - 1
+
+    elapsed = []
+    for _ in range(repeat):
+        start = time.time()
+        run()
+        elapsed.append(time.time() - start)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in KiB on Linux
+    return nb_rows / min(elapsed), (peak - rss) / 1024.
+
+
+def compare(result, base, tolerance):
+    """Return a list of the regressions of a result (empty if none).
+
+    Positional arguments:
+    result    -- A dictionnary with 'rows_per_sec' and 'peak_rss_mib' keys
+    base      -- The same measure in the baseline
+    tolerance -- The allowed ratio of slowdown or of RSS growth
+    """
+    regressions = []
+
+    if result['rows_per_sec'] < base['rows_per_sec'] * (1 - tolerance):
+        regressions.append('rows/sec x%.2f' %
+                           (result['rows_per_sec'] / base['rows_per_sec']))
+
+    if (result['peak_rss_mib'] > base['peak_rss_mib'] * (1 + tolerance) and
+            result['peak_rss_mib'] > base['peak_rss_mib'] + RSS_SLACK_MIB):
+        regressions.append('peak RSS +%.1f MiB' %
+                           (result['peak_rss_mib'] - base['peak_rss_mib']))
+
+    return regressions
+
+
+def main():
+    """The main function."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000],
+                        help='Numbers of rows of the files (default: '
+                             '1000000, others: 10000000 100000000)')
+    parser.add_argument('--brokers', nargs='+', default=sorted(BROKERS),
+                        choices=sorted(BROKERS),
+                        help='Brokers of the files (default: all)')
+    parser.add_argument('--periods', nargs='+', default=['1T', '1H', '1D'],
+                        help='Resampling periods (default: 1T 1H 1D)')
+    parser.add_argument('--data-dir',
+                        help='Directory of the generated files, kept for '
+                             'the next runs (default: a temporary one)')
+    parser.add_argument('--baseline',
+                        help='Compare the results with this baseline')
+    parser.add_argument('--save-baseline',
+                        help='Save the results as a baseline in this file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed ratio of slowdown or of peak RSS '
+                             'growth (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each measure, the best one '
+                             'being kept (default: 3)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure, repeat=args.repeat)))
+        return
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    data_dir = args.data_dir or tempfile.mkdtemp()
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    tasks = ['load'] + ['resample-' + period for period in args.periods] + \
+        ['check']
+    results = {}
+    nb_regressions = 0
+
+    try:
+        for nb_rows in args.rows:
+            for broker_name in args.brokers:
+                file_path = trade_file(data_dir, broker_name, nb_rows)
+
+                for task in tasks:
+                    output = subprocess.check_output(
+                        [sys.executable, '-m', 'benchmarks.bench_suite',
+                         '--measure', broker_name, task, file_path,
+                         '--repeat', str(args.repeat)])
+                    rows_per_sec, peak_rss = json.loads(output)
+
+                    key = ' '.join([broker_name, str(nb_rows), task])
+                    result = results[key] = dict(rows_per_sec=rows_per_sec,
+                                                 peak_rss_mib=peak_rss)
+
+                    regressions = (compare(result, baseline[key],
+                                           args.tolerance)
+                                   if key in baseline else [])
+                    nb_regressions += bool(regressions)
+
+                    if args.json:
+                        continue
+
+                    if key not in baseline:
+                        status = '' if not baseline else ' - not in baseline'
+                    elif regressions:
+                        status = ' - REGRESSION: ' + ', '.join(regressions)
+                    else:
+                        status = ' - ok (x%.2f)' % (
+                            rows_per_sec / baseline[key]['rows_per_sec'])
+
+                    print('%-6s %10d %-13s %10.0f rows/s - peak RSS: '
+                          '%7.1f MiB%s' % (broker_name, nb_rows, task,
+                                           rows_per_sec, peak_rss, status))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if nb_regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# coding: utf8
+
+"""Compare the trades/sec of the CSV trade writer with the pandas path.
+
+Usage (from the root of the repository):
+$ python -m benchmarks.bench_writer [NB_PAGES]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from tests.test_trade_writer import (gdax_pages, kraken_pages,
+                                     write_gdax_with_pandas,
+                                     write_kraken_with_pandas)
+import src.download_trades as dwnld
+from src.brokers.trade_writer import CsvTradeWriter
+
+
+def write_gdax_with_writer(pages, file_path):
+    """Decode GDAX pages and write them with the CSV trade writer."""
+    with CsvTradeWriter(file_path, dwnld.GDAX.COLUMNS,
+                        format_rows=dwnld.GDAX.format_trades) as writer:
+        for trades in pages:
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+
+def write_kraken_with_writer(pages, file_path):
+    """Decode Kraken pages and write them with the CSV trade writer."""
+    with CsvTradeWriter(file_path, dwnld.Kraken.COLUMNS,
+                        format_rows=dwnld.Kraken.format_trades) as writer:
+        for trades, next_timestamp in pages:
+            writer.write_columns(dwnld.Kraken.decode_trades(trades,
+                                                            next_timestamp))
+
+
+def measure(write, pages, nb_trades, file_path):
+    """Return the trades/sec of write on pages and the written bytes."""
+    start = time.time()
+    write(pages, file_path)
+    elapsed = time.time() - start
+
+    with open(file_path, 'rb') as output:
+        content = output.read()
+
+    os.remove(file_path)
+    return nb_trades / elapsed, content
+
+
+def main():
+    """The main function."""
+    nb_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    directory = tempfile.mkdtemp()
+
+    try:
+        benchmarks = [
+            ('GDAX', gdax_pages(nb_pages), write_gdax_with_pandas,
+             write_gdax_with_writer),
+            ('Kraken', kraken_pages(nb_pages), write_kraken_with_pandas,
+             write_kraken_with_writer)]
+
+        for broker, pages, with_pandas, with_writer in benchmarks:
+            nb_trades = sum(len(page[0] if broker == 'Kraken' else page)
+                            for page in pages)
+            file_path = os.path.join(directory, broker + '.csv')
+
+            before, expected = measure(with_pandas, pages, nb_trades,
+                                       file_path)
+            after, content = measure(with_writer, pages, nb_trades,
+                                     file_path)
+
+            print('%-6s %9d trades - pandas: %9.0f trades/s - writer: '
+                  '%9.0f trades/s (x%.1f) - identical output: %s' %
+                  (broker, nb_trades, before, after, after / before,
+                   content == expected))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+# coding: utf8
+
+"""Download trades of several pairs, from several brokers, in one process.
+
+Pairs are downloaded concurrently by a pool of threads. Pairs of the same
+broker share its rate limiter, so the rate budget of each broker is respected
+whatever the number of threads. Pairs the most behind (no trade yet, or the
+oldest last trade) are downloaded first.
+"""
+
+import fnmatch
+import os
+import Queue
+import sys
+import threading
+import time
+
+from .gdax import GDAX
+from .kraken import Kraken
+from .storage import SUFFIXES
+
+
+# Brokers, by name
+BROKERS = dict(GDAX=GDAX, Kraken=Kraken)
+
+# Default number of pairs downloaded at the same time
+DEFAULT_JOBS = 4
+
+
+def select_pairs(broker_patterns, pair_patterns, brokers=None):
+    """Return the sorted list of (broker name, pair) tuples matching the
+    patterns.
+
+    Patterns are shell-style wildcards (for example 'BTC-*' or '*EUR').
+
+    Positional arguments:
+    broker_patterns -- A list of patterns of broker names
+    pair_patterns   -- A list of patterns of pairs
+
+    Keyword arguments:
+    brokers         -- A dictionnary of brokers, by name (default: BROKERS)
+
+    Raise ValueError if a pattern matches nothing.
+    """
+    brokers = BROKERS if brokers is None else brokers
+
+    broker_names = set()
+    for pattern in broker_patterns:
+        names = fnmatch.filter(sorted(brokers), pattern)
+        if not names:
+            raise ValueError('broker should be one of: ' +
+                             ', '.join(sorted(brokers)))
+
+        broker_names.update(names)
+
+    selected = set()
+    for pattern in pair_patterns:
+        matches = [(name, pair) for name in broker_names
+                   for pair in fnmatch.filter(brokers[name].ALLOWED_PAIRS,
+                                              pattern)]
+        if not matches:
+            raise ValueError('For the broker ' +
+                             ', '.join(sorted(broker_names)) +
+                             ', pair should be one of: ' +
+                             ', '.join(pair for name in sorted(broker_names)
+                                       for pair in
+                                       brokers[name].ALLOWED_PAIRS))
+
+        selected.update(matches)
+
+    return sorted(selected)
+
+
+def output_file(output_dir, broker_name, pair, storage='csv'):
+    """Return the path of the trade file of a pair, creating its directory if
+    needed.
+
+    Positional arguments:
+    output_dir  -- The output directory
+    broker_name -- The name of the broker
+    pair        -- The pair
+
+    Keyword arguments:
+    storage     -- The storage backend (a key of storage.SUFFIXES)
+    """
+    directory = os.path.join(output_dir, broker_name)
+
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # The directory already exists. Do nothing special.
+        pass
+
+    return os.path.join(directory, pair + SUFFIXES[storage])
+
+
+def download_pair(broker, file_path, pair, workers=1, full_check=False,
+                  repair=False):
+    """Download the missing trades of a pair.
+
+    Positional arguments:
+    broker     -- The broker
+    file_path  -- The file where trades should be written
+    pair       -- The pair to trade
+
+    Keyword arguments:
+    workers    -- The number of pages (GDAX) or time shards (Kraken) fetched
+                  at the same time
+    full_check -- If True, check the whole file before downloading
+    repair     -- If True, repair an inconsistent CSV file instead of exiting
+    """
+    broker.download_missing_trades(file_path, pair, workers=workers,
+                                   full_check=full_check, repair=repair)
+
+
+def get_lag(broker, file_path, now=None):
+    """Return how far behind (in seconds) the trade file of a pair is, None
+    if it contains no trade yet.
+
+    Positional arguments:
+    broker    -- The broker
+    file_path -- The trade file
+
+    Keyword arguments:
+    now       -- The current time (default: time.time())
+    """
+    last_time = broker.get_last_trade_time_of_file(file_path)
+    if last_time is None:
+        return None
+
+    now = time.time() if now is None else now
+    return max(0., now - last_time)
+
+
+def format_lag(lag):
+    """Return a human readable lag, like '2d 03:04:05'.
+
+    Positional arguments:
+    lag -- The lag in seconds, or None
+    """
+    if lag is None:
+        return 'no trade'
+
+    minutes, seconds = divmod(int(lag), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+
+    text = '%02d:%02d:%02d' % (hours, minutes, seconds)
+    return str(days) + 'd ' + text if days else text
+
+
+class PairResult(object):
+    """Represents the result of the download of a pair."""
+
+    def __init__(self, broker_name, pair, file_path, lag_before):
+        """Create the result, before the download.
+
+        Positional arguments:
+        broker_name -- The name of the broker
+        pair        -- The pair
+        file_path   -- The trade file
+        lag_before  -- The lag of the file before the download
+        """
+        self.broker_name = broker_name
+        self.pair = pair
+        self.file_path = file_path
+        self.lag_before = lag_before
+        self.lag_after = None
+        self.duration = 0.
+        self.status = 'not started'
+
+
+def _download(broker, result, workers, full_check, repair):
+    """Download a pair and fill its result.
+
+    Positional arguments:
+    broker     -- The broker
+    result     -- The PairResult of the pair
+    workers    -- The number of pages (GDAX) or time shards (Kraken) fetched
+                  at the same time
+    full_check -- If True, check the whole file before downloading
+    repair     -- If True, repair an inconsistent CSV file instead of skipping
+                  the pair
+    """
+    start = time.time()
+
+    try:
+        download_pair(broker, result.file_path, result.pair, workers=workers,
+                      full_check=full_check, repair=repair)
+
+        issues = broker.check_file_ranges(result.file_path)
+        result.status = ('OK' if not issues else
+                         str(len(issues)) + ' issue(s)')
+    except SystemExit:
+        # The file was inconsistent before the download
+        result.status = 'inconsistent file'
+    except Exception as exception:
+        result.status = 'error: ' + str(exception)
+
+    result.duration = time.time() - start
+    result.lag_after = get_lag(broker, result.file_path)
+
+
+def download_batch(jobs, output_dir, storage='csv', nb_jobs=DEFAULT_JOBS,
+                   workers=1, full_check=False, repair=False, brokers=None):
+    """Download the missing trades of several pairs and return the list of
+    their PairResult, the most behind pair first.
+
+    Positional arguments:
+    jobs       -- A list of (broker name, pair) tuples
+    output_dir -- The output directory
+
+    Keyword arguments:
+    storage    -- The storage backend ('csv' or 'columnar')
+    nb_jobs    -- The number of pairs downloaded at the same time
+    workers    -- The number of pages (GDAX) or time shards (Kraken) fetched
+                  at the same time, per pair
+    full_check -- If True, check the whole files before downloading
+    repair     -- If True, repair inconsistent CSV files instead of skipping
+                  their pair
+    brokers    -- A dictionnary of brokers, by name (default: BROKERS)
+    """
+    brokers = BROKERS if brokers is None else brokers
+
+    results = []
+    for broker_name, pair in jobs:
+        broker = brokers[broker_name]
+        file_path = output_file(output_dir, broker_name, pair, storage)
+        results.append(PairResult(broker_name, pair, file_path,
+                                  get_lag(broker, file_path)))
+
+    # Pairs without trade first, then the oldest last trade first
+    results.sort(key=lambda result: (result.lag_before is not None,
+                                     -(result.lag_before or 0)))
+
+    pending = Queue.Queue()
+    for result in results:
+        pending.put(result)
+
+    def work():
+        """Download pairs until there is no pending pair left."""
+        while True:
+            try:
+                result = pending.get_nowait()
+            except Queue.Empty:
+                return
+
+            _download(brokers[result.broker_name], result, workers,
+                      full_check, repair)
+
+    threads = [threading.Thread(target=work)
+               for _ in range(min(nb_jobs, len(results)))]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # Join with a timeout, so KeyboardInterrupt is still caught
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.1)
+
+    return results
+
+
+def print_summary(results, out=sys.stdout):
+    """Print a table summarizing the download of each pair.
+
+    Positional arguments:
+    results -- A list of PairResult
+
+    Keyword arguments:
+    out     -- The file where the table is printed
+    """
+    lines = [('Broker', 'Pair', 'Behind before', 'Behind after', 'Duration',
+              'Status')]
+    lines.extend((result.broker_name, result.pair,
+                  format_lag(result.lag_before), format_lag(result.lag_after),
+                  '%.1fs' % result.duration, result.status)
+                 for result in results)
+
+    widths = [max(len(line[index]) for line in lines)
+              for index in range(len(lines[0]) - 1)]
+
+    for line in lines:
+        cells = [cell.ljust(width) for cell, width in zip(line, widths)]
+        out.write('  '.join(cells + [line[-1]]) + '\n')
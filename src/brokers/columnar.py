@@ -0,0 +1,370 @@
+# coding: utf8
+
+"""Store trades as typed columns, partitioned by UTC day.
+
+A store is a directory with the following layout:
+PAIR.columns/
+    schema.json
+    2015-04-23/
+        trade_id.bin
+        price.bin
+        ...
+    2015-04-24/
+        ...
+
+Each column of each partition is a raw little-endian array, which could be
+read with numpy.fromfile or memory-mapped with numpy.memmap. Categorical
+columns (like 'side') are stored as uint8 codes, their categories being
+listed in 'schema.json'.
+
+A trade goes to the partition of its UTC day, or to the last partition if it
+is older, so the store is append-only: the last trade of the store is always
+the last row of the last partition.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+_SCHEMA_FILE = 'schema.json'
+
+
+class ColumnarStore(object):
+    """Represents a columnar store of trades."""
+
+    def __init__(self, directory, schema=None):
+        """Open the store, creating it if needed.
+
+        Positional arguments:
+        directory -- The directory of the store
+
+        Keyword arguments:
+        schema    -- The list of columns, required to create the store. A
+                     column is a dictionnary with the following keys:
+                     - name      : The name of the column
+                     - dtype     : The numpy dtype of the column
+                     - categories: (Optional) The list of values of a
+                                   categorical column
+                     - tz        : (Optional) The timezone of a datetime
+                                   column
+                     The first datetime column is used to partition trades.
+
+        Raise IOError if the store does not exist and no schema is given.
+        """
+        self.directory = directory
+        schema_path = os.path.join(directory, _SCHEMA_FILE)
+
+        if os.path.isfile(schema_path):
+            with open(schema_path, 'r') as schema_file:
+                self.schema = json.load(schema_file)
+        elif schema is not None:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            with open(schema_path, 'w') as schema_file:
+                json.dump(schema, schema_file, indent=2)
+
+            self.schema = schema
+        else:
+            raise IOError('No columnar store in ' + directory)
+
+        self.columns = [column['name'] for column in self.schema]
+        self.time_column = [column['name'] for column in self.schema
+                            if column['dtype'].startswith('datetime64')][0]
+
+    def _column(self, name):
+        """Return the schema of a column.
+
+        Positional arguments:
+        name -- The name of the column
+        """
+        return self.schema[self.columns.index(name)]
+
+    def _path(self, partition, name):
+        """Return the path of a column file.
+
+        Positional arguments:
+        partition -- The partition (a day formatted as YYYY-MM-DD)
+        name      -- The name of the column
+        """
+        return os.path.join(self.directory, partition, name + '.bin')
+
+    def _nb_rows(self, partition, name):
+        """Return the number of rows in a column file.
+
+        Positional arguments:
+        partition -- The partition (a day formatted as YYYY-MM-DD)
+        name      -- The name of the column
+        """
+        try:
+            size = os.path.getsize(self._path(partition, name))
+        except OSError:
+            return 0
+
+        return size // np.dtype(self._column(name)['dtype']).itemsize
+
+    def repair_last_partition(self):
+        """Truncate columns of the last partition to the same length.
+
+        Columns could have different lengths if a previous append was
+        interrupted, or if an append is in progress: only a writer should
+        repair the store, readers only read the complete rows (see nb_rows).
+        """
+        partitions = self.partitions()
+        if not partitions:
+            return
+
+        partition = partitions[-1]
+        nb_rows = self.nb_rows(partition)
+
+        for name in self.columns:
+            itemsize = np.dtype(self._column(name)['dtype']).itemsize
+            with open(self._path(partition, name), 'ab') as column_file:
+                column_file.truncate(nb_rows * itemsize)
+
+    def partitions(self):
+        """Return the sorted list of partitions (days as YYYY-MM-DD)."""
+        return sorted(entry for entry in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, entry)))
+
+    def nb_rows(self, partition):
+        """Return the number of complete rows of a partition.
+
+        Positional arguments:
+        partition -- The partition (a day formatted as YYYY-MM-DD)
+        """
+        return min(self._nb_rows(partition, name) for name in self.columns)
+
+    def read_column(self, name, partitions=None):
+        """Return a column as a numpy array.
+
+        Positional arguments:
+        name       -- The name of the column
+
+        Keyword arguments:
+        partitions -- The list of partitions to read (default: all)
+        """
+        dtype = self._column(name)['dtype']
+        partitions = self.partitions() if partitions is None else partitions
+        arrays = [np.fromfile(self._path(partition, name), dtype=dtype,
+                              count=self.nb_rows(partition))
+                  for partition in partitions]
+
+        if not arrays:
+            return np.array([], dtype=dtype)
+
+        return np.concatenate(arrays)
+
+    def read(self, columns=None, start=None, end=None):
+        """Return a dictionnary of numpy arrays, one per column.
+
+        Only the files of the asked columns and days are read. Categorical
+        columns are returned as codes: use 'categories' to decode them.
+
+        Keyword arguments:
+        columns -- The list of columns to read (default: all)
+        start   -- The first day to read, formatted as YYYY-MM-DD
+        end     -- The last day to read, formatted as YYYY-MM-DD
+        """
+        columns = self.columns if columns is None else columns
+        partitions = [partition for partition in self.partitions()
+                      if (start is None or partition >= start) and
+                      (end is None or partition <= end)]
+
+        return dict((name, self.read_column(name, partitions))
+                    for name in columns)
+
+    def categories(self, name):
+        """Return the categories of a categorical column.
+
+        Positional arguments:
+        name -- The name of the column
+        """
+        return self._column(name).get('categories')
+
+    def timezone(self, name):
+        """Return the timezone of a datetime column (None if naive).
+
+        Positional arguments:
+        name -- The name of the column
+        """
+        return self._column(name).get('tz')
+
+    def last_row(self):
+        """Return the last row as a dictionnary, or None if the store is
+        empty.
+
+        Only the last item of each column file is read.
+        """
+        partitions = [partition for partition in self.partitions()
+                      if self.nb_rows(partition)]
+        if not partitions:
+            return None
+
+        partition = partitions[-1]
+        nb_rows = self.nb_rows(partition)
+
+        row = {}
+        for name in self.columns:
+            dtype = np.dtype(self._column(name)['dtype'])
+            with open(self._path(partition, name), 'rb') as column_file:
+                column_file.seek((nb_rows - 1) * dtype.itemsize)
+                value = np.frombuffer(column_file.read(dtype.itemsize),
+                                      dtype=dtype)[0]
+
+            categories = self.categories(name)
+            row[name] = categories[value] if categories else value.item()
+
+        return row
+
+    def append(self, columns):
+        """Append rows to the store.
+
+        Positional arguments:
+        columns -- A dictionnary of numpy arrays (with the dtypes of the
+                   schema), one per column
+        """
+        days = columns[self.time_column].astype('datetime64[D]')
+
+        # Never write a trade in a partition older than the one of the
+        # previous trade, so the store keeps the order of the trades
+        partitions = self.partitions()
+        if partitions:
+            days = np.maximum(days, np.datetime64(partitions[-1], 'D'))
+
+        days = np.maximum.accumulate(days.astype('int64'))
+        days = np.datetime_as_string(days.astype('datetime64[D]'))
+
+        for day in np.unique(days):
+            mask = days == day
+            directory = os.path.join(self.directory, day)
+
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            for name in self.columns:
+                with open(self._path(day, name), 'ab') as column_file:
+                    column_file.write(columns[name][mask].tobytes())
+
+
+class ColumnarTradeWriter(object):
+    """Append trades to a columnar store by large batches.
+
+    It has the same interface as CsvTradeWriter, so brokers could write to
+    both with the same CSV-formatted rows, or the same typed columns. Typed
+    columns are appended without being formatted.
+    """
+
+    def __init__(self, directory, header, schema, flush_rows=100000):
+        """Open the store, creating it if needed, and truncate the columns
+        left by an interrupted append.
+
+        Positional arguments:
+        directory  -- The directory of the store
+        header     -- The list of column names of the rows. Columns which
+                      are not in the schema are dropped.
+        schema     -- The list of columns (see ColumnarStore)
+
+        Keyword arguments:
+        flush_rows -- The number of rows kept in memory before being written
+        """
+        self.store = ColumnarStore(directory, schema)
+        self.store.repair_last_partition()
+        self.header = header
+        self.flush_rows = flush_rows
+        self.rows = []
+        self.batches = []
+        self.nb_rows = 0
+
+    def write_rows(self, rows):
+        """Write rows, flushing them if needed.
+
+        Positional arguments:
+        rows -- An iterable on rows. A row is a sequence of strings, in the
+                order of the header.
+        """
+        self.rows.extend(rows)
+
+        if self.nb_rows + len(self.rows) >= self.flush_rows:
+            self.flush()
+
+    def write_columns(self, columns):
+        """Write trades given as typed columns, flushing them if needed.
+
+        Positional arguments:
+        columns -- A dictionnary of arrays, with at least the columns of the
+                   schema. Arrays are converted to the dtypes of the schema.
+        """
+        # Keep the order of the rows written before
+        self._convert_rows()
+
+        batch = dict((column['name'],
+                      np.asarray(columns[column['name']]).astype(
+                          column['dtype']))
+                     for column in self.store.schema)
+
+        self.batches.append(batch)
+        self.nb_rows += len(batch[self.store.time_column])
+
+        if self.nb_rows >= self.flush_rows:
+            self.flush()
+
+    def _convert_rows(self):
+        """Convert the pending rows to a batch of typed columns."""
+        if not self.rows:
+            return
+
+        values = zip(*self.rows)
+        columns = {}
+
+        for column in self.store.schema:
+            column_values = values[self.header.index(column['name'])]
+            categories = column.get('categories')
+
+            if categories:
+                codes = dict((category, code)
+                             for code, category in enumerate(categories))
+                array = np.array([codes[value] for value in column_values],
+                                 dtype=column['dtype'])
+            elif column['dtype'].startswith('datetime64'):
+                # Remove the UTC suffix of GDAX times
+                array = np.array([value.rstrip('Z')
+                                  for value in column_values],
+                                 dtype=column['dtype'])
+            else:
+                array = np.array(column_values).astype(column['dtype'])
+
+            columns[column['name']] = array
+
+        self.batches.append(columns)
+        self.nb_rows += len(self.rows)
+        self.rows = []
+
+    def flush(self):
+        """Append the rows and typed columns to the store."""
+        self._convert_rows()
+
+        if not self.batches:
+            return
+
+        columns = dict((name, np.concatenate([batch[name]
+                                              for batch in self.batches]))
+                       for name in self.store.columns)
+
+        self.store.append(columns)
+        self.batches = []
+        self.nb_rows = 0
+
+    def close(self):
+        """Flush the rows."""
+        self.flush()
+
+    def __enter__(self):
+        """Return the writer itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the writer."""
+        self.close()
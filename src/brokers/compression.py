@@ -0,0 +1,311 @@
+# coding: utf8
+
+"""Compress CSV trade files by independent frames.
+
+A compressed trade file (PAIR.csv.gz or PAIR.csv.zst) is a sequence of
+frames, each one compressed independently: gzip members, or zstd frames. It
+is still a valid gzip (or zstd) file, readable by the usual tools, it could
+be appended without being decompressed, and its last trade could be read by
+decompressing only its last frame.
+
+zstd needs the zstandard package.
+"""
+
+import io
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Codec of compressed files, by suffix
+CODECS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# Compression level of each codec
+LEVELS = dict(gzip=6, zstd=3)
+
+# Magic number starting each frame
+_MAGICS = dict(gzip='\x1f\x8b\x08', zstd='\x28\xb5\x2f\xfd')
+
+# Errors raised on invalid or truncated frames
+_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Size (in bytes) of the blocks read from a compressed file
+_BLOCK_BYTES = 64 << 10
+
+# Window bits of zlib for the gzip format
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def codec_of(file_path):
+    """Return the codec of a trade file ('gzip' or 'zstd'), None if it is
+    not compressed.
+
+    Positional arguments:
+    file_path -- The path of the trade file
+    """
+    for suffix, codec in CODECS.items():
+        if file_path.endswith(suffix):
+            return codec
+
+    return None
+
+
+def _zstandard():
+    """Return the zstandard module.
+
+    Raise ImportError if it is not installed.
+    """
+    if zstandard is None:
+        raise ImportError('The zstandard package is needed for .zst files')
+
+    return zstandard
+
+
+def compress_frame(data, codec):
+    """Return data compressed as a single frame.
+
+    Positional arguments:
+    data  -- The bytes to compress
+    codec -- 'gzip' or 'zstd'
+    """
+    if codec == 'gzip':
+        compressor = zlib.compressobj(LEVELS['gzip'], zlib.DEFLATED,
+                                      _GZIP_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    return _zstandard().ZstdCompressor(level=LEVELS['zstd']).compress(data)
+
+
+def _decompressobj(codec):
+    """Return a decompressor of a single frame.
+
+    Once the frame is decompressed, following bytes are kept in its
+    'unused_data' attribute.
+
+    Positional arguments:
+    codec -- 'gzip' or 'zstd'
+    """
+    if codec == 'gzip':
+        return zlib.decompressobj(_GZIP_WBITS)
+
+    return _zstandard().ZstdDecompressor().decompressobj()
+
+
+def decompress_frame(data, codec):
+    """Return (decompressed bytes, size of the frame) for the frame starting
+    data.
+
+    Raise ValueError if data does not start with a complete frame.
+
+    Positional arguments:
+    data  -- The bytes starting with the frame
+    codec -- 'gzip' or 'zstd'
+    """
+    decompressor = _decompressobj(codec)
+
+    try:
+        output = decompressor.decompress(data)
+        unused = decompressor.unused_data
+
+        # Without following bytes, only a complete frame is decompressed
+        # without error at once
+        if not unused:
+            if codec == 'gzip':
+                zlib.decompress(data, _GZIP_WBITS)
+            else:
+                _zstandard().ZstdDecompressor().decompress(data)
+    except _ERRORS:
+        raise ValueError('Invalid or truncated ' + codec + ' frame')
+
+    return output, len(data) - len(unused)
+
+
+def find_last_frame(binary_file, size, codec):
+    """Return (start, end, decompressed bytes) of the last complete frame of
+    a compressed file, None if there is none.
+
+    The file is read backward by blocks, looking for the magic number of the
+    codec, so only its tail is read. Bytes after the returned frame, if any,
+    are a partially written frame.
+
+    Positional arguments:
+    binary_file -- The file, opened in binary mode
+    size        -- The size of the file
+    codec       -- 'gzip' or 'zstd'
+    """
+    magic = _MAGICS[codec]
+    tail = ''
+    tail_start = size
+    index = None
+
+    while tail_start > 0:
+        block_start = max(0, tail_start - _BLOCK_BYTES)
+        binary_file.seek(block_start)
+        tail = binary_file.read(tail_start - block_start) + tail
+
+        if index is not None:
+            index += tail_start - block_start
+
+        tail_start = block_start
+
+        while True:
+            # Candidates before the last tried one
+            end = len(tail) if index is None else index + len(magic) - 1
+            candidate = tail.rfind(magic, 0, end)
+
+            if candidate < 0:
+                break
+
+            index = candidate
+
+            try:
+                output, frame_size = decompress_frame(tail[index:], codec)
+            except ValueError:
+                continue
+
+            start = tail_start + index
+            return start, start + frame_size, output
+
+        if index is None:
+            # No candidate found in the whole tail, but the magic number
+            # could span the next block
+            index = len(tail)
+
+    return None
+
+
+class _DecompressedFile(io.RawIOBase):
+    """Read a compressed file as a stream of decompressed bytes.
+
+    Frames are decompressed one block at a time. Seeking forward skips
+    decompressed bytes, seeking backward decompresses again from the start.
+    """
+
+    def __init__(self, file_path, codec):
+        """Open the file.
+
+        Positional arguments:
+        file_path -- The compressed file
+        codec     -- 'gzip' or 'zstd'
+        """
+        io.RawIOBase.__init__(self)
+        self.file_path = file_path
+        self.codec = codec
+        self.file = None
+        self._rewind()
+
+    def _rewind(self):
+        """Go back to the start of the file."""
+        if self.file is not None:
+            self.file.close()
+
+        self.file = open(self.file_path, 'rb')
+        self.decompressor = _decompressobj(self.codec)
+        self.pending = ''
+        self.pending_offset = 0
+        self.position = 0
+
+    def _fill(self):
+        """Decompress the next block, and return False at the end of the
+        file."""
+        while self.pending_offset == len(self.pending):
+            data = self.file.read(_BLOCK_BYTES)
+            if not data:
+                return False
+
+            output = []
+            while data:
+                output.append(self.decompressor.decompress(data))
+                data = self.decompressor.unused_data
+
+                # The next frame starts
+                if data:
+                    self.decompressor = _decompressobj(self.codec)
+
+            self.pending = ''.join(output)
+            self.pending_offset = 0
+
+        return True
+
+    def readable(self):
+        """Return True."""
+        return True
+
+    def readinto(self, buffer):
+        """Read decompressed bytes into buffer and return their number.
+
+        Positional arguments:
+        buffer -- A writable buffer
+        """
+        if not self._fill():
+            return 0
+
+        size = min(len(buffer), len(self.pending) - self.pending_offset)
+        buffer[:size] = self.pending[self.pending_offset:
+                                     self.pending_offset + size]
+
+        self.pending_offset += size
+        self.position += size
+        return size
+
+    def seekable(self):
+        """Return True."""
+        return True
+
+    def tell(self):
+        """Return the position in the decompressed stream."""
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move to a position in the decompressed stream, and return it.
+
+        Positional arguments:
+        offset -- The position
+
+        Keyword arguments:
+        whence -- io.SEEK_SET or io.SEEK_CUR (the size of the decompressed
+                  stream is unknown)
+        """
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence != io.SEEK_SET:
+            raise IOError('Seeking from the end of a compressed file is not '
+                          'supported')
+
+        if offset < self.position:
+            self._rewind()
+
+        while self.position < offset and self._fill():
+            size = min(offset - self.position,
+                       len(self.pending) - self.pending_offset)
+            self.pending_offset += size
+            self.position += size
+
+        return self.position
+
+    def close(self):
+        """Close the file."""
+        if self.file is not None:
+            self.file.close()
+
+        io.RawIOBase.close(self)
+
+
+def open_trade_file(file_path):
+    """Open a trade file for reading, in binary mode, decompressing it on
+    the fly if it is compressed.
+
+    Positional arguments:
+    file_path -- The path of the trade file
+
+    Raise IOError if the file does not exist.
+    """
+    codec = codec_of(file_path)
+    if codec is None:
+        return open(file_path, 'rb')
+
+    return io.BufferedReader(_DecompressedFile(file_path, codec),
+                             buffer_size=_BLOCK_BYTES)
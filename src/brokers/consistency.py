@@ -0,0 +1,303 @@
+# coding: utf8
+
+"""Check the consistency of a CSV trade file, chunk by chunk.
+
+The result of a check is saved in a checkpoint file (FILE.check) next to the
+checked file. It records the offset of the last verified line, the value of
+its key column and a hash of the bytes before this offset. The next check
+then only verifies the lines appended since, unless the file was modified
+before the checkpoint.
+
+Compressed files are decompressed on the fly, and always checked entirely:
+their checkpoint would have to be found by decompressing the file anyway.
+
+A range of keys could also be checked alone: the sparse index of the file
+(see offset_index) gives the bytes to read.
+"""
+
+import io
+import json
+import os
+
+import numpy as np
+
+from .compression import codec_of, open_trade_file
+from .offset_index import find_range, load_index
+from .trade_writer import hash_before
+
+
+# Suffix of the checkpoint file
+CHECKPOINT_SUFFIX = '.check'
+
+# Default size (in bytes) of the chunks read from the file
+DEFAULT_CHUNK_BYTES = 16 << 20
+
+# Chunks smaller than this (in bytes) are parsed without pandas: importing
+# pandas takes longer than parsing the trades appended since the last check
+PANDAS_MIN_BYTES = 4 << 20
+
+
+def read_checkpoint(file_path):
+    """Return the checkpoint of file_path as a dictionnary, None if there is
+    no valid checkpoint.
+
+    A checkpoint is valid only if the file still contains the bytes it was
+    computed on.
+
+    Positional arguments:
+    file_path -- The checked file
+    """
+    try:
+        with open(file_path + CHECKPOINT_SUFFIX, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+        with open(file_path, 'rb') as csv_file:
+            csv_file.seek(0, os.SEEK_END)
+            if csv_file.tell() < checkpoint['offset']:
+                return None
+
+            if hash_before(csv_file, checkpoint['offset']) != \
+                    checkpoint['hash']:
+                return None
+    except (IOError, ValueError, KeyError):
+        return None
+
+    return checkpoint
+
+
+def write_checkpoint(file_path, offset, last):
+    """Write the checkpoint of file_path.
+
+    The checkpoint is written in a temporary file first, then renamed, so it
+    is never partially written.
+
+    Positional arguments:
+    file_path -- The checked file
+    offset    -- The offset of the end of the last verified line
+    last      -- The key value of the last verified line
+    """
+    with open(file_path, 'rb') as csv_file:
+        checkpoint = dict(offset=offset, last=last,
+                          hash=hash_before(csv_file, offset))
+
+    temp_path = file_path + CHECKPOINT_SUFFIX + '.tmp'
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+
+    os.rename(temp_path, file_path + CHECKPOINT_SUFFIX)
+
+
+def parse_keys(block, index):
+    """Return the values of a column of CSV lines, as a numpy int64 array.
+
+    Large blocks are parsed by pandas, imported only then, small ones in
+    Python.
+
+    Positional arguments:
+    block -- The CSV lines, without header
+    index -- The index of the column (integers)
+    """
+    if len(block) < PANDAS_MIN_BYTES:
+        return np.array([line.split(',', index + 1)[index]
+                         for line in block.splitlines() if line],
+                        dtype=np.int64)
+
+    import pandas as pd
+
+    return pd.read_csv(io.BytesIO(block), header=None, usecols=[index],
+                       dtype=np.int64)[index].values
+
+
+def iter_key_chunks(file_path, column, offset=None, end=None,
+                    chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Yield (keys, end_offset) for each chunk of the file.
+
+    keys is a numpy array with the values of the key column, end_offset the
+    offset of the end of the last complete line of the chunk. Only complete
+    lines are read, so memory usage is bounded by chunk_bytes.
+
+    Positional arguments:
+    file_path   -- The CSV file to read
+    column      -- The name of the key column (integers)
+
+    Keyword arguments:
+    offset      -- The offset of the first line to read (default: the line
+                   after the header)
+    end         -- The offset of the first line not to read (default: the
+                   end of the file)
+    chunk_bytes -- The size (in bytes) of the chunks
+    """
+    with open_trade_file(file_path) as csv_file:
+        header = csv_file.readline()
+        index = header.rstrip('\r\n').split(',').index(column)
+
+        if offset is None:
+            offset = csv_file.tell()
+
+        csv_file.seek(offset)
+        position = offset
+        rest = ''
+
+        while True:
+            size = chunk_bytes if end is None else min(chunk_bytes,
+                                                       end - position)
+            data = csv_file.read(size) if size > 0 else ''
+            position += len(data)
+            block = rest + data
+            line_end = block.rfind('\n') + 1
+
+            # Keep the partial last line for the next chunk
+            if data and not line_end:
+                rest = block
+                continue
+
+            if not data:
+                # The last line is not terminated: ignore it
+                return
+
+            block, rest = block[:line_end], block[line_end:]
+            offset += len(block)
+
+            yield parse_keys(block, index), offset
+
+
+def key_issues(keys, rule, previous=None):
+    """Return the list of (previous key, key) tuples, one per place where
+    keys break the rule.
+
+    Positional arguments:
+    keys     -- A numpy array of keys
+    rule     -- 'contiguous' if each key should be the previous one + 1,
+                'increasing' if keys should never decrease
+
+    Keyword arguments:
+    previous -- The key before keys (default: None)
+    """
+    if previous is not None:
+        keys_before = np.concatenate(([previous], keys[:-1]))
+    else:
+        keys_before = np.concatenate((keys[:1], keys[:-1]))
+
+    diffs = keys - keys_before
+
+    if rule == 'contiguous':
+        bad = diffs != 1
+    else:
+        bad = diffs < 0
+
+    if previous is None and len(bad):
+        bad[0] = False
+
+    return zip(keys_before[bad].tolist(), keys[bad].tolist())
+
+
+def find_issues(file_path, column, rule, offset=None, previous=None,
+                end=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Return (issues, end_offset, last) for the lines of a CSV file.
+
+    issues is a list of (previous key, key) tuples, one per place where the
+    key column breaks the rule. end_offset is the offset of the end of the
+    last complete line, and last its key.
+
+    Positional arguments:
+    file_path   -- The CSV file to check
+    column      -- The name of the key column (integers)
+    rule        -- 'contiguous' or 'increasing' (see key_issues)
+
+    Keyword arguments:
+    offset      -- The offset of the first line to check (default: the line
+                   after the header)
+    previous    -- The key of the line before offset (default: None)
+    end         -- The offset of the first line not to check (default: the
+                   end of the file)
+    chunk_bytes -- The size (in bytes) of the chunks
+    """
+    issues = []
+    end_offset = offset
+
+    for keys, end_offset in iter_key_chunks(file_path, column, offset, end,
+                                            chunk_bytes):
+        issues.extend(key_issues(keys, rule, previous))
+        previous = keys[-1].item()
+
+    return issues, end_offset, previous
+
+
+def filter_issues(issues, start=None, end=None):
+    """Return the issues overlapping the range of keys from start to end.
+
+    Positional arguments:
+    issues -- A list of (previous key, key) tuples
+
+    Keyword arguments:
+    start  -- The first key of the range (default: no lower bound)
+    end    -- The last key of the range (default: no upper bound)
+    """
+    return [issue for issue in issues
+            if (start is None or max(issue) >= start) and
+            (end is None or min(issue) <= end)]
+
+
+def check_range(file_path, column, rule, start=None, end=None,
+                chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Check the lines of a CSV file whose key is between start and end
+    (both included), and return the list of issues.
+
+    Only the bytes of the range are read, thanks to the index of the file
+    (built if needed). A compressed file, which is not indexed, is read
+    entirely. The checkpoint is neither used nor moved.
+
+    Positional arguments:
+    file_path   -- The CSV file to check
+    column      -- The name of the key column (integers)
+    rule        -- 'contiguous' or 'increasing' (see key_issues)
+
+    Keyword arguments:
+    start       -- The first key to check (default: no lower bound)
+    end         -- The last key to check (default: no upper bound)
+    chunk_bytes -- The size (in bytes) of the chunks
+    """
+    offset, end_offset = find_range(load_index(file_path, column), 'key',
+                                    start, end)
+
+    issues, _, _ = find_issues(file_path, column, rule, offset=offset,
+                               end=end_offset, chunk_bytes=chunk_bytes)
+    return filter_issues(issues, start, end)
+
+
+def check_file(file_path, column, rule, full=False,
+               chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Check a CSV file and return the list of issues.
+
+    issues is a list of (previous key, key) tuples (see key_issues).
+
+    If a valid checkpoint exists, only lines after it are checked, unless
+    full is True. The checkpoint is moved to the end of the file if no issue
+    is detected.
+
+    Positional arguments:
+    file_path   -- The CSV file to check
+    column      -- The name of the key column (integers)
+    rule        -- 'contiguous' or 'increasing' (see key_issues)
+
+    Keyword arguments:
+    full        -- If True, check the whole file
+    chunk_bytes -- The size (in bytes) of the chunks
+    """
+    compressed = codec_of(file_path) is not None
+    checkpoint = None if full or compressed else read_checkpoint(file_path)
+
+    if checkpoint:
+        issues, offset, last = find_issues(file_path, column, rule,
+                                           offset=checkpoint['offset'],
+                                           previous=checkpoint['last'],
+                                           chunk_bytes=chunk_bytes)
+    else:
+        issues, offset, last = find_issues(file_path, column, rule,
+                                           chunk_bytes=chunk_bytes)
+
+    if (not issues and not compressed and offset is not None and
+            last is not None):
+        write_checkpoint(file_path, offset, last)
+
+    return issues
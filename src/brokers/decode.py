@@ -0,0 +1,255 @@
+# coding: utf8
+
+"""Decode broker responses into typed NumPy columns.
+
+Responses are parsed with ujson if it is installed, else with the standard
+json module. Each field of a page of trades is then converted in one pass to
+a NumPy array:
+- identifiers and timestamps: int64 (nano-seconds since epoch for
+  timestamps) or datetime64[ns]
+- prices and sizes          : float64
+- categorical fields        : uint8 codes (see ColumnarStore)
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _ujson_loads(content):
+    """Parse JSON content with ujson, parsing floats without loss.
+
+    Positional arguments:
+    content -- The JSON text
+    """
+    return ujson.loads(content, precise_float=True)
+
+
+if ujson is None:
+    loads = json.loads
+else:
+    try:
+        _ujson_loads('0.1')
+        loads = _ujson_loads
+    except TypeError:
+        # Recent versions of ujson are always precise
+        loads = ujson.loads
+
+
+def nb_rows(columns):
+    """Return the number of rows of columns.
+
+    Positional arguments:
+    columns -- A dictionnary of arrays of the same length
+    """
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+def select(columns, selection):
+    """Return columns with only the selected rows.
+
+    Positional arguments:
+    columns   -- A dictionnary of arrays of the same length
+    selection -- A boolean mask, or an array of indices
+    """
+    return dict((name, values[selection])
+                for name, values in columns.items())
+
+
+def int_column(values):
+    """Return an int64 array.
+
+    Positional arguments:
+    values -- A sequence of integers, or of strings of integers
+    """
+    return np.array(values).astype(np.int64)
+
+
+def float_column(values):
+    """Return a float64 array.
+
+    Positional arguments:
+    values -- A sequence of numbers, or of strings of numbers
+    """
+    return np.array(values).astype(np.float64)
+
+
+def text_column(values):
+    """Return an array of strings, kept as given.
+
+    Positional arguments:
+    values -- A sequence of strings
+    """
+    return np.array(values, dtype=object)
+
+
+def category_column(values, categories):
+    """Return the uint8 codes of values.
+
+    Positional arguments:
+    values     -- A sequence of strings
+    categories -- The list of categories, the code of a value being its
+                  index in this list
+    """
+    values = np.array(values, dtype=str)
+    codes = np.zeros(len(values), dtype=np.uint8)
+
+    for code, category in enumerate(categories):
+        codes[values == category] = code
+
+    return codes
+
+
+# Number of times parsed at once by datetime_column
+_BLOCK_SIZE = 1 << 16
+
+
+def _number(digits, start, stop):
+    """Return the int64 numbers written at positions start to stop
+    (excluded) of times.
+
+    Positional arguments:
+    digits -- A 2D uint8 array of digit values, a row per position in the
+              times (so each row is contiguous)
+    start  -- The position of the first digit of the numbers
+    stop   -- The position after the last digit of the numbers
+    """
+    numbers = digits[start].astype(np.int64)
+
+    for position in range(start + 1, stop):
+        numbers *= 10
+        numbers += digits[position]
+
+    return numbers
+
+
+def _fixed_nanos(chars):
+    """Return the int64 nano-seconds since epoch of times of the same
+    length, or None if they do not all follow the layout
+    'YYYY-MM-DD[(T| )HH:MM:SS[.F]][Z]', F being 1 to 9 digits.
+
+    Fields are read at fixed positions with vectorized operations, which is
+    much faster than a generic parser.
+
+    Positional arguments:
+    chars -- A 2D uint8 array of characters, a row per time
+    """
+    width = chars.shape[1]
+    if width > 10 and (chars[:, -1] == ord('Z')).all():
+        width -= 1
+
+    if width not in (10, 19) and not 21 <= width <= 29:
+        return None
+
+    separators = dict((position, ord(separator)) for position, separator in
+                      [(4, '-'), (7, '-'), (13, ':'), (16, ':'), (19, '.')]
+                      if position < width)
+
+    # A row per position in the times, each row being contiguous
+    chars = np.ascontiguousarray(chars[:, :width].T)
+
+    # Characters below '0' wrap around, and are also above 9
+    digits = chars - np.uint8(ord('0'))
+
+    for position in range(width):
+        if position == 10:
+            valid = (chars[position] == ord('T')) | \
+                (chars[position] == ord(' '))
+        elif position in separators:
+            valid = chars[position] == separators[position]
+        else:
+            valid = digits[position] <= 9
+
+        if not valid.all():
+            return None
+
+    month = _number(digits, 5, 7)
+    months = (_number(digits, 0, 4) - 1970) * 12 + month - 1
+    first_days = months.astype('datetime64[M]').astype('datetime64[D]')
+    month_days = (months + 1).astype('datetime64[M]').astype(
+        'datetime64[D]') - first_days
+    days = _number(digits, 8, 10) - 1
+
+    if width > 10:
+        hours = _number(digits, 11, 13)
+        minutes = _number(digits, 14, 16)
+        seconds = _number(digits, 17, 19)
+    else:
+        hours = minutes = seconds = 0
+
+    if not ((month >= 1) & (month <= 12) & (days >= 0) &
+            (days < month_days.astype(np.int64)) & (hours < 24) &
+            (minutes < 60) & (seconds < 60)).all():
+        return None
+
+    nanos = ((first_days.astype(np.int64) + days) * 86400 + hours * 3600 +
+             minutes * 60 + seconds) * 10**9
+
+    if width > 19:
+        nanos += _number(digits, 20, width) * 10**(29 - width)
+
+    return nanos
+
+
+def datetime_column(values):
+    """Return a datetime64[ns] array from ISO 8601 UTC times.
+
+    Times of the layouts written by brokers and trade files (see
+    _fixed_nanos) are parsed by groups of the same length, other times by
+    numpy. Times are parsed by blocks of _BLOCK_SIZE, to bound the memory of
+    temporary arrays.
+
+    Positional arguments:
+    values -- A sequence of strings, like '2015-04-29T07:31:37.989314Z' or
+              '2013-09-10 23:47:11.546000'
+    """
+    nanos = np.zeros(len(values), dtype=np.int64)
+
+    for start in range(0, len(values), _BLOCK_SIZE):
+        block = np.array(values[start:start + _BLOCK_SIZE], dtype=str)
+        width = block.dtype.itemsize
+        chars = block.view(np.uint8).reshape(-1, width)
+
+        # Shorter strings are padded with null characters
+        if chars[:, -1].all():
+            lengths = np.full(len(block), width)
+        else:
+            lengths = width - (chars == 0).sum(axis=1)
+
+        for length in np.unique(lengths):
+            selection = lengths == length
+            group = _fixed_nanos(chars[selection, :length])
+
+            if group is None:
+                group = np.char.replace(np.char.rstrip(block[selection],
+                                                       'Z'),
+                                        ' ', 'T').astype('datetime64[ns]')
+
+            nanos[start:start + _BLOCK_SIZE][selection] = group
+
+    return nanos.view('datetime64[ns]')
+
+
+def seconds_column(values, resolution=10**3):
+    """Return the int64 nano-seconds of times given in seconds since epoch.
+
+    Times are rounded to resolution, not truncated: a float like
+    1378856831.5461 is slightly below 1378856831.5461, and truncating it
+    would lose the last digit. With the default resolution (micro-second),
+    times written with up to 6 decimals are exact until 2038 (2**31
+    seconds), the error of a float64 being lower than half a micro-second.
+
+    Positional arguments:
+    values     -- A sequence of floats
+
+    Keyword arguments:
+    resolution -- The resolution (in nano-seconds) of the times
+    """
+    scale = 1e9 / resolution
+    return np.round(np.array(values, dtype=np.float64) * scale).astype(
+        np.int64) * resolution
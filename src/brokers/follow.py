@@ -0,0 +1,214 @@
+# coding: utf8
+
+"""Follow pairs live: poll each pair for new trades, and append them to its
+trade file at once.
+
+Each pair is polled by its own thread, with an interval adapted to its trade
+rate (see AdaptiveInterval): about target_trades new trades per poll, within
+[min_interval, max_interval] seconds. A poll fetches pages until the most
+recent trade, and each page is flushed to the file as soon as it is
+received, so trades are readable a few seconds after they occurred.
+
+Pairs of the same broker share its rate limiter, so polling many pairs never
+exceeds the rate budget of the broker: polls simply wait for it.
+"""
+
+import threading
+import time
+
+from .decode import nb_rows
+from .storage import open_trade_writer
+from .telemetry import get_telemetry, progress
+
+
+# Default minimum and maximum intervals (in seconds) between two polls
+DEFAULT_MIN_INTERVAL = 1.
+DEFAULT_MAX_INTERVAL = 30.
+
+# Default number of new trades wanted per poll
+DEFAULT_TARGET_TRADES = 10
+
+# Weight of the last poll in the estimated trade rate
+RATE_SMOOTHING = 0.3
+
+# Default time (in seconds) after the end of a period before its bar is
+# written (see resample.bar_writer), so trades published late by the broker
+# are counted
+DEFAULT_BAR_DELAY = 5.
+
+
+class AdaptiveInterval(object):
+    """Interval between two polls of a pair, adapted to its trade rate.
+
+    The trade rate is an exponential moving average of the rates observed
+    by polls. The interval is the time expected for target_trades new
+    trades, within [min_interval, max_interval]: a quiet pair is polled
+    less and less often, and a busy pair as often as allowed.
+    """
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL,
+                 target_trades=DEFAULT_TARGET_TRADES):
+        """Create the interval, starting at min_interval.
+
+        Keyword arguments:
+        min_interval  -- The minimum interval, in seconds
+        max_interval  -- The maximum interval, in seconds
+        target_trades -- The number of new trades wanted per poll
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_trades = target_trades
+
+        self.rate = None
+        self.interval = min_interval
+
+    def update(self, nb_trades, elapsed):
+        """Record the new trades of a poll, and return the interval before
+        the next poll.
+
+        Positional arguments:
+        nb_trades -- The number of new trades
+        elapsed   -- The time (in seconds) since the previous poll
+        """
+        rate = nb_trades / max(elapsed, 1e-3)
+        self.rate = (rate if self.rate is None else
+                     RATE_SMOOTHING * rate +
+                     (1 - RATE_SMOOTHING) * self.rate)
+
+        interval = (self.target_trades / self.rate if self.rate > 0 else
+                    self.max_interval)
+        self.interval = min(max(interval, self.min_interval),
+                            self.max_interval)
+
+        return self.interval
+
+
+class PairFollower(object):
+    """Poll a pair for new trades, and append them to its trade file."""
+
+    def __init__(self, broker, file_path, pair, on_poll=None,
+                 interval=None):
+        """Open the trade file, to be appended from its last trade.
+
+        Positional arguments:
+        broker    -- The broker
+        file_path -- The trade file (CSV file or columnar store)
+        pair      -- The pair to trade
+
+        Keyword arguments:
+        on_poll   -- A function called after each poll with (list of the
+                     columns of the new pages, time of the poll start in
+                     seconds since epoch). The time is None if the poll
+                     failed before the most recent trade.
+        interval  -- The AdaptiveInterval of the pair (default: the default
+                     one)
+        """
+        self.broker = broker
+        self.file_path = file_path
+        self.pair = pair
+        self.on_poll = on_poll
+        self.interval = AdaptiveInterval() if interval is None else interval
+
+        self.cursor = broker.get_cursor_of_file(file_path)
+        self.writer = open_trade_writer(file_path, broker.COLUMNS,
+                                        broker.COLUMNAR_SCHEMA,
+                                        broker.format_trades,
+                                        broker.KEY_COLUMN)
+        self.last_poll = time.time()
+
+    def poll(self, now=None):
+        """Fetch the new trades, append them to the file, and return their
+        number.
+
+        Raise RuntimeError or ValueError if a request fails: on_poll is
+        still called with the pages written before.
+
+        Keyword arguments:
+        now -- The time of the poll start (default: time.time())
+        """
+        now = time.time() if now is None else now
+        name = self.broker.__name__
+        pages = []
+
+        try:
+            for trades, cursor in self.broker.iter_new_trades(self.cursor,
+                                                              self.pair):
+                with get_telemetry().timer(name, self.pair, 'write'):
+                    self.writer.write_columns(trades)
+                    self.writer.flush()
+
+                self.cursor = cursor
+                pages.append(trades)
+        except (RuntimeError, ValueError):
+            if pages and self.on_poll is not None:
+                self.on_poll(pages, None)
+            raise
+
+        if self.on_poll is not None:
+            self.on_poll(pages, now)
+
+        return sum(nb_rows(trades) for trades in pages)
+
+    def run(self, stop):
+        """Poll the pair until stop is set, then close the file.
+
+        Positional arguments:
+        stop -- The threading.Event set to stop following the pair
+        """
+        name = self.broker.__name__ + ' ' + self.pair
+
+        with self.writer:
+            while not stop.is_set():
+                start = time.time()
+
+                try:
+                    nb_trades = self.poll(start)
+                except (RuntimeError, ValueError) as exception:
+                    progress(name + ': poll KO (' + str(exception) + ')\n')
+                    interval = self.interval.interval
+                else:
+                    interval = self.interval.update(nb_trades,
+                                                    start - self.last_poll)
+                    self.last_poll = start
+
+                    if nb_trades:
+                        progress(name + ': ' + str(nb_trades) +
+                                 ' new trades, next poll in %.1fs\n' %
+                                 interval)
+
+                stop.wait(max(0., start + interval - time.time()))
+
+
+def follow_pairs(followers, stop=None):
+    """Poll pairs, each one in its own thread, until stop is set or Ctrl-C
+    is hit.
+
+    Positional arguments:
+    followers -- A list of PairFollower
+
+    Keyword arguments:
+    stop      -- The threading.Event set to stop following (default: only
+                 Ctrl-C stops)
+    """
+    stop = threading.Event() if stop is None else stop
+
+    threads = [threading.Thread(target=follower.run, args=(stop,))
+               for follower in followers]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        # Join with a timeout, so KeyboardInterrupt is still caught
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Let each thread close its file
+        stop.set()
+        for thread in threads:
+            thread.join()
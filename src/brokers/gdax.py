@@ -2,11 +2,27 @@
 
 """Implement GDAX broker."""
 
+import calendar
+import itertools
+import numpy as np
 import os
-import pandas as pd
 import requests
 import sys
-import tailer
+import time
+
+from .columnar import ColumnarStore
+from .consistency import (check_file, check_range, filter_issues,
+                          find_issues)
+from .decode import (category_column, datetime_column, float_column,
+                     int_column, loads, nb_rows, select, text_column)
+from .http_session import get_session
+from .page_fetcher import PageFetcher
+from .rate_limit import RateLimiter
+from .repair import DEFAULT_WORKERS, merge_ranges, repair_file, split_ranges
+from .storage import (is_columnar, is_compressed, open_trade_writer,
+                      read_last_line, read_last_row, recover_file)
+from .telemetry import get_telemetry, progress
+from .trade_writer import format_float
 
 
 class GDAX(object):
@@ -19,9 +35,31 @@ class GDAX(object):
                      'ETH-USD', 'ETH-BTC', 'ETH-EUR',
                      'LTC-USD', 'LTC-BTC', 'LTC-EUR']
 
+    # Columns of the output file
+    COLUMNS = ['trade_id', 'price', 'side', 'size', 'time']
+
+    # Column checked for consistency (each trade ID follows the previous one)
+    KEY_COLUMN = 'trade_id'
+
+    # Rule of the key column (see consistency.key_issues)
+    KEY_RULE = 'contiguous'
+
+    # Values of the 'side' column
+    SIDES = ['buy', 'sell']
+
+    # Columns of the output file, when stored as a columnar store
+    COLUMNAR_SCHEMA = [dict(name='trade_id', dtype='int64'),
+                       dict(name='price', dtype='float64'),
+                       dict(name='side', dtype='uint8', categories=SIDES),
+                       dict(name='size', dtype='float64'),
+                       dict(name='time', dtype='datetime64[ns]', tz='UTC')]
+
     # Max trades retrievable by GDAX on one request
     LIMIT = 100
 
+    # Public endpoints are limited to 3 requests per second, bursts up to 6
+    RATE_LIMITER = RateLimiter(3, burst=6)
+
     @classmethod
     def get_trades(cls, base_trade_number, pair):
         """Return all trades between base_trade_number and
@@ -32,106 +70,210 @@ class GDAX(object):
         pair              -- The pair to trade
 
         Returns a tuple with the following shape
-        (list of dictionnaries, boolean)
-
-        The list of dictionnaries contains dictionnaries with the following
-        shape:
-        {
-          'time': '015-04-29T04:55:54.675974Z',
-          'trade_id': 42,
-          'price': 206.13,
-          'size': 0.1037,
-          'side': 'sell',
-          'last': False
-        }
-
-        The boolean is True is this list contain the last known trade, else is
-        False.
+        (dictionnary of arrays, boolean)
+
+        The dictionnary contains the columns of the trades, sorted by trade
+        ID, as returned by decode_trades.
+
+        The boolean is True is these trades contain the last known trade, else
+        is False.
 
         Raise a Runtime Error if problem during the request.
         """
         after = base_trade_number + cls.LIMIT
 
         url = cls.BASE_URL + pair + '/trades/'
-        response = requests.get(url, params=dict(after=after))
+        telemetry = get_telemetry()
+
+        with telemetry.timer('GDAX', pair, 'throttle'):
+            cls.RATE_LIMITER.acquire()
+
+        telemetry.count('GDAX', pair, 'requests')
+        try:
+            with telemetry.timer('GDAX', pair, 'network'):
+                response = get_session().get(url, params=dict(after=after))
+        except requests.RequestException as exception:
+            cls.RATE_LIMITER.failure()
+            telemetry.count('GDAX', pair, 'failed_requests')
+            message = (str(exception) + " for base trade number " +
+                       str(base_trade_number))
+            raise RuntimeError(message)
 
         # Raise if error
         status_code = response.status_code
+        cls.RATE_LIMITER.record_status(status_code)
         if response.status_code != 200:
+            telemetry.count('GDAX', pair, 'failed_requests')
             message = ("Error code " + str(status_code) +
                        " for base trade number " + str(base_trade_number))
             raise RuntimeError(message)
 
-        trades = response.json()
+        with telemetry.timer('GDAX', pair, 'decode'):
+            answer = loads(response.content)
+
+        with telemetry.timer('GDAX', pair, 'build'):
+            trades = cls.decode_trades(answer)
+
+        trade_ids = trades['trade_id']
 
         # Test if these trades contain the most recent one
-        last = not trades[0]['trade_id'] == base_trade_number + cls.LIMIT - 1
+        last = not (len(trade_ids) and
+                    trade_ids[-1] == base_trade_number + cls.LIMIT - 1)
 
         # If it is the case, delete trades older than base_trade_number
         if last:
-            filt_trades = [trade for trade in trades
-                           if float(trade['trade_id']) >= base_trade_number]
-        else:
-            filt_trades = trades
+            trades = select(trades, trade_ids >= base_trade_number)
+
+        telemetry.count('GDAX', pair, 'pages')
+        telemetry.count('GDAX', pair, 'trades', nb_rows(trades))
 
-        return ([dict(trade_id=trade['trade_id'], size=float(trade['size']),
-                      side=trade['side'], price=float(trade['price']),
-                      time=trade['time']) for trade in filt_trades], last)
+        return trades, last
 
     @classmethod
-    def write_trades_from(cls, base_trade_id, file_path, pair):
+    def decode_trades(cls, trades):
+        """Return the columns of trades, sorted by trade ID.
+
+        Columns are the following arrays:
+        - trade_id : int64
+        - price    : float64
+        - side     : uint8 (index in SIDES)
+        - size     : float64
+        - time     : datetime64[ns] (UTC)
+        - time_text: The times as given by GDAX, like
+                     '2015-04-29T04:55:54.675974Z'
+
+        Positional arguments:
+        trades -- A list of trades, as decoded from a GDAX answer
+        """
+        fields = zip(*[(trade['trade_id'], trade['price'], trade['side'],
+                        trade['size'], trade['time']) for trade in trades])
+        trade_ids, prices, sides, sizes, times = fields or [()] * 5
+
+        columns = dict(trade_id=int_column(trade_ids),
+                       price=float_column(prices),
+                       side=category_column(sides, cls.SIDES),
+                       size=float_column(sizes),
+                       time=datetime_column(times),
+                       time_text=text_column(times))
+
+        return select(columns,
+                      np.argsort(columns['trade_id'], kind='mergesort'))
+
+    @classmethod
+    def write_trades_from(cls, base_trade_id, file_path, pair, workers=1):
         """Write in the file 'file_path' all trades from base_trade_id.
 
         Output file is a CSV file with the following columns:
         trade_id, price, side, volume, date
+        or a columnar store if its path ends with '.columns'.
+
+        Pages of trades are fetched concurrently, but are written in the
+        trade ID order, so the file stays append-only.
 
         Positional arguments:
         base_trade_id -- The ID of the best trade
         file_path     -- The file where trades should be written
         pair          -- The pair to trade
+
+        Keyword arguments:
+        workers       -- The number of pages fetched at the same time
         """
-        is_last_trade = False
-        current_base_trade = base_trade_id + 1
+        def get_page(base_trade):
+            """Return the trades of the page starting at base_trade."""
+            return cls.get_trades(base_trade, pair)
 
-        write_header = not os.path.isfile(file_path)
+        def print_error(base_trade, _):
+            """Print a message for a page which failed to be fetched."""
+            progress(cls._page_message(base_trade) + " KO\n")
 
-        while not is_last_trade:
-            current_last_trade = current_base_trade + cls.LIMIT - 1
-            msg = ('Get trades ' + str(current_base_trade) + ' to ' +
-                   str(current_last_trade) + "...")
-            sys.stdout.write(msg)
-            sys.stdout.flush()
-            try:
-                trades, is_last_trade = cls.get_trades(current_base_trade,
-                                                       pair)
+        fetcher = PageFetcher(get_page, workers=workers, on_error=print_error)
+        bases = itertools.count(base_trade_id + 1, cls.LIMIT)
+
+        writer = open_trade_writer(file_path, cls.COLUMNS, cls.COLUMNAR_SCHEMA,
+                                   cls.format_trades, cls.KEY_COLUMN)
 
-                current_base_trade += cls.LIMIT
-                sys.stdout.write(" OK\n")
-                sys.stdout.flush()
+        with writer:
+            for base_trade, (trades, is_last) in fetcher.iter_pages(bases):
+                progress(cls._page_message(base_trade) + " OK\n")
 
-                # Return if no trade detected (could happen if this program is
-                # called when no new trade is availabled since the last one in
-                # the output file)
-                if not trades:
+                # Return if no trade detected (could happen if this program
+                # is called when no new trade is availabled since the last
+                # one in the output file)
+                if not nb_rows(trades):
                     return
 
-                df = pd.DataFrame.from_records(trades, index='trade_id')
-                df.sort_index(inplace=True)
-                df.to_csv(file_path, mode='a', header=write_header)
-                write_header = False
-            except RuntimeError:
-                sys.stdout.write(" KO\n")
-                sys.stdout.flush()
+                with get_telemetry().timer('GDAX', pair, 'write'):
+                    writer.write_columns(trades)
+
+                if is_last:
+                    return
+
+    @classmethod
+    def iter_new_trades(cls, last_trade_id, pair):
+        """Yield (trades, last trade ID) for each page of the trades after
+        last_trade_id, until the most recent one.
+
+        Pages are fetched one after the other. Raise RuntimeError if a
+        request fails, the pages yielded before being complete.
+
+        Positional arguments:
+        last_trade_id -- The ID of the last known trade
+        pair          -- The pair to trade
+        """
+        while True:
+            trades, is_last = cls.get_trades(last_trade_id + 1, pair)
+
+            if not nb_rows(trades):
+                return
+
+            last_trade_id = trades['trade_id'][-1].item()
+            yield trades, last_trade_id
+
+            if is_last:
+                return
+
+    @classmethod
+    def format_trades(cls, trades):
+        """Return CSV rows for trades.
+
+        Rows are formatted exactly as pandas.DataFrame.to_csv would do.
+
+        Positional arguments:
+        trades -- The columns of trades, as returned by decode_trades
+        """
+        return zip([str(trade_id) for trade_id in trades['trade_id'].tolist()],
+                   [format_float(price) for price in trades['price'].tolist()],
+                   [cls.SIDES[side] for side in trades['side'].tolist()],
+                   [format_float(size) for size in trades['size'].tolist()],
+                   trades['time_text'].tolist())
+
+    @classmethod
+    def _page_message(cls, base_trade):
+        """Return the message describing the page starting at base_trade.
+
+        Positional arguments:
+        base_trade -- The first trade ID of the page
+        """
+        return ('Get trades ' + str(base_trade) + ' to ' +
+                str(base_trade + cls.LIMIT - 1) + "...")
 
     @staticmethod
     def get_last_trade_id_of_file(file_path):
         """Return the last trade ID written in the file file_path.
 
         Positional arguments:
-        file_path -- The CSV file to check
+        file_path -- The CSV file (or columnar store) to check
         """
+        if is_columnar(file_path):
+            try:
+                last_row = read_last_row(file_path)
+            except IOError:
+                return 0
+
+            return last_row['trade_id'] if last_row else 0
+
         try:
-            last_line = tailer.tail(open(file_path, 'r'), 1)[0]
+            last_line = read_last_line(file_path)
             return int(last_line.split(',')[0])
         except IOError:
             return 0
@@ -140,51 +282,198 @@ class GDAX(object):
                        'take a look.')
             raise ValueError(message)
 
+    @classmethod
+    def get_cursor_of_file(cls, file_path):
+        """Return the cursor from which new trades of the file file_path are
+        fetched (see iter_new_trades): its last trade ID.
+
+        Positional arguments:
+        file_path -- The CSV file (or columnar store) to check
+        """
+        return cls.get_last_trade_id_of_file(file_path)
+
     @staticmethod
-    def check_file_consistency(file_path):
+    def get_last_trade_time_of_file(file_path):
+        """Return the time (in seconds since epoch) of the last trade written
+        in the file file_path, None if there is no trade.
+
+        Positional arguments:
+        file_path -- The CSV file (or columnar store) to check
+        """
+        if is_columnar(file_path):
+            try:
+                last_row = read_last_row(file_path)
+            except IOError:
+                return None
+
+            return last_row['time'] / 1e9 if last_row else None
+
+        try:
+            last_line = read_last_line(file_path)
+            last_time = last_line.split(',')[4][:19]
+            return calendar.timegm(time.strptime(last_time,
+                                                 '%Y-%m-%dT%H:%M:%S'))
+        except IOError:
+            return None
+        except (IndexError, ValueError):
+            # Empty file, or only the header
+            return None
+
+    @classmethod
+    def check_file_consistency(cls, file_path):
         """Return a list containing the trade ID where a issue is detected in
         the file file_path.
 
         Positional arguments:
-        file_path -- The file to check
+        file_path -- The file (or columnar store) to check
+        """
+        if is_columnar(file_path):
+            tr_ids = ColumnarStore(file_path).read_column('trade_id')
+            return tr_ids[1:][np.diff(tr_ids) != 1].tolist()
+
+        issues, _, _ = find_issues(file_path, cls.KEY_COLUMN, cls.KEY_RULE)
+        return [trade_id for _, trade_id in issues]
+
+    @classmethod
+    def check_file_ranges(cls, file_path, full=False, start=None, end=None):
+        """Return a list of (previous trade ID, trade ID) tuples, one per
+        place where trade IDs are not contiguous in the file file_path.
+
+        Unless full is True, only trades appended since the last successful
+        check are verified. If start or end is given, only the trades from
+        start to end (trade IDs, both included) are verified.
+
+        Positional arguments:
+        file_path -- The file (or columnar store) to check
+
+        Keyword arguments:
+        full      -- If True, check the whole file
+        start     -- The first trade ID to check (default: no lower bound)
+        end       -- The last trade ID to check (default: no upper bound)
+        """
+        if is_columnar(file_path):
+            tr_ids = ColumnarStore(file_path).read_column('trade_id')
+            bad = np.diff(tr_ids) != 1
+            issues = zip(tr_ids[:-1][bad].tolist(), tr_ids[1:][bad].tolist())
+            return filter_issues(issues, start, end)
+
+        if start is not None or end is not None:
+            return check_range(file_path, cls.KEY_COLUMN, cls.KEY_RULE,
+                               start=start, end=end)
+
+        return check_file(file_path, cls.KEY_COLUMN, cls.KEY_RULE, full=full)
+
+    @staticmethod
+    def format_issue(previous, trade_id):
+        """Return a message describing a consistency issue.
+
+        Positional arguments:
+        previous -- The previous trade ID in the file
+        trade_id -- The trade ID following previous in the file
+        """
+        if trade_id == previous + 2:
+            return 'missing ' + str(previous + 1)
+        elif trade_id > previous + 2:
+            return 'missing ' + str(previous + 1) + '-' + str(trade_id - 1)
+
+        return str(trade_id) + ' after ' + str(previous)
+
+    @classmethod
+    def repair_ranges(cls, issues):
+        """Return the sorted list of (first trade ID, last trade ID) ranges
+        to fetch again to repair issues, a range per page at most.
+
+        Missing trades are fetched, as well as duplicated or unordered ones.
+
+        Positional arguments:
+        issues -- A list of (previous trade ID, trade ID) tuples
+        """
+        ranges = [(previous + 1, trade_id - 1) if trade_id > previous + 1
+                  else (trade_id, previous)
+                  for previous, trade_id in issues]
+
+        return split_ranges(merge_ranges(ranges), cls.LIMIT)
+
+    @classmethod
+    def fetch_range(cls, first, last, pair):
+        """Return CSV rows for the trades from first to last (trade IDs, both
+        included), sorted by trade ID.
+
+        The range should not be larger than a page (LIMIT trades).
+
+        Positional arguments:
+        first -- The first trade ID
+        last  -- The last trade ID
+        pair  -- The pair to trade
         """
-        tr_ids = pd.read_csv(file_path, usecols=['trade_id'])
-        return tr_ids[tr_ids.diff()['trade_id'] != 1]['trade_id'].tolist()[1:]
+        trades, _ = cls.get_trades(first, pair)
+        trade_ids = trades['trade_id']
+
+        return cls.format_trades(select(trades, (trade_ids >= first) &
+                                        (trade_ids <= last)))
 
     @classmethod
-    def print_check_file_consistency(cls, file_path):
+    def print_check_file_consistency(cls, file_path, full=False, start=None,
+                                     end=None):
         """Check the consistency of the file file_path and print error message
         on console if needed.
 
         Positional arguments:
         file_path -- The file to check
+
+        Keyword arguments:
+        full      -- If True, check the whole file
+        start     -- The first trade ID to check (default: no lower bound)
+        end       -- The last trade ID to check (default: no upper bound)
         """
-        diffs = cls.check_file_consistency(file_path)
+        issues = cls.check_file_ranges(file_path, full=full, start=start,
+                                       end=end)
 
-        if diffs:
-            print('Errors detected in file "' + file_path + '" at trades ' +
-                  str(diffs)[1:-1])
-            print 'Please fix this file manually'
+        if issues:
+            print('Errors detected in file "' + file_path + '" at trades: ' +
+                  ', '.join(cls.format_issue(*issue) for issue in issues))
+            print 'Please fix this file manually, or run again with --repair'
             return True
         else:
             print 'No error detected in "' + file_path + '"'
             return False
 
     @classmethod
-    def download_missing_trades(cls, out_f, pair):
+    def download_missing_trades(cls, out_f, pair, workers=1, full_check=False,
+                                repair=False):
         """Download the missing trades.
 
         Positional arguments:
-        out_f -- The file where trades should be written
-        pair  -- The pair to trade
+        out_f      -- The file where trades should be written
+        pair       -- The pair to trade
+
+        Keyword arguments:
+        workers    -- The number of pages fetched at the same time.
+                      With repair, ranges are fetched by at least
+                      repair.DEFAULT_WORKERS workers.
+        full_check -- If True, check the whole file before downloading
+        repair     -- If True, repair an inconsistent (uncompressed) CSV file
+                      instead of exiting
         """
 
+        # Remove a batch partially written by a killed run
+        recover_file(out_f)
+
         # Check output file consistency
-        if os.path.isfile(out_f) and cls.print_check_file_consistency(out_f):
-            sys.exit()
+        if (os.path.exists(out_f) and
+                cls.print_check_file_consistency(out_f, full=full_check)):
+            if not repair or is_columnar(out_f) or is_compressed(out_f):
+                sys.exit()
+
+            repair_file(cls, out_f, pair,
+                        workers=max(workers, DEFAULT_WORKERS),
+                        full=full_check)
+
+            if cls.print_check_file_consistency(out_f, full=full_check):
+                sys.exit()
 
         # Find the last retrieved trade if exists
         last_trade = cls.get_last_trade_id_of_file(out_f)
 
         # Download missing trades
-        cls.write_trades_from(last_trade, out_f, pair)
+        cls.write_trades_from(last_trade, out_f, pair, workers=workers)
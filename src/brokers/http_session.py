@@ -0,0 +1,201 @@
+# coding: utf8
+
+"""Shared HTTP session used by all brokers.
+
+The session keeps connections alive and pools them per host, so the TCP and
+TLS handshakes are done once instead of once per page of trades.
+"""
+
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Default timeout (in seconds) to connect and to wait for data
+DEFAULT_TIMEOUT = 30
+
+# Default number of connections kept alive per host
+DEFAULT_POOL_SIZE = 10
+
+# Time spent in connect() by the current thread during the current request
+_connect_time = threading.local()
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """HTTP connection recording the time spent to connect."""
+
+    def connect(self):
+        """Connect and record the time spent to do it."""
+        start = time.time()
+        HTTPConnection.connect(self)
+        _connect_time.value = getattr(_connect_time, 'value', 0.)
+        _connect_time.value += time.time() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """HTTPS connection recording the time spent to connect."""
+
+    def connect(self):
+        """Connect and record the time spent to do it (TLS included)."""
+        start = time.time()
+        HTTPSConnection.connect(self)
+        _connect_time.value = getattr(_connect_time, 'value', 0.)
+        _connect_time.value += time.time() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    """HTTP connection pool using timed connections."""
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool using timed connections."""
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """HTTP adapter whose pools use timed connections."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        """Create the pool manager."""
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+
+class TimingStats(object):
+    """Aggregate the timings of the requests done by a session."""
+
+    def __init__(self):
+        """Create empty stats."""
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.connect = 0.
+        self.ttfb = 0.
+        self.transfer = 0.
+
+    def add(self, timings):
+        """Add the timings of one request.
+
+        Positional arguments:
+        timings -- A dictionnary with 'connect', 'ttfb' and 'transfer' keys
+        """
+        with self.lock:
+            self.requests += 1
+            self.connections += timings['connect'] > 0
+            self.connect += timings['connect']
+            self.ttfb += timings['ttfb']
+            self.transfer += timings['transfer']
+
+    def summary(self):
+        """Return a one line summary of the stats."""
+        with self.lock:
+            if not self.requests:
+                return 'No HTTP request'
+
+            def average(total):
+                """Return the average per request in milliseconds."""
+                return '%.1f ms' % (1000. * total / self.requests)
+
+            return (str(self.requests) + ' HTTP requests on ' +
+                    str(self.connections) + ' connections - average ' +
+                    'connect: ' + average(self.connect) + ', ' +
+                    'TTFB: ' + average(self.ttfb) + ', ' +
+                    'transfer: ' + average(self.transfer))
+
+
+class TimedSession(requests.Session):
+    """Session with pooled keep-alive connections and per-request timings.
+
+    Each response gets a 'timings' attribute, a dictionnary with the
+    following keys (in seconds):
+    - connect : Time spent to open a new connection (0 if one was reused)
+    - ttfb    : Time to the first byte of the response (connect included)
+    - transfer: Time spent to read the body of the response
+
+    Timings of all requests are aggregated in the 'stats' attribute.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 gzip=True):
+        """Create the session.
+
+        Keyword arguments:
+        pool_size -- The number of connections kept alive per host
+        timeout   -- The timeout (in seconds) to connect and to wait for data
+        gzip      -- If True, ask for gzip compressed responses
+        """
+        requests.Session.__init__(self)
+        self.timeout = timeout
+        self.stats = TimingStats()
+
+        adapter = _TimedHTTPAdapter(pool_connections=pool_size,
+                                    pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+        self.headers['Connection'] = 'keep-alive'
+        if not gzip:
+            self.headers['Accept-Encoding'] = 'identity'
+
+    def request(self, method, url, **kwargs):
+        """Send a request, read its body and record its timings."""
+        kwargs.setdefault('timeout', self.timeout)
+        kwargs['stream'] = True
+
+        _connect_time.value = 0.
+        start = time.time()
+        response = requests.Session.request(self, method, url, **kwargs)
+        ttfb = time.time() - start
+
+        # Read the body now, so the connection goes back to the pool
+        response.content
+        transfer = time.time() - start - ttfb
+
+        response.timings = dict(connect=_connect_time.value, ttfb=ttfb,
+                                transfer=transfer)
+        self.stats.add(response.timings)
+
+        return response
+
+
+_session_lock = threading.Lock()
+_session_config = dict(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                       gzip=True)
+_session = None
+
+
+def configure(**kwargs):
+    """Configure the shared session.
+
+    The current shared session (if any) is dropped, so the next call to
+    get_session returns a session with the new configuration.
+
+    Keyword arguments:
+    pool_size -- The number of connections kept alive per host
+    timeout   -- The timeout (in seconds) to connect and to wait for data
+    gzip      -- If True, ask for gzip compressed responses
+    """
+    global _session
+
+    with _session_lock:
+        _session_config.update(kwargs)
+        _session = None
+
+
+def get_session():
+    """Return the session shared by all brokers."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = TimedSession(**_session_config)
+
+        return _session
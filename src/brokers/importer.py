@@ -0,0 +1,273 @@
+# coding: utf8
+
+"""Import published dumps of trades into a CSV trade file.
+
+Dumps (CSV trade files written by download_trades, compressed or not) and
+the existing output file are read by chunks of lines, and merged by key
+(trade IDs on GDAX, timestamps on Kraken) in one streaming pass:
+
+- Each chunk only keeps its keys (parsed by pandas) and its lines, which are
+  written as they are.
+- Lines of all inputs with a key lower than the last key read from every
+  input are merged at once: sorted with numpy, duplicated keys dropped, and
+  written. So the memory usage is bounded by a chunk per input.
+- The merged keys are checked like the consistency check does, so the
+  imported file does not have to be checked again before resuming a
+  download from it.
+
+When several inputs have the same key, lines of the first input having it
+are kept: the existing file first, then the dumps in the given order. The
+merged file replaces the output file only once it is completely written and
+synced to the disk.
+"""
+
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+from .compression import open_trade_file
+from .consistency import key_issues, write_checkpoint
+from .repair import replace_file
+from .trade_writer import recover
+
+
+# Default size (in bytes) of the chunks read from each input
+DEFAULT_CHUNK_BYTES = 4 << 20
+
+# Suffix of the merged file, before it replaces the output file
+IMPORT_SUFFIX = '.import'
+
+# Size (in bytes) of the buffer of the merged file
+_BUFFER_BYTES = 1 << 20
+
+
+def read_header(file_path):
+    """Return the list of the column names of a CSV trade file.
+
+    Positional arguments:
+    file_path -- The CSV file (compressed or not)
+    """
+    with open_trade_file(file_path) as csv_file:
+        return csv_file.readline().rstrip('\r\n').split(',')
+
+
+def iter_line_chunks(file_path, index, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Yield (keys, lines) for each chunk of a CSV file.
+
+    keys is a numpy array with the values of the key column, lines a numpy
+    array of the lines of the chunk (strings, with their end of line). A last
+    line which is not terminated is read as a complete one.
+
+    Positional arguments:
+    file_path   -- The CSV file (compressed or not)
+    index       -- The index of the key column
+
+    Keyword arguments:
+    chunk_bytes -- The size (in bytes) of the chunks
+    """
+    with open_trade_file(file_path) as csv_file:
+        csv_file.readline()
+        rest = ''
+
+        while True:
+            data = csv_file.read(chunk_bytes)
+            block = rest + data
+
+            if not data and not block:
+                return
+
+            if not data:
+                block += '\n'
+
+            line_end = block.rfind('\n') + 1
+
+            # Keep the partial last line for the next chunk
+            if not line_end:
+                rest = block
+                continue
+
+            block, rest = block[:line_end], block[line_end:]
+
+            keys = pd.read_csv(io.BytesIO(block), header=None,
+                               usecols=[index], dtype=np.int64,
+                               skip_blank_lines=False)[index]
+            lines = np.array(block.splitlines(True), dtype=object)
+
+            yield keys.values, lines
+
+
+class _Input(object):
+    """An input of the merge, read by chunks: the lines read but not merged
+    yet are buffered."""
+
+    def __init__(self, file_path, number, index, chunk_bytes):
+        """Open an input.
+
+        Positional arguments:
+        file_path   -- The CSV file (compressed or not)
+        number      -- The rank of the input: lines of lower ranks are kept
+                       for duplicated keys
+        index       -- The index of the key column
+        chunk_bytes -- The size (in bytes) of the chunks
+        """
+        self.file_path = file_path
+        self.number = number
+        self.chunks = iter_line_chunks(file_path, index, chunk_bytes)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.lines = np.empty(0, dtype=object)
+        self.last = None
+        self.done = False
+
+    def read(self):
+        """Buffer the next chunk of the input.
+
+        Raise ValueError if the input is not sorted by key.
+        """
+        try:
+            keys, lines = next(self.chunks)
+        except StopIteration:
+            self.done = True
+            return
+
+        issues = key_issues(keys, 'increasing', self.last)
+        if issues:
+            raise ValueError('"' + self.file_path + '" is not sorted: ' +
+                             str(issues[0][1]) + ' after ' +
+                             str(issues[0][0]) + '. Please repair it first')
+
+        self.keys = np.concatenate((self.keys, keys))
+        self.lines = np.concatenate((self.lines, lines))
+        self.last = keys[-1].item()
+
+    def take(self, bound):
+        """Remove from the buffer and return (keys, lines) of the buffered
+        lines whose key is lower than bound.
+
+        Positional arguments:
+        bound -- The bound of keys (None: all buffered lines)
+        """
+        end = (len(self.keys) if bound is None
+               else np.searchsorted(self.keys, bound))
+        keys, self.keys = self.keys[:end], self.keys[end:]
+        lines, self.lines = self.lines[:end], self.lines[end:]
+        return keys, lines
+
+
+def merge_inputs(inputs, unique):
+    """Yield (keys, lines) for each merged chunk of inputs, sorted by key.
+
+    Positional arguments:
+    inputs -- A list of _Input, by rank
+    unique -- If True, keep a single line per key. Else, keep all lines of
+              the first input having the key.
+    """
+    while True:
+        for source in inputs:
+            if not len(source.keys) and not source.done:
+                source.read()
+
+        pending = [source for source in inputs if not source.done]
+
+        # Lines could still be read with the lowest last key of inputs
+        bound = min(source.last for source in pending) if pending else None
+        taken = [source.take(bound) for source in inputs]
+        keys = np.concatenate([chunk_keys for chunk_keys, _ in taken])
+
+        if not len(keys):
+            if not pending:
+                return
+
+            for source in pending:
+                if source.last == bound:
+                    source.read()
+            continue
+
+        lines = np.concatenate([chunk_lines for _, chunk_lines in taken])
+        numbers = np.concatenate([np.full(len(chunk_keys), source.number,
+                                          dtype=np.int64)
+                                  for source, (chunk_keys, _)
+                                  in zip(inputs, taken)])
+
+        # Sorted by key, then by rank, lines of an input keeping their order
+        order = np.lexsort((numbers, keys))
+        keys, lines, numbers = keys[order], lines[order], numbers[order]
+
+        starts = np.concatenate(([True], keys[1:] != keys[:-1]))
+        if unique:
+            kept = starts
+        else:
+            positions = np.flatnonzero(starts)
+            sizes = np.diff(np.append(positions, len(keys)))
+            kept = numbers == np.repeat(numbers[positions], sizes)
+
+        yield keys[kept], lines[kept]
+
+
+def import_dumps(broker, file_path, dump_paths,
+                 chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Merge dumps into a CSV trade file, and return (number of written
+    lines, issues).
+
+    issues is a list of (previous key, key) tuples, one per place where the
+    merged file breaks the consistency rule of the broker (see
+    consistency.key_issues). If there is none, the merged file is recorded
+    as checked, so a download could be resumed from it at once.
+
+    Positional arguments:
+    broker      -- The broker of the trades
+    file_path   -- The (uncompressed) CSV file, created if needed
+    dump_paths  -- The list of the dumps (CSV files, compressed or not)
+
+    Keyword arguments:
+    chunk_bytes -- The size (in bytes) of the chunks read from each input
+
+    Raise ValueError if an input does not have the columns of the broker, or
+    is not sorted by key.
+    """
+    recover(file_path)
+
+    paths = [path for path in [file_path] + list(dump_paths)
+             if path != file_path or os.path.exists(file_path)]
+
+    for path in paths:
+        if read_header(path) != broker.COLUMNS:
+            raise ValueError('"' + path + '" does not have the columns of ' +
+                             broker.__name__ + ': ' +
+                             ','.join(broker.COLUMNS))
+
+    index = broker.COLUMNS.index(broker.KEY_COLUMN)
+    inputs = [_Input(path, number, index, chunk_bytes)
+              for number, path in enumerate(paths)]
+
+    temp_path = file_path + IMPORT_SUFFIX
+    issues = []
+    last = None
+    nb_lines = 0
+
+    try:
+        with open(temp_path, 'wb', _BUFFER_BYTES) as temp_file:
+            temp_file.write(','.join(broker.COLUMNS) + '\n')
+
+            for keys, lines in merge_inputs(inputs,
+                                            broker.KEY_RULE == 'contiguous'):
+                issues.extend(key_issues(keys, broker.KEY_RULE, last))
+                temp_file.write(''.join(lines))
+                last = keys[-1].item()
+                nb_lines += len(lines)
+
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+    except (EnvironmentError, ValueError, KeyboardInterrupt):
+        # The output file is left as it was
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    replace_file(temp_path, file_path)
+
+    if not issues and last is not None:
+        write_checkpoint(file_path, os.path.getsize(file_path), last)
+
+    return nb_lines, issues
@@ -2,13 +2,26 @@
 
 """Implement Kraken broker."""
 
+import numpy as np
 import os
-import pandas as pd
 import requests
 import sys
-import tailer
 import time
 
+from .columnar import ColumnarStore
+from .consistency import (check_file, check_range, filter_issues,
+                          find_issues)
+from .decode import (category_column, float_column, loads, nb_rows,
+                     seconds_column, select, text_column)
+from .http_session import get_session
+from .page_fetcher import PageFetcher
+from .rate_limit import RateLimiter
+from .repair import DEFAULT_WORKERS, merge_ranges, repair_file
+from .storage import (is_columnar, is_compressed, open_trade_writer,
+                      read_last_line, read_last_row, recover_file)
+from .telemetry import get_telemetry, progress
+from .trade_writer import format_datetimes
+
 
 class Kraken(object):
     """Represents Kraken broker."""
@@ -53,18 +66,63 @@ class Kraken(object):
                          ZECEUR='XZECZEUR', ZECUSD='XZECZUSD',
                          ZECXBT='XZECXXBT')
 
+    # Columns of the output file
+    COLUMNS = ['time', 'price', 'size', 'timestamp', 'side', 'type', 'misc']
+
+    # Column checked for consistency (timestamps never decrease)
+    KEY_COLUMN = 'timestamp'
+
+    # Rule of the key column (see consistency.key_issues)
+    KEY_RULE = 'increasing'
+
+    # Values of the 'side' and 'type' columns
+    SIDES = ['b', 's']
+    TYPES = ['m', 'l']
+
+    # Columns of the output file, when stored as a columnar store (the
+    # 'misc' column, always empty, is not stored)
+    COLUMNAR_SCHEMA = [dict(name='time', dtype='datetime64[ns]'),
+                       dict(name='price', dtype='float64'),
+                       dict(name='size', dtype='float64'),
+                       dict(name='timestamp', dtype='int64'),
+                       dict(name='side', dtype='uint8', categories=SIDES),
+                       dict(name='type', dtype='uint8', categories=TYPES)]
+
     # Max trades retrievable by Kraken on one request
     LIMIT = 1000
 
+    # Public endpoints are limited to about 1 request per second
+    RATE_LIMITER = RateLimiter(1)
+
+    # Duration (in nano-seconds) of the time shards whose pages are fetched
+    # concurrently by write_trades_from
+    SHARD_DURATION = 24 * 3600 * 10**9
+
+    # Kraken gives times of trades with 4 decimals (decoded exactly, see
+    # seconds_column), while cursors are nano-second timestamps: a cursor
+    # could be up to 100 micro-seconds away from the time of its trade. So a
+    # shard is fetched from this time (in nano-seconds) before its start,
+    # much longer than this difference, trades at or before its start being
+    # removed
+    SHARD_OVERLAP = 10**9
+
     @staticmethod
     def get_last_trade_timestamp_of_file(file_path):
         """Return the last trade timestamp written in the file file_path.
 
         Positional arguments:
-        file_path -- The CSV file to check
+        file_path -- The CSV file (or columnar store) to check
         """
+        if is_columnar(file_path):
+            try:
+                last_row = read_last_row(file_path)
+            except IOError:
+                return 0
+
+            return last_row['timestamp'] if last_row else 0
+
         try:
-            last_line = tailer.tail(open(file_path, 'r'), 1)[0]
+            last_line = read_last_line(file_path)
             return int(last_line.split(',')[3])
         except IOError:
             return 0
@@ -73,6 +131,32 @@ class Kraken(object):
                        'take a look.')
             raise ValueError(message)
 
+    @classmethod
+    def get_cursor_of_file(cls, file_path):
+        """Return the cursor from which new trades of the file file_path are
+        fetched (see iter_new_trades): its last trade timestamp.
+
+        Positional arguments:
+        file_path -- The CSV file (or columnar store) to check
+        """
+        return cls.get_last_trade_timestamp_of_file(file_path)
+
+    @classmethod
+    def get_last_trade_time_of_file(cls, file_path):
+        """Return the time (in seconds since epoch) of the last trade written
+        in the file file_path, None if there is no trade.
+
+        Positional arguments:
+        file_path -- The CSV file (or columnar store) to check
+        """
+        try:
+            timestamp = cls.get_last_trade_timestamp_of_file(file_path)
+        except ValueError:
+            # Empty file, or only the header
+            return None
+
+        return timestamp / 1e9 if timestamp else None
+
     @classmethod
     def get_trades(cls, timestamp, pair):
         """Return up to 1000 trades from base_timestamp
@@ -83,40 +167,57 @@ class Kraken(object):
         pair      -- The pair to trade
 
         Returns a tuple with the following shape
-        (list of dictionnaries, boolean, next_timestamp)
-
-        The list of dictionnaries contains dictionnaries with the following
-        shape:
-        {
-          'time': '015-04-29T04:55:54.675974Z',
-          'trade_id': 42,
-          'price': 206.13,
-          'size': 0.1037,
-          'side': 'sell',
-          'last': False
-        }
-
-        The boolean is True is this list contain the last known trade, else is
-        False.
+        (dictionnary of arrays, boolean, next_timestamp)
+
+        The dictionnary contains the columns of the trades, as returned by
+        decode_trades.
+
+        The boolean is True is these trades contain the last known trade, else
+        is False.
 
         next_timestamp is the timestamp to give to the next call to get_trades.
 
         Raise a Runtime Error if problem during the request.
         """
-        response = requests.get(cls.BASE_URL,
-                                params=dict(pair=pair, since=timestamp))
+        telemetry = get_telemetry()
+
+        with telemetry.timer('Kraken', pair, 'throttle'):
+            cls.RATE_LIMITER.acquire()
+
+        telemetry.count('Kraken', pair, 'requests')
+        try:
+            with telemetry.timer('Kraken', pair, 'network'):
+                response = get_session().get(cls.BASE_URL,
+                                             params=dict(pair=pair,
+                                                         since=timestamp))
+        except requests.RequestException as exception:
+            cls.RATE_LIMITER.failure()
+            telemetry.count('Kraken', pair, 'failed_requests')
+            message = str(exception) + " for timestamp " + str(timestamp)
+            raise RuntimeError(message)
 
         # Raise if error
         status_code = response.status_code
         if response.status_code != 200:
+            cls.RATE_LIMITER.record_status(status_code)
+            telemetry.count('Kraken', pair, 'failed_requests')
             message = ("Error code " + str(status_code) + " for timestamp " +
                        str(timestamp))
             raise RuntimeError(message)
 
-        res_dic = response.json()
+        with telemetry.timer('Kraken', pair, 'decode'):
+            res_dic = loads(response.content)
 
         if res_dic['error']:
-            raise ValueError(res_dic['error'])
+            if any('Rate limit' in error for error in res_dic['error']):
+                cls.RATE_LIMITER.throttled()
+            else:
+                cls.RATE_LIMITER.failure()
+
+            telemetry.count('Kraken', pair, 'failed_requests')
+            raise ValueError(', '.join(res_dic['error']))
+
+        cls.RATE_LIMITER.success()
 
         special_pair = cls.SPECIAL_PAIRS.get(pair, pair)
 
@@ -127,107 +228,480 @@ class Kraken(object):
         # Test if these trades contain the most recent one
         last = len(trades) != cls.LIMIT
 
-        return trades, last, next_timestamp
+        with telemetry.timer('Kraken', pair, 'build'):
+            columns = cls.decode_trades(trades, next_timestamp)
+
+        telemetry.count('Kraken', pair, 'pages')
+        telemetry.count('Kraken', pair, 'trades', len(trades))
+
+        return columns, last, next_timestamp
+
+    @classmethod
+    def decode_trades(cls, trades, next_timestamp=None):
+        """Return the columns of trades.
+
+        Columns are the following arrays:
+        - time      : datetime64[ns]
+        - price     : float64
+        - size      : float64
+        - timestamp : int64 (nano-seconds since epoch)
+        - side      : uint8 (index in SIDES)
+        - type      : uint8 (index in TYPES)
+        - price_text, size_text, misc: The fields as given by Kraken
+
+        Times are rounded to the micro-second (see seconds_column), so they
+        are exact. If next_timestamp is given, the timestamp of the last
+        trade is replaced by it, so the download could be resumed from a file
+        where the trades are written.
+
+        Positional arguments:
+        trades         -- A list of trades, as decoded from a Kraken answer
+
+        Keyword arguments:
+        next_timestamp -- The timestamp to give to the next call to get_trades
+        """
+        fields = zip(*[trade[:6] for trade in trades])
+        prices, sizes, times, sides, types, miscs = fields or [()] * 6
+
+        timestamps = seconds_column(times)
+        columns = dict(time=timestamps.view('datetime64[ns]'),
+                       price=float_column(prices),
+                       size=float_column(sizes),
+                       timestamp=timestamps.copy(),
+                       side=category_column(sides, cls.SIDES),
+                       type=category_column(types, cls.TYPES),
+                       price_text=text_column(prices),
+                       size_text=text_column(sizes),
+                       misc=text_column(miscs))
+
+        if next_timestamp is not None and trades:
+            columns['timestamp'][-1] = int(next_timestamp)
+
+        return columns
+
+    @classmethod
+    def _get_page(cls, timestamp, pair):
+        """Return get_trades(timestamp, pair), sending the request again after
+        each failure.
+
+        Positional arguments:
+        timestamp -- The timestamp corresponding to the first trade to get
+                  -- (in nano-seconds)
+        pair      -- The pair to trade
+        """
+        while True:
+            try:
+                return cls.get_trades(timestamp, pair)
+            except (RuntimeError, ValueError) as exception:
+                progress('Get trades from timestamp ' + str(timestamp) +
+                         '... KO (' + str(exception) + ')\n')
+
+    @classmethod
+    def iter_pages(cls, timestamp, pair, last=None):
+        """Yield the columns of the pages of trades after timestamp, following
+        the cursors given by Kraken, until the most recent trade.
+
+        If last is given, stop at the first page holding a trade whose time
+        is after last, and whose last trade is the last one of its time (the
+        next page starts at a later time). Pages are never cut, so the last
+        trade yielded is always followed by a cursor, and all the trades of
+        its time are yielded.
+
+        Positional arguments:
+        timestamp -- The timestamp corresponding to the first trade to get
+                  -- (in nano-seconds)
+        pair      -- The pair to trade
+
+        Keyword arguments:
+        last      -- The last time, in nano-seconds (default: no upper bound)
+        """
+        page = cls._get_page(timestamp, pair)
+
+        while True:
+            trades, is_last, next_timestamp = page
+
+            if not nb_rows(trades):
+                return
+
+            yield trades
+
+            if is_last:
+                return
+
+            page = cls._get_page(next_timestamp, pair)
+
+            times = trades['time'].view(np.int64)
+            if last is not None and times[-1] > last:
+                next_times = page[0]['time'].view(np.int64)
+                if not len(next_times) or next_times[0] > times[-1]:
+                    return
+
+    @classmethod
+    def iter_new_trades(cls, timestamp, pair):
+        """Yield (trades, next timestamp) for each page of the trades after
+        timestamp, until the most recent one.
+
+        Pages are fetched one after the other. Raise RuntimeError or
+        ValueError if a request fails, the pages yielded before being
+        complete.
+
+        Positional arguments:
+        timestamp -- The timestamp corresponding to the first trade to get
+                  -- (in nano-seconds)
+        pair      -- The pair to trade
+        """
+        while True:
+            trades, is_last, next_timestamp = cls.get_trades(timestamp, pair)
+
+            if not nb_rows(trades):
+                return
+
+            timestamp = int(next_timestamp)
+            yield trades, timestamp
+
+            if is_last:
+                return
+
+    @classmethod
+    def fetch_shard(cls, first, last, pair, since=None):
+        """Return the list of the columns of the pages of trades whose time is
+        after first, until the first page after last (in nano-seconds)
+        ending with a cursor after all the trades of its time (see
+        iter_pages).
+
+        Shards are split by the times of trades, not by their timestamps:
+        the timestamp of the last trade of a page is the cursor of the next
+        page, so it depends on how pages are cut.
+
+        Positional arguments:
+        first -- The time of the shard start (excluded)
+        last  -- The time of the shard end (included), None for the most
+                 recent trade
+        pair  -- The pair to trade
+
+        Keyword arguments:
+        since -- The timestamp from which trades are fetched (default:
+                 SHARD_OVERLAP before first)
+        """
+        if since is None:
+            since = first - cls.SHARD_OVERLAP
+
+        pages = (select(trades, trades['time'].view(np.int64) > first)
+                 for trades in cls.iter_pages(since, pair, last))
+        return [trades for trades in pages if nb_rows(trades)]
+
+    @classmethod
+    def time_shards(cls, first, now):
+        """Return the list of (first, last) shards of SHARD_DURATION
+        splitting the time after first (in nano-seconds).
+
+        The last shard is not bounded (its last time is None), so it ends
+        with the most recent trade.
+
+        Positional arguments:
+        first -- The time of the first shard start (excluded)
+        now   -- The current time
+        """
+        firsts = range(first, max(now, first + 1), cls.SHARD_DURATION)
+        return zip(firsts, firsts[1:] + [None])
 
     @classmethod
-    def write_trades_from(cls, timestamp, file_path, pair):
+    def write_trades_from(cls, timestamp, file_path, pair, workers=1):
         """Write in the file 'file_path' all trades from base_trade_id.
 
         Output file is a CSV file with the following columns:
         trade_id, price, side, volume, date
+        or a columnar store if its path ends with '.columns'.
+
+        Each Kraken answer gives the cursor of the next page, so pages are
+        fetched one after the other. With several workers, the time from the
+        first page to now is split in shards (see time_shards) whose pages
+        are fetched concurrently, a chain of cursors per shard. Shards are
+        written in order, so the file stays append-only.
 
         Positional arguments:
         timestamp -- The timestamp corresponding to the first trade to get
                   -- (in nano-seconds)
         file_path -- The file where trades should be written
         pair      -- The pair to trade
+
+        Keyword arguments:
+        workers   -- The number of shards fetched at the same time
         """
         is_last_trade = False
         current_timestamp = timestamp
-        write_header = not os.path.isfile(file_path)
 
-        while not is_last_trade:
-            msg = ('Get trades from timestamp ' + str(current_timestamp) +
-                   "...")
-            sys.stdout.write(msg)
-            sys.stdout.flush()
-            try:
-                res = cls.get_trades(current_timestamp, pair)
-                trades, is_last_trade, next_timestamp = res
-                sys.stdout.write(" OK\n")
-                sys.stdout.flush()
-
-                # Return if no trade detected (could happen if this program is
-                # called when no new trade is availabled since the last one in
-                # the output file)
-                if not trades:
-                    return
+        writer = open_trade_writer(file_path, cls.COLUMNS, cls.COLUMNAR_SCHEMA,
+                                   cls.format_trades, cls.KEY_COLUMN)
+
+        with writer:
+            if workers > 1:
+                cls._write_shards(writer, timestamp, pair, workers)
+                return
+
+            while not is_last_trade:
+                msg = ('Get trades from timestamp ' + str(current_timestamp) +
+                       "...")
+                try:
+                    res = cls.get_trades(current_timestamp, pair)
+                    trades, is_last_trade, next_timestamp = res
+                    progress(msg + " OK\n")
+
+                    # Return if no trade detected (could happen if this
+                    # program is called when no new trade is availabled since
+                    # the last one in the output file)
+                    if not nb_rows(trades):
+                        return
+
+                    with get_telemetry().timer('Kraken', pair, 'write'):
+                        writer.write_columns(trades)
+
+                    current_timestamp = next_timestamp
+                except RuntimeError:
+                    progress(msg + " KO\n")
+                except ValueError as exception:
+                    progress(msg + " KO (" + str(exception) + ")\n")
 
-                cols = ['price', 'size', 'timestamp', 'side', 'type', 'misc']
-                df = pd.DataFrame(trades, columns=cols)
-                df.timestamp = df.timestamp * 10**4
-                df.timestamp = df.timestamp.astype(int)
-                df.timestamp = df.timestamp * 10**5
-                df['time'] = pd.to_datetime(df['timestamp'])
-                df.iloc[-1, df.columns.get_loc('timestamp')] = next_timestamp
-                df.set_index('time', inplace=True)
-                df.to_csv(file_path, mode='a', header=write_header)
-                write_header = False
-
-                current_timestamp = next_timestamp
-            except RuntimeError:
-                sys.stdout.write(" KO\n")
-                sys.stdout.flush()
-            except ValueError:
-                sys.stdout.write(" KO (Rate limit exceeded - Wait 3 sec)\n")
-                time.sleep(3)
-                sys.stdout.flush()
+    @classmethod
+    def _write_shards(cls, writer, timestamp, pair, workers):
+        """Write the trades after timestamp, fetching time shards
+        concurrently.
+
+        The first shard is fetched from timestamp, the next ones from
+        SHARD_OVERLAP before their start (see fetch_shard). A shard ends
+        after its last time, with the last trade of a page and of its time,
+        and the trades of the next shard up to this time are not written
+        again. So the last trade written is always the last one of a page,
+        whose timestamp is a cursor, and an interrupted download could be
+        resumed as usual.
 
-    @staticmethod
-    def check_file_consistency(file_path):
+        Positional arguments:
+        writer    -- The trade writer of the output file
+        timestamp -- The timestamp corresponding to the first trade to get
+                  -- (in nano-seconds)
+        pair      -- The pair to trade
+        workers   -- The number of shards fetched at the same time
+        """
+        # The first page gives the time of the first trade, where shards
+        # start
+        trades, is_last, _ = cls._get_page(timestamp, pair)
+        progress('Get trades from timestamp ' + str(timestamp) + '... OK\n')
+
+        if not nb_rows(trades) or is_last:
+            if nb_rows(trades):
+                with get_telemetry().timer('Kraken', pair, 'write'):
+                    writer.write_columns(trades)
+            return
+
+        start = int(trades['time'].view(np.int64)[0]) - 1
+        shards = cls.time_shards(start, int(time.time() * 1e9))
+
+        def get_shard(shard):
+            """Return the pages of trades of shard."""
+            first, last = shard
+            return cls.fetch_shard(first, last, pair,
+                                   since=timestamp if first == start else None)
+
+        fetcher = PageFetcher(get_shard, workers=workers)
+        end = start
+
+        for (first, last), pages in fetcher.iter_pages(shards):
+            # Remove the trades written with the previous shard
+            pages = [select(trades, trades['time'].view(np.int64) > end)
+                     for trades in pages]
+            pages = [trades for trades in pages if nb_rows(trades)]
+
+            progress('Get trades from time ' + str(first) +
+                     (' to ' + str(last) if last else '') + '... OK (' +
+                     str(sum(nb_rows(trades) for trades in pages)) +
+                     ' trades)\n')
+
+            with get_telemetry().timer('Kraken', pair, 'write'):
+                for trades in pages:
+                    writer.write_columns(trades)
+
+            if pages:
+                end = int(pages[-1]['time'].view(np.int64)[-1])
+
+    @classmethod
+    def format_trades(cls, trades):
+        """Return CSV rows for trades.
+
+        Rows are formatted exactly as pandas.DataFrame.to_csv would do.
+
+        Positional arguments:
+        trades -- The columns of trades, as returned by decode_trades
+        """
+        times = format_datetimes(trades['time'].view(np.int64).tolist())
+
+        return zip(times, trades['price_text'].tolist(),
+                   trades['size_text'].tolist(),
+                   [str(timestamp)
+                    for timestamp in trades['timestamp'].tolist()],
+                   [cls.SIDES[side] for side in trades['side'].tolist()],
+                   [cls.TYPES[type_] for type_ in trades['type'].tolist()],
+                   trades['misc'].tolist())
+
+    @classmethod
+    def check_file_consistency(cls, file_path):
         """Return a list containing the trade ID where a issue is detected in
         the file file_path.
 
         Positional arguments:
-        file_path -- The file to check
+        file_path -- The file (or columnar store) to check
         """
-        tr_ts = pd.read_csv(file_path, usecols=['timestamp'])
-        return tr_ts[tr_ts.diff()['timestamp'] < 0]['timestamp'].tolist()
+        if is_columnar(file_path):
+            tr_ts = ColumnarStore(file_path).read_column('timestamp')
+            return tr_ts[1:][np.diff(tr_ts) < 0].tolist()
+
+        issues, _, _ = find_issues(file_path, cls.KEY_COLUMN, cls.KEY_RULE)
+        return [timestamp for _, timestamp in issues]
 
     @classmethod
-    def print_check_file_consistency(cls, file_path):
+    def check_file_ranges(cls, file_path, full=False, start=None, end=None):
+        """Return a list of (previous timestamp, timestamp) tuples, one per
+        place where timestamps decrease in the file file_path.
+
+        Unless full is True, only trades appended since the last successful
+        check are verified. If start or end is given, only the trades from
+        start to end (timestamps, both included) are verified.
+
+        Positional arguments:
+        file_path -- The file (or columnar store) to check
+
+        Keyword arguments:
+        full      -- If True, check the whole file
+        start     -- The first timestamp to check (default: no lower bound)
+        end       -- The last timestamp to check (default: no upper bound)
+        """
+        if is_columnar(file_path):
+            tr_ts = ColumnarStore(file_path).read_column('timestamp')
+            bad = np.diff(tr_ts) < 0
+            issues = zip(tr_ts[:-1][bad].tolist(), tr_ts[1:][bad].tolist())
+            return filter_issues(issues, start, end)
+
+        if start is not None or end is not None:
+            return check_range(file_path, cls.KEY_COLUMN, cls.KEY_RULE,
+                               start=start, end=end)
+
+        return check_file(file_path, cls.KEY_COLUMN, cls.KEY_RULE, full=full)
+
+    @staticmethod
+    def format_issue(previous, timestamp):
+        """Return a message describing a consistency issue.
+
+        Positional arguments:
+        previous  -- The previous timestamp in the file
+        timestamp -- The timestamp following previous in the file
+        """
+        return str(timestamp) + ' after ' + str(previous)
+
+    @staticmethod
+    def repair_ranges(issues):
+        """Return the sorted list of (first timestamp, last timestamp) ranges
+        to fetch again to repair issues.
+
+        Trades between a timestamp and the greater timestamp preceding it are
+        fetched again.
+
+        Positional arguments:
+        issues -- A list of (previous timestamp, timestamp) tuples
+        """
+        return merge_ranges((timestamp, previous)
+                            for previous, timestamp in issues)
+
+    @classmethod
+    def fetch_range(cls, first, last, pair):
+        """Return CSV rows for the trades from first to last (timestamps in
+        nano-seconds, both included).
+
+        Positional arguments:
+        first -- The first timestamp
+        last  -- The last timestamp
+        pair  -- The pair to trade
+        """
+        index = cls.COLUMNS.index(cls.KEY_COLUMN)
+        timestamp = first - 1
+        rows = []
+
+        while True:
+            trades, is_last, next_timestamp = cls._get_page(timestamp, pair)
+
+            if not nb_rows(trades):
+                return rows
+
+            page = cls.format_trades(trades)
+            rows.extend(row for row in page
+                        if first <= int(row[index]) <= last)
+
+            if is_last or int(page[-1][index]) > last:
+                return rows
+
+            timestamp = next_timestamp
+
+    @classmethod
+    def print_check_file_consistency(cls, file_path, full=False, start=None,
+                                     end=None):
         """Check the consistency of the file file_path and print error message
         on console if needed.
 
         Positional arguments:
         file_path -- The file to check
-        """
-        diffs = cls.check_file_consistency(file_path)
 
-        if diffs:
-            print('Errors detected in file "' + file_path + '" at lines ' +
-                  str(diffs)[1:-1])
-            print 'Please fix this file manually'
+        Keyword arguments:
+        full      -- If True, check the whole file
+        start     -- The first timestamp to check (default: no lower bound)
+        end       -- The last timestamp to check (default: no upper bound)
+        """
+        issues = cls.check_file_ranges(file_path, full=full, start=start,
+                                       end=end)
+
+        if issues:
+            print('Errors detected in file "' + file_path + '" at ' +
+                  'timestamps: ' +
+                  ', '.join(cls.format_issue(*issue) for issue in issues))
+            print 'Please fix this file manually, or run again with --repair'
             return True
         else:
             print 'No error detected in "' + file_path + '"'
             return False
 
     @classmethod
-    def download_missing_trades(cls, out_f, pair):
+    def download_missing_trades(cls, out_f, pair, workers=1, full_check=False,
+                                repair=False):
         """Download the missing trades.
 
         Positional arguments:
-        out_f -- The file where trades should be written
-        pair  -- The pair to trade
+        out_f      -- The file where trades should be written
+        pair       -- The pair to trade
+
+        Keyword arguments:
+        workers    -- The number of time shards fetched at the same time.
+                      With repair, ranges are fetched by at least
+                      repair.DEFAULT_WORKERS workers.
+        full_check -- If True, check the whole file before downloading
+        repair     -- If True, repair an inconsistent (uncompressed) CSV file
+                      instead of exiting
         """
 
+        # Remove a batch partially written by a killed run
+        recover_file(out_f)
+
         # Check output file consistency
-        if os.path.isfile(out_f) and cls.print_check_file_consistency(out_f):
-            sys.exit()
+        if (os.path.exists(out_f) and
+                cls.print_check_file_consistency(out_f, full=full_check)):
+            if not repair or is_columnar(out_f) or is_compressed(out_f):
+                sys.exit()
+
+            repair_file(cls, out_f, pair,
+                        workers=max(workers, DEFAULT_WORKERS),
+                        full=full_check)
+
+            if cls.print_check_file_consistency(out_f, full=full_check):
+                sys.exit()
 
         # Find the last retrieved trade if exists
         last_trade = cls.get_last_trade_timestamp_of_file(out_f)
 
         # Download missing trades
-        cls.write_trades_from(last_trade, out_f, pair)
+        cls.write_trades_from(last_trade, out_f, pair, workers=workers)
@@ -0,0 +1,253 @@
+# coding: utf8
+
+"""Sparse index of the byte offsets of a CSV trade file.
+
+The index (FILE.idx, next to the CSV file) has a line 'offset,key,time'
+about every DEFAULT_INDEX_BYTES bytes of the CSV file: the offset of a line,
+the value of its key column (trade ID on GDAX, timestamp on Kraken) and its
+time in nano-seconds since epoch. It is appended by the trade writer with
+each flushed batch, and built when missing or outdated by reading a line
+per entry.
+
+Looking up a range of keys or times in the index gives the byte range of the
+CSV file to read, so reading a slice of the file costs time proportional to
+the slice. Keys and times are assumed to be increasing in the file.
+
+Compressed files are not indexed: they can not be read from an offset
+without being decompressed from their start.
+"""
+
+import bisect
+import os
+
+import numpy as np
+
+from .compression import codec_of
+
+
+# Suffix of the index file
+INDEX_SUFFIX = '.idx'
+
+# Default number of bytes of the CSV file between two entries of the index
+DEFAULT_INDEX_BYTES = 1 << 20
+
+# Name of the time column of trade files
+TIME_COLUMN = 'time'
+
+# Position of the offset, key and time in an entry
+_FIELDS = dict(offset=0, key=1, time=2)
+
+
+def parse_time(text):
+    """Return the nano-seconds since epoch of a time of a trade file.
+
+    Positional arguments:
+    text -- The time, like '2015-04-29T04:55:54.675974Z' (GDAX) or
+            '2013-09-10 23:47:11.546' (Kraken)
+    """
+    return np.datetime64(text.rstrip('Z').replace(' ', 'T'),
+                         'ns').astype(np.int64).item()
+
+
+def index_entry(offset, row, key_index, time_index):
+    """Return the index entry of a row.
+
+    Positional arguments:
+    offset     -- The offset of the line of the row
+    row        -- The row, as a sequence of strings
+    key_index  -- The index of the key column in the row
+    time_index -- The index of the time column in the row
+    """
+    return offset, int(row[key_index]), parse_time(row[time_index])
+
+
+def read_index(file_path):
+    """Return the entries of the index of file_path, as a list of (offset,
+    key, time) tuples sorted by offset. Return an empty list if there is no
+    index.
+
+    Positional arguments:
+    file_path -- The CSV file
+    """
+    try:
+        with open(file_path + INDEX_SUFFIX, 'r') as index_file:
+            return [tuple(int(field) for field in line.split(','))
+                    for line in index_file if line.endswith('\n')]
+    except IOError:
+        return []
+
+
+def append_index(file_path, entries):
+    """Append entries to the index of file_path.
+
+    Positional arguments:
+    file_path -- The CSV file
+    entries   -- A list of (offset, key, time) tuples
+    """
+    if not entries:
+        return
+
+    with open(file_path + INDEX_SUFFIX, 'a') as index_file:
+        index_file.write(''.join(','.join(str(field) for field in entry) +
+                                 '\n' for entry in entries))
+
+
+def remove_index(file_path):
+    """Remove the index of file_path, if any.
+
+    Positional arguments:
+    file_path -- The CSV file
+    """
+    try:
+        os.remove(file_path + INDEX_SUFFIX)
+    except OSError:
+        pass
+
+
+def truncate_index(file_path, size):
+    """Remove the entries of the index of file_path at or after size (the
+    file being truncated to size).
+
+    Positional arguments:
+    file_path -- The CSV file
+    size      -- The new size of the CSV file
+    """
+    entries = read_index(file_path)
+    kept = [entry for entry in entries if entry[0] < size]
+
+    if len(kept) == len(entries):
+        return
+
+    remove_index(file_path)
+    append_index(file_path, kept)
+
+
+def build_index(file_path, key_column, index_bytes=DEFAULT_INDEX_BYTES):
+    """Write the index of a CSV file and return its entries.
+
+    The file is not scanned: for each entry, the file is read from the
+    entry offset until the next end of line, so only a line per index_bytes
+    bytes is read. A last line which is not terminated (being written) is
+    not indexed.
+
+    Positional arguments:
+    file_path   -- The CSV file
+    key_column  -- The name of the key column (integers)
+
+    Keyword arguments:
+    index_bytes -- The number of bytes between two entries
+    """
+    entries = []
+
+    with open(file_path, 'rb') as csv_file:
+        header = csv_file.readline().rstrip('\r\n').split(',')
+        key_index = header.index(key_column)
+        time_index = header.index(TIME_COLUMN)
+
+        offset = csv_file.tell()
+
+        while True:
+            csv_file.seek(offset)
+            line = csv_file.readline()
+            if not line.endswith('\n'):
+                break
+
+            row = line.rstrip('\r\n').split(',')
+            entries.append(index_entry(offset, row, key_index, time_index))
+
+            # The next entry is the first line starting at least index_bytes
+            # after this one
+            target = offset + max(index_bytes, len(line))
+            csv_file.seek(target - 1)
+            offset = target - 1 + len(csv_file.readline())
+
+    remove_index(file_path)
+    append_index(file_path, entries)
+    return entries
+
+
+def _is_valid(file_path, entries, key_index):
+    """Return True if the last entry of an index still points to a line
+    with its key.
+
+    Positional arguments:
+    file_path -- The CSV file
+    entries   -- The entries of the index
+    key_index -- The index of the key column
+    """
+    offset, key, _ = entries[-1]
+
+    with open(file_path, 'rb') as csv_file:
+        if offset > 0:
+            csv_file.seek(offset - 1)
+            if csv_file.read(1) != '\n':
+                return False
+
+        line = csv_file.readline()
+
+    try:
+        return (line.endswith('\n') and
+                int(line.split(',', key_index + 1)[key_index]) == key)
+    except (IndexError, ValueError):
+        return False
+
+
+def load_index(file_path, key_column):
+    """Return the entries of the index of a CSV file, building the index if
+    it is missing or does not match the file anymore.
+
+    Return an empty list for a compressed file, which is not indexed.
+
+    Positional arguments:
+    file_path  -- The CSV file
+    key_column -- The name of the key column (integers)
+
+    Raise IOError if the file does not exist.
+    """
+    if codec_of(file_path) is not None:
+        return []
+
+    with open(file_path, 'rb') as csv_file:
+        header = csv_file.readline().rstrip('\r\n').split(',')
+
+    entries = read_index(file_path)
+
+    if not entries or not _is_valid(file_path, entries,
+                                    header.index(key_column)):
+        entries = build_index(file_path, key_column)
+
+    return entries
+
+
+def find_range(entries, field, start=None, end=None):
+    """Return (start offset, end offset) of the bytes of a CSV file holding
+    the lines whose field is between start and end (both included).
+
+    The start offset is None if the lines should be read from the first one,
+    the end offset None if they should be read until the end of the file.
+    Lines outside the range could also be in the returned bytes.
+
+    Positional arguments:
+    entries -- The entries of the index of the file
+    field   -- 'key' or 'time'
+
+    Keyword arguments:
+    start   -- The first key or time (default: no lower bound)
+    end     -- The last key or time (default: no upper bound)
+    """
+    values = [entry[_FIELDS[field]] for entry in entries]
+    start_offset = end_offset = None
+
+    if start is not None:
+        # The last entry before start
+        position = bisect.bisect_left(values, start) - 1
+        if position >= 0:
+            start_offset = entries[position][0]
+
+    if end is not None:
+        # The first entry after end
+        position = bisect.bisect_right(values, end)
+        if position < len(entries):
+            end_offset = entries[position][0]
+
+    return start_offset, end_offset
@@ -0,0 +1,122 @@
+# coding: utf8
+
+"""Fetch pages concurrently while giving them back in order."""
+
+import collections
+import Queue
+import threading
+
+
+class PageFetcher(object):
+    """Fetch pages with a bounded pool of worker threads.
+
+    Pages are identified by keys (for example the base trade ID of a page).
+    They are fetched concurrently but given back in the order of their keys,
+    thanks to a reorder buffer.
+    """
+
+    def __init__(self, fetch, workers=1, on_error=None,
+                 retry_on=(RuntimeError,)):
+        """Create the fetcher.
+
+        Positional arguments:
+        fetch    -- A function taking a key and returning the page
+        workers  -- The number of pages fetched at the same time
+        on_error -- A function called with (key, exception) each time a page
+                    fails to be fetched. The page is then fetched again.
+        retry_on -- The exceptions leading to fetch a page again. Other
+                    exceptions are raised to the caller.
+        """
+        self.fetch = fetch
+        self.workers = max(1, workers)
+        self.on_error = on_error
+        self.retry_on = retry_on
+
+    def _work(self, tasks, results, stop):
+        """Fetch pages from the tasks queue until stop is set.
+
+        Positional arguments:
+        tasks   -- The queue containing the keys to fetch
+        results -- The queue where (key, page, exception) are put
+        stop    -- The event set when workers have to stop
+        """
+        while not stop.is_set():
+            try:
+                key = tasks.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+
+            try:
+                results.put((key, self.fetch(key), None))
+            except Exception as exception:
+                results.put((key, None, exception))
+
+    def iter_pages(self, keys):
+        """Yield (key, page) in the order of keys.
+
+        At most 2 * workers pages are in flight (being fetched or waiting in
+        the reorder buffer) at any time, so keys may be an infinite iterator:
+        simply stop iterating once the wanted pages are retrieved.
+
+        Positional arguments:
+        keys -- An iterable on the keys of the pages to fetch
+        """
+        keys = iter(keys)
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        stop = threading.Event()
+
+        threads = [threading.Thread(target=self._work,
+                                    args=(tasks, results, stop))
+                   for _ in range(self.workers)]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        pending = collections.deque()
+        buffered = {}
+        exhausted = False
+
+        try:
+            while True:
+                # Keep the pool busy without letting the buffer grow
+                while not exhausted and len(pending) < 2 * self.workers:
+                    try:
+                        key = next(keys)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    pending.append(key)
+                    tasks.put(key)
+
+                if not pending:
+                    return
+
+                try:
+                    # A timeout keeps the main thread responsive to Ctrl-C
+                    key, page, exception = results.get(timeout=0.1)
+                except Queue.Empty:
+                    continue
+
+                if exception is not None:
+                    if not isinstance(exception, self.retry_on):
+                        raise exception
+
+                    if self.on_error is not None:
+                        self.on_error(key, exception)
+
+                    tasks.put(key)
+                    continue
+
+                buffered[key] = page
+
+                while pending and pending[0] in buffered:
+                    key = pending.popleft()
+                    yield key, buffered.pop(key)
+        finally:
+            # Wait for the pages being fetched, so no thread is left running
+            stop.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,126 @@
+# coding: utf8
+
+"""Rate limiter shared by all requests sent to a broker."""
+
+import random
+import threading
+import time
+
+
+class RateLimiter(object):
+    """Adaptive token bucket rate limiter.
+
+    Requests are allowed at 'rate' requests per second, with bursts up to
+    'burst' requests. The rate adapts to the answers of the broker (AIMD):
+    - Each successful request increases the rate by 'increase', up to the
+      published limit 'max_rate'.
+    - Each throttled request (HTTP 429 or 5xx) multiplies the rate by
+      'decrease', down to 'min_rate'.
+
+    After a failed request, no request is allowed during an exponential
+    backoff delay with full jitter. The delay is reset by the next successful
+    request.
+
+    A rate limiter is thread safe and is meant to be shared by all requests
+    sent to a broker.
+    """
+
+    def __init__(self, max_rate, burst=1, min_rate=None, increase=None,
+                 decrease=0.5, backoff_base=0.5, backoff_max=60.):
+        """Create the rate limiter.
+
+        Positional arguments:
+        max_rate     -- The published limit, in requests per second
+
+        Keyword arguments:
+        burst        -- The maximum number of requests sent at once
+        min_rate     -- The minimum rate (default: max_rate / 10)
+        increase     -- The rate increase after a success
+                        (default: max_rate / 20)
+        decrease     -- The rate factor applied after a throttled request
+        backoff_base -- The backoff delay (in seconds) after a first failure
+        backoff_max  -- The maximum backoff delay (in seconds)
+        """
+        self.max_rate = float(max_rate)
+        self.min_rate = min_rate if min_rate else self.max_rate / 10
+        self.increase = increase if increase else self.max_rate / 20
+        self.decrease = decrease
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.rate = self.max_rate
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.failures = 0
+        self.blocked_until = 0.
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        """Add the tokens earned since the last refill.
+
+        Positional arguments:
+        now -- The current time
+        """
+        elapsed = max(0., now - self.last_refill)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        """Wait until a request is allowed."""
+        while True:
+            with self.lock:
+                now = time.time()
+                self._refill(now)
+
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = max(self.blocked_until - now,
+                           (1 - self.tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def backoff_delay(self, failures):
+        """Return a backoff delay (in seconds) with full jitter.
+
+        Positional arguments:
+        failures -- The number of consecutive failures
+        """
+        ceiling = min(self.backoff_max,
+                      self.backoff_base * 2 ** (failures - 1))
+        return random.uniform(0, ceiling)
+
+    def success(self):
+        """Record a successful request."""
+        with self.lock:
+            self.failures = 0
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def failure(self):
+        """Record a failed request (network error, unexpected answer...)."""
+        with self.lock:
+            self.failures += 1
+            delay = self.backoff_delay(self.failures)
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+
+    def throttled(self):
+        """Record a request rejected because of the rate (429 or 5xx)."""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+        self.failure()
+
+    def record_status(self, status_code):
+        """Record a request according to the HTTP status code of its answer.
+
+        Positional arguments:
+        status_code -- The HTTP status code
+        """
+        if status_code == 200:
+            self.success()
+        elif status_code == 429 or status_code >= 500:
+            self.throttled()
+        else:
+            self.failure()
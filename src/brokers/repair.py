@@ -0,0 +1,268 @@
+# coding: utf8
+
+"""Repair a CSV trade file whose consistency check failed.
+
+Issues are turned into ranges of keys (trade IDs on GDAX, timestamps on
+Kraken), and the trades of these ranges are fetched again, concurrently. The
+file is then rewritten in one streaming pass: its sorted runs are merged with
+the fetched trades, which replace the trades of the file within the fetched
+ranges. The rewritten file replaces the former one atomically.
+"""
+
+import bisect
+import heapq
+import itertools
+import os
+
+from .consistency import CHECKPOINT_SUFFIX
+from .offset_index import remove_index
+from .page_fetcher import PageFetcher
+from .telemetry import progress
+from .trade_writer import recover, write_commit
+
+
+# Default number of ranges fetched at the same time
+DEFAULT_WORKERS = 4
+
+# Suffix of the rewritten file, before it replaces the former one
+REPAIR_SUFFIX = '.repair'
+
+# Size (in bytes) of the buffer of the rewritten file
+_BUFFER_BYTES = 1 << 20
+
+# Size (in bytes) of the chunks read from each sorted run
+_RUN_CHUNK_BYTES = 16 << 10
+
+
+def merge_ranges(ranges):
+    """Return the sorted list of the non-overlapping ranges covering ranges.
+
+    Positional arguments:
+    ranges -- An iterable on (first key, last key) tuples (both included)
+    """
+    merged = []
+
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+
+    return merged
+
+
+def split_ranges(ranges, size):
+    """Return ranges split in ranges of at most size keys.
+
+    Positional arguments:
+    ranges -- A list of (first key, last key) tuples (both included)
+    size   -- The maximum number of keys of a range
+    """
+    return [(start, min(start + size - 1, last))
+            for first, last in ranges
+            for start in xrange(first, last + 1, size)]
+
+
+def find_runs(file_path, column):
+    """Return the list of (start offset, end offset) of the sorted runs of a
+    CSV file.
+
+    A new run starts at each line whose key is lower than the key of the
+    previous line.
+
+    Positional arguments:
+    file_path -- The CSV file
+    column    -- The name of the key column (integers)
+    """
+    runs = []
+
+    with open(file_path, 'rb') as csv_file:
+        header = csv_file.readline()
+        index = header.rstrip('\r\n').split(',').index(column)
+
+        start = offset = len(header)
+        previous = None
+
+        for line in csv_file:
+            key = int(line.split(',', index + 1)[index])
+
+            if previous is not None and key < previous:
+                runs.append((start, offset))
+                start = offset
+
+            previous = key
+            offset += len(line)
+
+        if offset > start:
+            runs.append((start, offset))
+
+    return runs
+
+
+def _iter_run(csv_file, index, run_number, start, end, ranges):
+    """Yield (key, run number, line number, line) for the lines of a run,
+    skipping lines whose key is within ranges.
+
+    The run is read by chunks, seeking before each one, so the runs of a
+    file could share the same file handle.
+
+    Positional arguments:
+    csv_file   -- The CSV file, opened in binary mode
+    index      -- The index of the key column
+    run_number -- The number of the run, so equal keys keep the file order
+    start      -- The offset of the run start
+    end        -- The offset of the run end
+    ranges     -- A sorted list of non-overlapping (first, last) tuples
+    """
+    firsts = [first for first, _ in ranges]
+    line_numbers = itertools.count()
+    offset = start
+    rest = ''
+
+    while offset < end:
+        csv_file.seek(offset)
+        chunk = csv_file.read(min(_RUN_CHUNK_BYTES, end - offset))
+        if not chunk:
+            raise ValueError('"' + csv_file.name + '" changed while being '
+                             'repaired')
+
+        offset += len(chunk)
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+
+        # The last line of the file could have no end of line
+        if offset >= end and rest:
+            lines.append(rest)
+
+        for line in lines:
+            key = int(line.split(',', index + 1)[index])
+
+            position = bisect.bisect_right(firsts, key) - 1
+            if position >= 0 and key <= ranges[position][1]:
+                continue
+
+            yield key, run_number, next(line_numbers), line + '\n'
+
+
+def replace_file(temp_path, file_path):
+    """Replace a CSV file by a rewritten one, synced to the disk, and commit
+    its whole content.
+
+    Positional arguments:
+    temp_path -- The rewritten file
+    file_path -- The CSV file to replace
+    """
+    os.rename(temp_path, file_path)
+    write_commit(file_path, os.path.getsize(file_path))
+
+    # The former checkpoint and index do not describe the rewritten file
+    try:
+        os.remove(file_path + CHECKPOINT_SUFFIX)
+    except OSError:
+        pass
+
+    remove_index(file_path)
+
+
+def rewrite_file(file_path, column, ranges, rows):
+    """Rewrite a CSV file sorted by its key column, the lines within ranges
+    being replaced by rows, and return the number of written lines.
+
+    The file is read in one pass, through a single file handle shared by
+    its sorted runs, and the result replaces the file only once it is
+    completely written and synced to the disk.
+
+    Positional arguments:
+    file_path -- The CSV file
+    column    -- The name of the key column (integers)
+    ranges    -- A sorted list of non-overlapping (first, last) tuples
+    rows      -- The rows of ranges, sorted by key. A row is a sequence of
+                 strings.
+    """
+    with open(file_path, 'rb') as csv_file:
+        header = csv_file.readline()
+
+    index = header.rstrip('\r\n').split(',').index(column)
+    runs = find_runs(file_path, column)
+
+    # Fetched rows sort before lines of the file with the same key
+    fetched = ((int(row[index]), -1, number, ','.join(row) + '\n')
+               for number, row in enumerate(rows))
+
+    temp_path = file_path + REPAIR_SUFFIX
+    nb_lines = 0
+
+    try:
+        with open(file_path, 'rb') as csv_file, \
+                open(temp_path, 'wb', _BUFFER_BYTES) as temp_file:
+            iterators = [_iter_run(csv_file, index, run_number, start, end,
+                                   ranges)
+                         for run_number, (start, end) in enumerate(runs)]
+            temp_file.write(header)
+
+            for _, _, _, line in heapq.merge(fetched, *iterators):
+                temp_file.write(line)
+                nb_lines += 1
+
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+    except (EnvironmentError, ValueError, KeyboardInterrupt):
+        # The file is left as it was
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    replace_file(temp_path, file_path)
+
+    return nb_lines
+
+
+def repair_file(broker, file_path, pair, workers=DEFAULT_WORKERS,
+                full=False):
+    """Fetch again the trades around the issues of a CSV trade file, merge
+    them into the file, and return the number of fetched ranges.
+
+    Positional arguments:
+    broker    -- The broker
+    file_path -- The CSV file to repair
+    pair      -- The pair of the file
+
+    Keyword arguments:
+    workers   -- The number of ranges fetched at the same time
+    full      -- If True, look for issues in the whole file, not only after
+                 the last successful check
+    """
+    recover(file_path)
+
+    issues = broker.check_file_ranges(file_path, full=full)
+    if not issues:
+        return 0
+
+    ranges = broker.repair_ranges(issues)
+
+    def get_range(key):
+        """Return the rows of the range key."""
+        first, last = key
+        return broker.fetch_range(first, last, pair)
+
+    def print_error(key, exception):
+        """Print a message for a range which failed to be fetched."""
+        progress('Fetch range ' + str(key[0]) + ' to ' + str(key[1]) +
+                 '... KO (' + str(exception) + ')\n')
+
+    fetcher = PageFetcher(get_range, workers=workers, on_error=print_error)
+
+    rows = []
+    for _, range_rows in fetcher.iter_pages(ranges):
+        rows.extend(range_rows)
+
+    index = broker.COLUMNS.index(broker.KEY_COLUMN)
+    rows.sort(key=lambda row: int(row[index]))
+
+    nb_lines = rewrite_file(file_path, broker.KEY_COLUMN, ranges, rows)
+
+    print('Repaired "' + file_path + '": ' + str(len(rows)) + ' trades ' +
+          'fetched again in ' + str(len(ranges)) + ' range(s), ' +
+          str(nb_lines) + ' trades written')
+
+    return len(ranges)
@@ -0,0 +1,111 @@
+# coding: utf8
+
+"""Choose the storage backend of a trade file from its path.
+
+- PAIR.csv     : CSV file (see trade_writer)
+- PAIR.csv.gz  : CSV file, compressed by gzip frames (see compression)
+- PAIR.csv.zst : CSV file, compressed by zstd frames (see compression)
+- PAIR.columns : Columnar store, partitioned by UTC day (see columnar)
+"""
+
+import tailer
+
+from .columnar import ColumnarStore, ColumnarTradeWriter
+from .compression import codec_of
+from .trade_writer import CsvTradeWriter, read_last_frame, recover
+
+
+# Suffix of the output file for each storage backend
+SUFFIXES = dict(csv='.csv', gzip='.csv.gz', zstd='.csv.zst',
+                columnar='.columns')
+
+
+def is_columnar(file_path):
+    """Return True if file_path is a columnar store.
+
+    Positional arguments:
+    file_path -- The path of the trade file
+    """
+    return file_path.endswith(SUFFIXES['columnar'])
+
+
+def is_compressed(file_path):
+    """Return True if file_path is a compressed CSV file.
+
+    Positional arguments:
+    file_path -- The path of the trade file
+    """
+    return codec_of(file_path) is not None
+
+
+def read_last_line(file_path):
+    """Return the last line of a CSV file (compressed or not), an empty
+    string if the file is empty.
+
+    Only the end of the file (or its last frame) is read.
+
+    Positional arguments:
+    file_path -- The path of the CSV file
+
+    Raise IOError if the file does not exist.
+    """
+    if is_compressed(file_path):
+        lines = read_last_frame(file_path).splitlines()
+    else:
+        with open(file_path, 'r') as csv_file:
+            lines = tailer.tail(csv_file, 1)
+
+    return lines[-1] if lines else ''
+
+
+def open_trade_writer(file_path, header, schema, format_rows=None,
+                      key_column=None):
+    """Return a trade writer for file_path.
+
+    Positional arguments:
+    file_path   -- The path of the trade file
+    header      -- The list of column names of the written rows
+    schema      -- The schema used if file_path is a columnar store
+
+    Keyword arguments:
+    format_rows -- The function returning CSV rows for typed columns, used
+                   by write_columns if file_path is a CSV file
+    key_column  -- The key column of the sparse index of a CSV file
+                   (default: no index)
+    """
+    if is_columnar(file_path):
+        return ColumnarTradeWriter(file_path, header, schema)
+
+    return CsvTradeWriter(file_path, header, format_rows=format_rows,
+                          index_key=key_column)
+
+
+def read_last_row(file_path):
+    """Return the last row of a columnar store as a dictionnary, None if
+    the store is empty.
+
+    Positional arguments:
+    file_path -- The path of the columnar store
+
+    Raise IOError if the store does not exist.
+    """
+    return ColumnarStore(file_path).last_row()
+
+
+def recover_file(file_path):
+    """Remove a partially written batch at the end of a trade file, printing
+    a message if something was removed.
+
+    A columnar store repairs itself when opened, so only CSV files are
+    concerned.
+
+    Positional arguments:
+    file_path -- The path of the trade file
+    """
+    if is_columnar(file_path):
+        return
+
+    removed = recover(file_path)
+    if removed:
+        print('Removed ' + str(removed) + ' uncommitted bytes at the end of '
+              '"' + file_path + '"')
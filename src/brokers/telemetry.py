@@ -0,0 +1,373 @@
+# coding: utf8
+
+"""Instrumentation of downloads: counters and stage timings per pair.
+
+For each broker and pair, the time spent in each stage of a download is
+recorded in a latency histogram:
+- throttle: Waiting for the rate limiter
+- network : Sending a request and reading its answer
+- decode  : Parsing the JSON answer
+- build   : Building the typed columns of the trades
+- write   : Writing trades in the output file
+
+Counters record the requests, the failed requests (which are sent again),
+the pages and the trades.
+
+Stats are kept by a registry shared by all threads (see get_telemetry and
+reset), and could be exported periodically to a JSON file or to a Prometheus
+textfile (see start_export). Progress messages (a line per page) go through
+progress, so they could be turned off (see configure).
+"""
+
+import bisect
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Stages of a download, in order
+STAGES = ['throttle', 'network', 'decode', 'build', 'write']
+
+# Counters of a download
+COUNTERS = ['requests', 'failed_requests', 'pages', 'trades']
+
+# Upper bounds (in seconds) of the buckets of the stage histograms
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5,
+           5., 10.]
+
+# Default interval (in seconds) between two exports of the stats
+DEFAULT_EXPORT_INTERVAL = 10.
+
+# Prefix of the Prometheus metrics
+METRIC_PREFIX = 'crypto_downloader_'
+
+# Suffix of a file exported in the Prometheus textfile format
+PROMETHEUS_SUFFIX = '.prom'
+
+
+class Histogram(object):
+    """Latency histogram with fixed buckets."""
+
+    def __init__(self, buckets=BUCKETS):
+        """Create an empty histogram.
+
+        Keyword arguments:
+        buckets -- The sorted upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        """Add a value.
+
+        Positional arguments:
+        value -- The value, in seconds
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return the list of (upper bound, number of values lower or equal
+        to it) tuples, the last upper bound being infinity."""
+        totals = []
+        total = 0
+
+        for bound, count in zip(self.buckets + [float('inf')], self.counts):
+            total += count
+            totals.append((bound, total))
+
+        return totals
+
+
+class _Timer(object):
+    """Context manager recording the time spent in its block in a stage."""
+
+    def __init__(self, telemetry, broker, pair, stage):
+        """Create the timer (see Telemetry.timer)."""
+        self.telemetry = telemetry
+        self.key = (broker, pair, stage)
+        self.start = None
+
+    def __enter__(self):
+        """Start the timer."""
+        self.start = time.time()
+
+    def __exit__(self, *args):
+        """Record the time spent since the timer started."""
+        self.telemetry.observe(*self.key + (time.time() - self.start,))
+
+
+class Telemetry(object):
+    """Counters and stage histograms, per (broker, pair).
+
+    A registry is thread safe, and is meant to be shared by all downloads.
+    """
+
+    def __init__(self):
+        """Create an empty registry."""
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(
+            lambda: dict.fromkeys(COUNTERS, 0))
+        self.histograms = collections.defaultdict(
+            lambda: dict((stage, Histogram()) for stage in STAGES))
+        self.started = {}
+
+    def _start(self, broker, pair):
+        """Record the time of the first event of a pair, the lock being
+        held."""
+        self.started.setdefault((broker, pair), time.time())
+
+    def count(self, broker, pair, name, value=1):
+        """Increment a counter.
+
+        Positional arguments:
+        broker -- The name of the broker
+        pair   -- The pair
+        name   -- The name of the counter (one of COUNTERS)
+
+        Keyword arguments:
+        value  -- The increment
+        """
+        with self.lock:
+            self._start(broker, pair)
+            self.counters[broker, pair][name] += value
+
+    def observe(self, broker, pair, stage, seconds):
+        """Record the time spent in a stage.
+
+        Positional arguments:
+        broker  -- The name of the broker
+        pair    -- The pair
+        stage   -- The stage (one of STAGES)
+        seconds -- The time spent, in seconds
+        """
+        with self.lock:
+            self._start(broker, pair)
+            self.histograms[broker, pair][stage].observe(seconds)
+
+    def timer(self, broker, pair, stage):
+        """Return a context manager recording the time spent in its block
+        in a stage (even if the block raises).
+
+        Positional arguments:
+        broker -- The name of the broker
+        pair   -- The pair
+        stage  -- The stage (one of STAGES)
+        """
+        return _Timer(self, broker, pair, stage)
+
+    def snapshot(self, now=None):
+        """Return the stats as a dictionnary, serializable to JSON.
+
+        Keyword arguments:
+        now -- The current time (default: time.time())
+        """
+        now = time.time() if now is None else now
+
+        with self.lock:
+            pairs = []
+
+            for key in sorted(self.started):
+                counters = dict(self.counters[key])
+                elapsed = now - self.started[key]
+                stages = dict(
+                    (stage, dict(count=histogram.count, sum=histogram.sum,
+                                 buckets=[[bound if bound != float('inf')
+                                           else '+Inf', total]
+                                          for bound, total
+                                          in histogram.cumulative()]))
+                    for stage, histogram in self.histograms[key].items())
+
+                pairs.append(dict(broker=key[0], pair=key[1],
+                                  counters=counters, elapsed=elapsed,
+                                  trades_per_second=(counters['trades'] /
+                                                     elapsed if elapsed > 0
+                                                     else 0.),
+                                  stages=stages))
+
+        return dict(time=now, pairs=pairs)
+
+    def to_prometheus(self, now=None):
+        """Return the stats in the Prometheus text exposition format.
+
+        Keyword arguments:
+        now -- The current time (default: time.time())
+        """
+        snapshot = self.snapshot(now)
+        lines = []
+
+        def labels(pair, **extra):
+            """Return the labels of a sample."""
+            values = [('broker', pair['broker']), ('pair', pair['pair'])]
+            values.extend(sorted(extra.items()))
+            return '{' + ','.join(name + '="' + str(value) + '"'
+                                  for name, value in values) + '}'
+
+        for name in COUNTERS:
+            metric = METRIC_PREFIX + name + '_total'
+            lines.append('# TYPE ' + metric + ' counter')
+            lines.extend(metric + labels(pair) + ' ' +
+                         str(pair['counters'][name])
+                         for pair in snapshot['pairs'])
+
+        metric = METRIC_PREFIX + 'trades_per_second'
+        lines.append('# TYPE ' + metric + ' gauge')
+        lines.extend(metric + labels(pair) + ' ' +
+                     repr(pair['trades_per_second'])
+                     for pair in snapshot['pairs'])
+
+        metric = METRIC_PREFIX + 'stage_seconds'
+        lines.append('# TYPE ' + metric + ' histogram')
+        for pair in snapshot['pairs']:
+            for stage in STAGES:
+                histogram = pair['stages'][stage]
+                lines.extend(metric + '_bucket' +
+                             labels(pair, stage=stage, le=bound) + ' ' +
+                             str(total)
+                             for bound, total in histogram['buckets'])
+                lines.append(metric + '_sum' + labels(pair, stage=stage) +
+                             ' ' + repr(histogram['sum']))
+                lines.append(metric + '_count' + labels(pair, stage=stage) +
+                             ' ' + str(histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Return a list of lines summarizing the stats, one per pair."""
+        lines = []
+
+        for pair in self.snapshot()['pairs']:
+            counters = pair['counters']
+            total = sum(stage['sum'] for stage in pair['stages'].values())
+
+            def share(stage):
+                """Return the share of the stage in the recorded time."""
+                return '%.0f%%' % (100. * pair['stages'][stage]['sum'] /
+                                   total if total else 0.)
+
+            lines.append(pair['broker'] + ' ' + pair['pair'] + ': ' +
+                         str(counters['trades']) + ' trades in ' +
+                         str(counters['pages']) + ' pages (' +
+                         '%.0f' % pair['trades_per_second'] +
+                         ' trades/s), ' + str(counters['failed_requests']) +
+                         ' failed requests - ' +
+                         ', '.join(stage + ': ' + share(stage)
+                                   for stage in STAGES))
+
+        return lines
+
+    def write(self, file_path):
+        """Write the stats in a file, as a Prometheus textfile if its name
+        ends with PROMETHEUS_SUFFIX, else as JSON.
+
+        The stats are written in a temporary file first, then renamed, so
+        the file is never partially written.
+
+        Positional arguments:
+        file_path -- The path of the file
+        """
+        if file_path.endswith(PROMETHEUS_SUFFIX):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as stats_file:
+            stats_file.write(content)
+
+        os.rename(temp_path, file_path)
+
+
+class Exporter(object):
+    """Thread writing the stats of a registry in a file periodically."""
+
+    def __init__(self, telemetry, file_path,
+                 interval=DEFAULT_EXPORT_INTERVAL):
+        """Start the exporter.
+
+        Positional arguments:
+        telemetry -- The registry
+        file_path -- The path of the file (see Telemetry.write)
+
+        Keyword arguments:
+        interval  -- The interval (in seconds) between two exports
+        """
+        self.telemetry = telemetry
+        self.file_path = file_path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        """Export the stats until the exporter is stopped."""
+        while not self.stopped.wait(self.interval):
+            self.telemetry.write(self.file_path)
+
+    def stop(self):
+        """Stop the exporter, and export the stats a last time."""
+        self.stopped.set()
+        self.thread.join()
+        self.telemetry.write(self.file_path)
+
+
+_config = dict(quiet=False)
+_telemetry = Telemetry()
+
+
+def configure(**kwargs):
+    """Configure the progress messages.
+
+    Keyword arguments:
+    quiet -- If True, progress messages are not printed
+    """
+    _config.update(kwargs)
+
+
+def get_telemetry():
+    """Return the registry shared by all downloads."""
+    return _telemetry
+
+
+def reset():
+    """Replace the registry shared by all downloads by an empty one, and
+    return it.
+
+    Exporters started before keep exporting the former registry.
+    """
+    global _telemetry
+    _telemetry = Telemetry()
+
+    return _telemetry
+
+
+def start_export(file_path, interval=DEFAULT_EXPORT_INTERVAL):
+    """Start exporting the shared registry to a file periodically, and
+    return the Exporter (to stop).
+
+    Positional arguments:
+    file_path -- The path of the file (see Telemetry.write)
+
+    Keyword arguments:
+    interval  -- The interval (in seconds) between two exports
+    """
+    return Exporter(_telemetry, file_path, interval)
+
+
+def progress(message):
+    """Print a progress message, unless progress messages are turned off.
+
+    Positional arguments:
+    message -- The message, with its end of line
+    """
+    if not _config['quiet']:
+        sys.stdout.write(message)
+        sys.stdout.flush()
@@ -0,0 +1,403 @@
+# coding: utf8
+
+"""Write trades to a CSV file without pandas.
+
+Each flushed batch is synced to the disk, then committed: its end offset is
+recorded in a commit file (FILE.commit) next to the CSV file. Bytes after the
+committed offset (a batch partially written when the process was killed) are
+removed by recover before the file is appended again.
+
+If the path of the file ends with '.gz' or '.zst', each batch is written as
+an independently compressed frame (see compression). Otherwise, the sparse
+index of the file (see offset_index) is appended with each batch.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from .compression import (codec_of, compress_frame, decompress_frame,
+                          find_last_frame)
+from .offset_index import (DEFAULT_INDEX_BYTES, TIME_COLUMN, append_index,
+                           index_entry, load_index, truncate_index)
+
+
+# Default size (in bytes) of the buffer flushed to the file
+DEFAULT_FLUSH_BYTES = 1 << 20
+
+# Default maximum time (in seconds) between two flushes
+DEFAULT_FLUSH_INTERVAL = 5.
+
+_NANOS_PER_DAY = 24 * 3600 * 10**9
+
+# Suffix of the commit file
+COMMIT_SUFFIX = '.commit'
+
+# Number of bytes before an offset used to compute its hash
+HASH_BYTES = 4096
+
+# Size (in bytes) of the blocks read backward when looking for a torn line
+_TAIL_BLOCK_BYTES = 64 << 10
+
+
+def hash_before(binary_file, offset):
+    """Return the hash of the bytes just before offset.
+
+    Positional arguments:
+    binary_file -- The file, opened in binary mode
+    offset      -- The offset
+    """
+    start = max(0, offset - HASH_BYTES)
+    binary_file.seek(start)
+    return hashlib.sha1(binary_file.read(offset - start)).hexdigest()
+
+
+def _read_commit(file_path):
+    """Return the commit of file_path as a dictionnary, None if there is no
+    valid commit.
+
+    A commit is valid only if the file still contains the bytes it was
+    computed on.
+
+    Positional arguments:
+    file_path -- The CSV file
+    """
+    try:
+        with open(file_path + COMMIT_SUFFIX, 'r') as commit_file:
+            commit = json.load(commit_file)
+
+        with open(file_path, 'rb') as csv_file:
+            csv_file.seek(0, os.SEEK_END)
+            if csv_file.tell() < commit['offset']:
+                return None
+
+            if hash_before(csv_file, commit['offset']) != commit['hash']:
+                return None
+    except (IOError, ValueError, KeyError):
+        return None
+
+    return commit
+
+
+def read_commit(file_path):
+    """Return the committed offset of file_path, None if there is no valid
+    commit.
+
+    Positional arguments:
+    file_path -- The CSV file
+    """
+    commit = _read_commit(file_path)
+    return commit['offset'] if commit else None
+
+
+def write_commit(file_path, offset, frame=None):
+    """Record offset as the committed offset of file_path.
+
+    The commit is written in a temporary file first, then renamed, so it is
+    never partially written.
+
+    Positional arguments:
+    file_path -- The CSV file
+    offset    -- The offset of the end of the last synced batch
+
+    Keyword arguments:
+    frame     -- The offset of the last frame, if the file is compressed
+    """
+    with open(file_path, 'rb') as csv_file:
+        commit = dict(offset=offset, hash=hash_before(csv_file, offset))
+
+    if frame is not None:
+        commit['frame'] = frame
+
+    temp_path = file_path + COMMIT_SUFFIX + '.tmp'
+    with open(temp_path, 'w') as commit_file:
+        json.dump(commit, commit_file)
+
+    os.rename(temp_path, file_path + COMMIT_SUFFIX)
+
+
+def _last_line_end(csv_file, size):
+    """Return the offset just after the last end of line of the file, 0 if
+    there is none.
+
+    The file is read backward by blocks, so only its tail is read.
+
+    Positional arguments:
+    csv_file -- The file, opened in binary mode
+    size     -- The size of the file
+    """
+    end = size
+    while end > 0:
+        start = max(0, end - _TAIL_BLOCK_BYTES)
+        csv_file.seek(start)
+        index = csv_file.read(end - start).rfind('\n')
+
+        if index >= 0:
+            return start + index + 1
+
+        end = start
+
+    return 0
+
+
+def recover(file_path):
+    """Remove the uncommitted tail of the CSV file file_path, and return the
+    number of removed bytes.
+
+    Without a valid commit (file written by a former version, or modified
+    since), only a torn last line (or a torn last frame, if the file is
+    compressed) is removed. Either way, only the tail of the file is read.
+
+    Positional arguments:
+    file_path -- The CSV file
+    """
+    try:
+        size = os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+    offset = read_commit(file_path)
+    codec = codec_of(file_path)
+
+    with open(file_path, 'r+b') as csv_file:
+        if offset is None and codec is None:
+            offset = _last_line_end(csv_file, size)
+        elif offset is None:
+            frame = find_last_frame(csv_file, size, codec)
+            offset = frame[1] if frame else 0
+
+        if offset < size:
+            csv_file.truncate(offset)
+            csv_file.flush()
+            os.fsync(csv_file.fileno())
+
+    if offset < size:
+        truncate_index(file_path, offset)
+
+    return size - offset
+
+
+def read_last_frame(file_path):
+    """Return the decompressed last frame of a compressed CSV file, an empty
+    string if there is none.
+
+    Only the last frame is read.
+
+    Positional arguments:
+    file_path -- The compressed CSV file
+
+    Raise IOError if the file does not exist.
+    """
+    codec = codec_of(file_path)
+    commit = _read_commit(file_path)
+
+    with open(file_path, 'rb') as csv_file:
+        if commit and 'frame' in commit:
+            csv_file.seek(commit['frame'])
+            data = csv_file.read(commit['offset'] - commit['frame'])
+            return decompress_frame(data, codec)[0]
+
+        frame = find_last_frame(csv_file, os.fstat(csv_file.fileno()).st_size,
+                                codec)
+
+    return frame[2] if frame else ''
+
+
+def format_float(value):
+    """Format a float exactly as pandas.DataFrame.to_csv does.
+
+    Positional arguments:
+    value -- The float to format
+    """
+    return repr(float(value))
+
+
+def format_datetimes(timestamps):
+    """Format timestamps exactly as pandas.DataFrame.to_csv does for a
+    datetime index.
+
+    As pandas, the resolution of the fraction of second is the same for all
+    timestamps: the coarsest one (none, milli, micro or nano-second) showing
+    all of them without loss. If all timestamps are at midnight, only dates
+    are written.
+
+    Positional arguments:
+    timestamps -- A list of timestamps (in nano-seconds since epoch)
+    """
+    if all(timestamp % _NANOS_PER_DAY == 0 for timestamp in timestamps):
+        return [time.strftime('%Y-%m-%d', time.gmtime(timestamp // 10**9))
+                for timestamp in timestamps]
+
+    if any(timestamp % 10**3 for timestamp in timestamps):
+        fraction = '.%09d'
+        divisor = 1
+    elif any(timestamp % 10**6 for timestamp in timestamps):
+        fraction = '.%06d'
+        divisor = 10**3
+    elif any(timestamp % 10**9 for timestamp in timestamps):
+        fraction = '.%03d'
+        divisor = 10**6
+    else:
+        fraction = ''
+
+    formatted = []
+    for timestamp in timestamps:
+        seconds, nanos = divmod(timestamp, 10**9)
+        text = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(seconds))
+
+        if fraction:
+            text += fraction % (nanos // divisor)
+
+        formatted.append(text)
+
+    return formatted
+
+
+class CsvTradeWriter(object):
+    """Append trades to a CSV file through a single buffered file handle.
+
+    Rows are formatted by the caller, kept in memory and written to the file
+    by large batches: when the buffer exceeds 'flush_bytes', when
+    'flush_interval' seconds elapsed since the last flush, or when the writer
+    is closed.
+
+    The file is created with the first written row, and the header is
+    written only if the file does not exist yet. Each flush is synced to the
+    disk then committed (see write_commit). If the file is compressed, each
+    flush is a frame.
+
+    If index_key is given and the file is not compressed, a row about every
+    index_bytes bytes is added to the index of the file with each flush.
+    """
+
+    def __init__(self, file_path, header, flush_bytes=DEFAULT_FLUSH_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, format_rows=None,
+                 index_key=None, index_bytes=DEFAULT_INDEX_BYTES):
+        """Open the file.
+
+        Positional arguments:
+        file_path      -- The CSV file where trades are appended
+        header         -- The list of column names
+
+        Keyword arguments:
+        flush_bytes    -- The size (in bytes) of the buffer to flush
+        flush_interval -- The maximum time (in seconds) between two flushes
+        format_rows    -- The function returning rows for typed columns,
+                          required by write_columns
+        index_key      -- The name of the key column of the index (default:
+                          no index)
+        index_bytes    -- The number of bytes between two entries of the
+                          index
+        """
+        self.file_path = file_path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.format_rows = format_rows
+        self.codec = codec_of(file_path)
+
+        self.buffer = []
+        self.buffer_size = 0
+        self.last_flush = time.time()
+        self.file = None
+
+        exists = os.path.isfile(file_path)
+        self.header = None if exists else header
+
+        # Offset of the end of the file, and offset from which the next
+        # line is indexed (None if the file is not indexed)
+        self.offset = os.path.getsize(file_path) if exists else 0
+        self.next_index = None
+        self.index_rows = []
+
+        if index_key is not None and self.codec is None:
+            self.key_index = header.index(index_key)
+            self.time_index = header.index(TIME_COLUMN)
+            self.index_bytes = index_bytes
+
+            # Build the index of a file written without it
+            entries = load_index(file_path, index_key) if self.offset else []
+            self.next_index = (entries[-1][0] + index_bytes if entries else
+                               self.offset + 1)
+
+    def write_rows(self, rows):
+        """Write rows, flushing the buffer if needed.
+
+        Positional arguments:
+        rows -- An iterable on rows. A row is a sequence of strings.
+        """
+        for row in rows:
+            if self.header is not None:
+                header, self.header = self.header, None
+                self.write_rows([header])
+
+            line = ','.join(row) + '\n'
+
+            if (self.next_index is not None and
+                    self.offset + self.buffer_size >= self.next_index):
+                self.index_rows.append((self.offset + self.buffer_size, row))
+                self.next_index = (self.offset + self.buffer_size +
+                                   self.index_bytes)
+
+            self.buffer.append(line)
+            self.buffer_size += len(line)
+
+        if (self.buffer_size >= self.flush_bytes or
+                time.time() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def write_columns(self, columns):
+        """Write trades given as typed columns, formatted by format_rows.
+
+        Positional arguments:
+        columns -- A dictionnary of arrays (see brokers' decode_trades)
+        """
+        self.write_rows(self.format_rows(columns))
+
+    def flush(self):
+        """Write the buffer to the file, sync it and commit it."""
+        if self.buffer:
+            data = ''.join(self.buffer)
+
+            if isinstance(data, unicode):
+                data = data.encode('utf8')
+
+            if self.file is None:
+                self.file = open(self.file_path, 'ab')
+
+            frame = None
+            if self.codec is not None:
+                frame = os.fstat(self.file.fileno()).st_size
+                data = compress_frame(data, self.codec)
+
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.offset = os.fstat(self.file.fileno()).st_size
+
+            append_index(self.file_path,
+                         [index_entry(offset, row, self.key_index,
+                                      self.time_index)
+                          for offset, row in self.index_rows])
+            write_commit(self.file_path, self.offset, frame=frame)
+
+        self.buffer = []
+        self.buffer_size = 0
+        self.index_rows = []
+        self.last_flush = time.time()
+
+    def close(self):
+        """Flush the buffer and close the file."""
+        self.flush()
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        """Return the writer itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the writer."""
+        self.close()
@@ -7,8 +7,10 @@ It writes results in a CSV file.
 """
 import argparse
 from argparse import RawTextHelpFormatter
-import os.path
+import os
 
+from brokers import (batch, follow, http_session, repair, storage,
+                     telemetry)
 from brokers.gdax import GDAX
 from brokers.kraken import Kraken
 
@@ -56,50 +58,273 @@ def main():
         hours (days?) and the result could lead to a hundreds Mio output file.
 
         Before exiting, the program runs a check of the output file and
-        indicates where it detects an issue.
+        indicates where it detects an issue. With --repair, the trades around
+        each issue are downloaded again and merged into the file.
+
+        With --start and/or --end, nothing is downloaded: only the trades of
+        this range (trade IDs on GDAX, timestamps in nano-seconds on Kraken)
+        of the output file are checked, reading only the bytes of the range.
+
+        If several pairs are given, they are downloaded at the same time in
+        this process, the most behind first, and a summary is printed for
+        each pair at the end.
+
+        The time spent waiting for the rate limit, for the network, decoding
+        answers, building columns and writing trades is recorded per pair,
+        and summarized at the end. With --stats-file, these stats are also
+        written periodically as JSON, or as a Prometheus textfile if the
+        file name ends with .prom.
+
+        With --follow, the program does not exit once the missing trades are
+        downloaded: it polls each pair until Ctrl-C, with an interval adapted
+        to the trade rate of the pair, and appends new trades at once. With
+        --bars, the bars of each period are also appended to
+        OUTPUT_DIR/BROKER/PAIR_PERIOD.csv as soon as the period closes.
         """
 
     # Parse CLI arguments
     parser = argparse.ArgumentParser(description=description,
                                      formatter_class=RawTextHelpFormatter)
-    parser.add_argument('broker', help='The broker used to download data')
-    parser.add_argument('pair', help='The pair to trade')
+    parser.add_argument('broker',
+                        help='The broker used to download data. Several\n'
+                             'brokers could be given, separated by commas,\n'
+                             'and wildcards could be used (example: "*")')
+    parser.add_argument('pair',
+                        help='The pair to trade. Several pairs could be\n'
+                             'given, separated by commas, and wildcards\n'
+                             'could be used (example: "BTC-*,*EUR")')
     parser.add_argument('output_dir',
                         help='Output directory. Will be created if needed')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of pages (GDAX) or time shards\n'
+                             '(Kraken) downloaded at the same time\n'
+                             '(default: 1). With --repair, ranges are\n'
+                             'fetched by at least ' +
+                             str(repair.DEFAULT_WORKERS) + ' workers')
+    parser.add_argument('-j', '--jobs', type=int, default=batch.DEFAULT_JOBS,
+                        help='Number of pairs downloaded at the same time,\n'
+                             'when several pairs are given (default: ' +
+                             str(batch.DEFAULT_JOBS) + ')')
+    parser.add_argument('--timeout', type=float,
+                        default=http_session.DEFAULT_TIMEOUT,
+                        help='HTTP timeout in seconds (default: ' +
+                             str(http_session.DEFAULT_TIMEOUT) + ')')
+    parser.add_argument('--no-gzip', action='store_true',
+                        help='Do not ask for gzip compressed responses')
+    parser.add_argument('--full-check', action='store_true',
+                        help='Check the whole output file, instead of only\n'
+                             'trades appended since the last check')
+    parser.add_argument('--repair', action='store_true',
+                        help='Repair an inconsistent CSV output file: fetch\n'
+                             'again the trades around each issue and merge\n'
+                             'them into the file')
+    parser.add_argument('--start', type=int,
+                        help='Only check the output file from this trade ID\n'
+                             '(GDAX) or timestamp (Kraken), without\n'
+                             'downloading anything')
+    parser.add_argument('--end', type=int,
+                        help='Only check the output file until this trade\n'
+                             'ID (GDAX) or timestamp (Kraken), without\n'
+                             'downloading anything')
+    parser.add_argument('--storage', choices=sorted(storage.SUFFIXES),
+                        default='csv',
+                        help='Storage backend (default: csv):\n'
+                             '- csv     : PAIR.csv CSV file\n'
+                             '- gzip    : PAIR.csv.gz CSV file, compressed\n'
+                             '            by independent gzip frames\n'
+                             '- zstd    : PAIR.csv.zst CSV file, compressed\n'
+                             '            by independent zstd frames\n'
+                             '- columnar: PAIR.columns directory of typed\n'
+                             '            columns, partitioned by UTC day')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not print a line per page of trades')
+    parser.add_argument('--stats-file',
+                        help='Write download stats in this file\n'
+                             'periodically (Prometheus textfile if its name\n'
+                             'ends with .prom, else JSON)')
+    parser.add_argument('--stats-interval', type=float,
+                        default=telemetry.DEFAULT_EXPORT_INTERVAL,
+                        help='Interval (in seconds) between two writes of\n'
+                             'the stats file (default: ' +
+                             str(telemetry.DEFAULT_EXPORT_INTERVAL) + ')')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep polling the pairs for new trades until\n'
+                             'Ctrl-C, once the missing trades are\n'
+                             'downloaded')
+    parser.add_argument('--min-interval', type=float,
+                        default=follow.DEFAULT_MIN_INTERVAL,
+                        help='With --follow, minimum interval (in seconds)\n'
+                             'between two polls of a pair (default: ' +
+                             str(follow.DEFAULT_MIN_INTERVAL) + ')')
+    parser.add_argument('--max-interval', type=float,
+                        default=follow.DEFAULT_MAX_INTERVAL,
+                        help='With --follow, maximum interval (in seconds)\n'
+                             'between two polls of a pair (default: ' +
+                             str(follow.DEFAULT_MAX_INTERVAL) + ')')
+    parser.add_argument('--bars', nargs='+', metavar='PERIOD',
+                        help='With --follow, append the bars of these\n'
+                             'periods (dividing a day, example: 1T 1H 1D)\n'
+                             'as soon as they close')
+    parser.add_argument('--bar-delay', type=float,
+                        default=follow.DEFAULT_BAR_DELAY,
+                        help='With --bars, time (in seconds) after the end\n'
+                             'of a period before its bar is written\n'
+                             'without a later trade (default: ' +
+                             str(follow.DEFAULT_BAR_DELAY) + ')')
     args = parser.parse_args()
 
-    broker_str = args.broker
-    pair = args.pair
-    output_dir = os.path.join(args.output_dir, broker_str)
+    if args.bars and not args.follow:
+        parser.error('--bars could only be used with --follow')
+
+    if args.follow and (args.start is not None or args.end is not None):
+        parser.error('--start and --end could not be used with --follow')
+
+    if args.bars:
+        # Bars need pandas, only imported then so downloads start faster
+        import resample
+
+    for period in args.bars or []:
+        try:
+            resample.LiveResampler(period)
+        except ValueError as exception:
+            parser.error(str(exception))
 
     brokers = {'GDAX': GDAX, 'Kraken': Kraken}
 
-    if broker_str not in brokers:
-        print 'broker should be one of: ' + ', '.join(brokers)
+    try:
+        jobs = batch.select_pairs(args.broker.split(','),
+                                  args.pair.split(','), brokers)
+    except ValueError as exception:
+        print(str(exception))
         return
 
-    broker = brokers[broker_str]
+    if args.start is not None or args.end is not None:
+        # Check a range of the output files
+        for broker_str, pair in jobs:
+            output_file = batch.output_file(args.output_dir, broker_str, pair,
+                                            args.storage)
+            if not os.path.exists(output_file):
+                print('"' + output_file + '" does not exist')
+                continue
 
-    if pair not in broker.ALLOWED_PAIRS:
-        print('For the broker ' + broker_str + ', pair should be one of: ' +
-              ', '.join(broker.ALLOWED_PAIRS))
+            brokers[broker_str].print_check_file_consistency(
+                output_file, start=args.start, end=args.end)
         return
 
-    # Create output directory if needed
+    telemetry.configure(quiet=args.quiet)
+    exporter = (telemetry.start_export(args.stats_file, args.stats_interval)
+                if args.stats_file else None)
+
     try:
-        os.makedirs(output_dir)
-    except OSError:
-        # The directory already exists. Do nothing special.
-        pass
+        if args.follow:
+            follow_trades(args, jobs, brokers)
+        else:
+            download(args, jobs, brokers)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+
+
+def print_stats():
+    """Print the summary of HTTP timings, and the stats of each pair."""
+    print(http_session.get_session().stats.summary())
+
+    for line in telemetry.get_telemetry().summary():
+        print(line)
+
+
+def download(args, jobs, brokers):
+    """Download the missing trades of the selected pairs.
+
+    Positional arguments:
+    args    -- The parsed CLI arguments
+    jobs    -- A list of (broker name, pair) tuples
+    brokers -- A dictionnary of brokers, by name
+    """
+    # Keep at least one connection alive per worker
+    http_session.configure(pool_size=max(args.jobs * args.workers,
+                                         http_session.DEFAULT_POOL_SIZE),
+                           timeout=args.timeout, gzip=not args.no_gzip)
+
+    if len(jobs) > 1:
+        # Download all pairs in this process
+        results = batch.download_batch(jobs, args.output_dir,
+                                       storage=args.storage,
+                                       nb_jobs=args.jobs,
+                                       workers=args.workers,
+                                       full_check=args.full_check,
+                                       repair=args.repair,
+                                       brokers=brokers)
 
-    output_file = os.path.join(output_dir, pair + '.csv')
+        print_stats()
+        batch.print_summary(results)
+        return
+
+    broker_str, pair = jobs[0]
+    broker = brokers[broker_str]
+
+    output_file = batch.output_file(args.output_dir, broker_str, pair,
+                                    args.storage)
 
     # Download missing trades
-    broker.download_missing_trades(output_file, pair)
+    batch.download_pair(broker, output_file, pair, workers=args.workers,
+                        full_check=args.full_check, repair=args.repair)
+
+    print_stats()
 
     # Check files consistency
     broker.print_check_file_consistency(output_file)
 
 
+def follow_trades(args, jobs, brokers):
+    """Download the missing trades of the selected pairs, then follow them
+    until Ctrl-C.
+
+    Positional arguments:
+    args    -- The parsed CLI arguments
+    jobs    -- A list of (broker name, pair) tuples
+    brokers -- A dictionnary of brokers, by name
+    """
+    download(args, jobs, brokers)
+
+    followers = []
+    for broker_str, pair in jobs:
+        broker = brokers[broker_str]
+        output_file = batch.output_file(args.output_dir, broker_str, pair,
+                                        args.storage)
+
+        if (os.path.exists(output_file) and
+                broker.check_file_ranges(output_file)):
+            print('Not following ' + broker_str + ' ' + pair + ': "' +
+                  output_file + '" is inconsistent')
+            continue
+
+        on_poll = None
+        if args.bars:
+            import resample
+
+            schema = dict((column['name'], column)
+                          for column in broker.COLUMNAR_SCHEMA)
+            on_poll = resample.bar_writer(output_file, args.bars,
+                                          delay=args.bar_delay,
+                                          tz=schema['time'].get('tz'))
+
+        interval = follow.AdaptiveInterval(args.min_interval,
+                                           args.max_interval)
+        followers.append(follow.PairFollower(broker, output_file, pair,
+                                             on_poll=on_poll,
+                                             interval=interval))
+
+    if not followers:
+        return
+
+    print('Following ' + ', '.join(follower.broker.__name__ + ' ' +
+                                   follower.pair for follower in followers) +
+          ' (Ctrl-C to stop)')
+    follow.follow_pairs(followers)
+
+    print_stats()
+
+
 if __name__ == '__main__':
     main()
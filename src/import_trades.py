@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""This program is useful to import published dumps of trades from GDAX &
+Kraken.
+
+It merges them into the CSV file written by download_trades.
+"""
+import argparse
+from argparse import RawTextHelpFormatter
+
+from brokers import batch, importer
+from brokers.gdax import GDAX
+from brokers.kraken import Kraken
+
+
+def main():
+    """The main function."""
+    description = """This program is useful to import published dumps of
+        trades (CSV files written by download_trades, compressed or not)
+        instead of downloading the whole history.
+
+        The dumps are merged with the output CSV file of the pair, if any, in
+        one streaming pass: trades are sorted by trade ID (GDAX) or timestamp
+        (Kraken), and trades given by several inputs are written once. The
+        trades of the output file are kept first, then the ones of the dumps
+        in the given order.
+
+        The merged file is checked on the way. Missing trades could then be
+        downloaded with download_trades, which resumes from the last imported
+        trade without checking the file again.
+        """
+
+    # Parse CLI arguments
+    parser = argparse.ArgumentParser(description=description,
+                                     formatter_class=RawTextHelpFormatter)
+    parser.add_argument('broker',
+                        help='The broker of the trades (GDAX or Kraken)')
+    parser.add_argument('pair', help='The pair of the trades')
+    parser.add_argument('output_dir',
+                        help='Output directory. Will be created if needed')
+    parser.add_argument('dumps', nargs='+',
+                        help='The dumps to import (.csv, .csv.gz or\n'
+                             '.csv.zst files)')
+    parser.add_argument('--chunk-size', type=int,
+                        default=importer.DEFAULT_CHUNK_BYTES >> 20,
+                        help='Size (in MiB) of the chunks read from each\n'
+                             'input (default: ' +
+                             str(importer.DEFAULT_CHUNK_BYTES >> 20) + ')')
+    args = parser.parse_args()
+
+    brokers = {'GDAX': GDAX, 'Kraken': Kraken}
+
+    try:
+        jobs = batch.select_pairs([args.broker], [args.pair], brokers)
+    except ValueError as exception:
+        print(str(exception))
+        return
+
+    if len(jobs) > 1:
+        print('Dumps are imported for a single pair, not ' +
+              ', '.join(broker_str + ' ' + pair for broker_str, pair in jobs))
+        return
+
+    broker_str, pair = jobs[0]
+    broker = brokers[broker_str]
+    output_file = batch.output_file(args.output_dir, broker_str, pair)
+
+    try:
+        nb_lines, issues = importer.import_dumps(
+            broker, output_file, args.dumps,
+            chunk_bytes=args.chunk_size << 20)
+    except ValueError as exception:
+        print(str(exception))
+        return
+
+    print('Imported ' + str(len(args.dumps)) + ' dump(s) into "' +
+          output_file + '": ' + str(nb_lines) + ' trades written')
+
+    if issues:
+        print('Errors detected in file "' + output_file + '" at trades: ' +
+              ', '.join(broker.format_issue(*issue) for issue in issues))
+        print('Please run download_trades with --repair to fix them')
+    else:
+        print('No error detected in "' + output_file + '"')
+
+
+if __name__ == '__main__':
+    main()
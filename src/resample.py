@@ -9,15 +9,181 @@ time,open,high,low,close,volume
 import argparse
 from argparse import RawTextHelpFormatter
 import csv
+import io
+import itertools
+import json
+import multiprocessing
+import numpy as np
 import os
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
 import sys
+import time
+
+from brokers.columnar import ColumnarStore
+from brokers.compression import codec_of, open_trade_file
+from brokers.decode import datetime_column
+from brokers.follow import DEFAULT_BAR_DELAY
+from brokers.offset_index import find_range, load_index, parse_time
+from brokers.storage import is_columnar, read_last_line
 
 
 _MANDATORY_COLS = {'price', 'size', 'time'}
 
+# Types of the columns of trades loaded with compact=True: prices and sizes
+# keep about 7 significant digits
+COMPACT_DTYPES = dict(price=np.float32, size=np.float32, side='category',
+                      type='category')
+
+# Key columns of the sparse index of a CSV file, the first one found in the
+# header being used
+KEY_COLS = ['trade_id', 'timestamp']
+
+# Default number of trades read at once by the chunked resampler
+DEFAULT_CHUNK_ROWS = 1000000
+
+_DAY_NANOS = 24 * 3600 * 10**9
+
+# Suffix of the state file saved next to an output file by
+# resample_incremental
+STATE_SUFFIX = '.state'
+
+# Default number of processes of the parallel resampler
+DEFAULT_JOBS = multiprocessing.cpu_count()
+
+# Number of shards per process of the parallel resampler, so processes stay
+# busy when shards hold different numbers of trades
+SHARDS_PER_JOB = 4
+
+
+def _check_header(file_path):
+    """Raise RuntimeError if the header of a CSV file misses a mandatory
+    column.
+
+    Positional arguments:
+    file_path -- The path of the CSV file
+    """
+    with open_trade_file(file_path) as csv_file:
+        reader = csv.reader(csv_file)
+        header = reader.next()
+        if set(header) & _MANDATORY_COLS != _MANDATORY_COLS:
+            msg = (file_path + " contain the following header: " +
+                   ", ".join(_MANDATORY_COLS))
+            raise RuntimeError(msg)
+
+
+def _store_data_frame(store, columns):
+    """Return a pandas data frame from columns read in a columnar store.
+
+    Positional arguments:
+    store   -- The columnar store
+    columns -- The time, price and size columns, as numpy arrays
+    """
+    index = pd.DatetimeIndex(columns.pop('time'), name='time',
+                             tz=store.timezone('time'))
+    return pd.DataFrame(columns, index=index, columns=['price', 'size'])
+
+
+def read_trades(csv_file, names=None, usecols=None, compact=False):
+    """Return the trades of CSV lines as a data frame indexed by time.
+
+    Times are parsed by datetime_column, much faster than by read_csv
+    (parse_dates). As read_csv, the index is in UTC if times end with 'Z'
+    (GDAX), naive else (Kraken).
+
+    Positional arguments:
+    csv_file -- A file object or a path
+
+    Keyword arguments:
+    names    -- The names of the columns (default: read from the header)
+    usecols  -- The columns to read, time included (default: all columns)
+    compact  -- If True, read prices and sizes as float32 and sides as
+                categories
+    """
+    df = pd.read_csv(csv_file, header=None if names else 'infer',
+                     names=names, usecols=usecols,
+                     dtype=COMPACT_DTYPES if compact else None)
+
+    times = df.pop('time').values
+    df.index = pd.DatetimeIndex(datetime_column(times), name='time')
+
+    if len(times) and times[0].endswith('Z'):
+        df.index = df.index.tz_localize('UTC')
+
+    return df
+
+
+def time_value(time):
+    """Return the nano-seconds since epoch of a time, None if time is None.
+
+    Positional arguments:
+    time -- A time, as a string (like '2018-01-31 12:00', naive times being
+            UTC) or a pandas timestamp
+    """
+    return None if time is None else pd.Timestamp(time).value
+
+
+def utc_day(time):
+    """Return the UTC day of a time formatted as YYYY-MM-DD, None if time is
+    None.
+
+    Positional arguments:
+    time -- A time (see time_value)
+    """
+    if time is None:
+        return None
+
+    return pd.Timestamp(time_value(time)).strftime('%Y-%m-%d')
+
+
+def select_times(df, start=None, end=None):
+    """Return the trades of df from start to end (both included).
+
+    Positional arguments:
+    df    -- A data frame of trades, indexed by time
+
+    Keyword arguments:
+    start -- The first time (default: no lower bound)
+    end   -- The last time (default: no upper bound)
+    """
+    times = df.index.asi8
+    mask = np.ones(len(df), dtype=bool)
+
+    if start is not None:
+        mask &= times >= time_value(start)
 
-def load_file(file_path):
+    if end is not None:
+        mask &= times <= time_value(end)
+
+    return df if mask.all() else df[mask]
+
+
+def _csv_range(file_path, start=None, end=None):
+    """Return (start offset, end offset) of the bytes of a CSV file holding
+    the trades from start to end, from the sparse index of the file (built if
+    needed). An offset is None if the file should be read from its first
+    line, or until its end.
+
+    Positional arguments:
+    file_path -- The path of the CSV file
+
+    Keyword arguments:
+    start     -- The first time (default: no lower bound)
+    end       -- The last time (default: no upper bound)
+    """
+    with open_trade_file(file_path) as csv_file:
+        header = csv_file.readline().rstrip('\r\n').split(',')
+
+    keys = [column for column in KEY_COLS if column in header]
+    if not keys:
+        return None, None
+
+    return find_range(load_index(file_path, keys[0]), 'time',
+                      time_value(start), time_value(end))
+
+
+def load_file(file_path, start=None, end=None, compact=False):
     """Load a CSV file and return a pandas dataframe.
 
     The input file should be a CSV file with the following data:
@@ -25,26 +191,214 @@ def load_file(file_path):
 
     trade_id should be a contiguous number.
 
+    The input file could also be a compressed CSV file (PAIR.csv.gz or
+    PAIR.csv.zst), decompressed on the fly, or a columnar store
+    (PAIR.columns): only the needed columns are then read.
+
+    If start or end is given, only the trades of this time range are
+    returned, and only the bytes of the range are read thanks to the sparse
+    index of the file (or only the days of the range of a columnar store).
+
     Raise ValueError if a issue is detected with trade_id
     Raise RuntimeError if an issue is detected with header
 
     Positional arguments:
     file_path -- The path of the file to read
+
+    Keyword arguments:
+    start     -- The first time (default: no lower bound), like
+                 '2018-01-31 12:00' (UTC)
+    end       -- The last time (default: no upper bound)
+    compact   -- If True, prices and sizes are float32 (about 7 significant
+                 digits), halving the memory of the data frame
     """
 
+    if is_columnar(file_path):
+        store = ColumnarStore(file_path)
+        columns = store.read(columns=['time', 'price', 'size'],
+                             start=utc_day(start), end=utc_day(end))
+
+        if compact:
+            for name in ['price', 'size']:
+                columns[name] = columns[name].astype(COMPACT_DTYPES[name])
+
+        return select_times(_store_data_frame(store, columns), start, end)
+
     # Check the header
-    with open(file_path, 'r') as csv_file:
-        reader = csv.reader(csv_file)
-        header = reader.next()
-        if set(header) & _MANDATORY_COLS != _MANDATORY_COLS:
-            msg = (file_path + " contain the following header: " +
-                   ", ".join(_MANDATORY_COLS))
-            raise RuntimeError(msg)
+    _check_header(file_path)
 
-    df = pd.read_csv(file_path, usecols=_MANDATORY_COLS, index_col='time',
-                     parse_dates=True)
+    if start is None and end is None:
+        with open_trade_file(file_path) as csv_file:
+            return read_trades(csv_file, usecols=_MANDATORY_COLS,
+                               compact=compact)
 
-    return df
+    offset, end_offset = _csv_range(file_path, start, end)
+
+    with open_trade_file(file_path) as csv_file:
+        names = csv_file.readline().rstrip('\r\n').split(',')
+
+        if offset is not None:
+            csv_file.seek(offset)
+
+        if end_offset is None:
+            data = csv_file.read()
+        else:
+            data = csv_file.read(end_offset - csv_file.tell())
+
+    df = read_trades(io.BytesIO(data), names, _MANDATORY_COLS, compact)
+    return select_times(df, start, end)
+
+
+def _aggregate(df, offset, base=0):
+    """Return the open, high, low, close and volume of each period, without
+    filling empty periods.
+
+    Positional arguments:
+    df     -- The pandas data frame to resample
+    offset -- The resampling period, as a pandas offset
+
+    Keyword arguments:
+    base   -- The origin of periods (see pandas.DataFrame.resample)
+    """
+    resampler = df.resample(offset, base=base)
+    ohlc = resampler['price'].ohlc()
+
+    return pd.DataFrame(dict(open=ohlc.open, high=ohlc.high, low=ohlc.low,
+                             close=ohlc.close,
+                             volume=resampler['size'].sum()))
+
+
+def _base(offset, origin, first_day):
+    """Return the base (see pandas.DataFrame.resample) aligning periods of
+    offset on origin, for trades starting on first_day.
+
+    Positional arguments:
+    offset    -- The resampling period, as a pandas tick offset
+    origin    -- The origin of periods, a midnight in nano-seconds since
+                 epoch
+    first_day -- The midnight of the first trade, in nano-seconds since
+                 epoch
+    """
+    shift = (origin - first_day) % offset.nanos
+    return shift // (offset.nanos // offset.n)
+
+
+def _aggregate_bars(bars, offset):
+    """Return the open, high, low, close and volume of each period, computed
+    from bars of a shorter period, without filling empty periods.
+
+    Positional arguments:
+    bars   -- The data frame returned by _aggregate for the shorter period
+    offset -- The resampling period, as a pandas offset
+    """
+    resampler = bars.resample(offset)
+
+    return pd.DataFrame(dict(open=resampler['open'].first(),
+                             high=resampler['high'].max(),
+                             low=resampler['low'].min(),
+                             close=resampler['close'].last(),
+                             volume=resampler['volume'].sum()))
+
+
+def _duration(offset):
+    """Return the approximative duration of a period, in nano-seconds.
+
+    Positional arguments:
+    offset -- The period, as a pandas offset
+    """
+    if isinstance(offset, Tick):
+        return offset.nanos
+
+    start = pd.Timestamp('2000-01-01') + offset
+    return ((start + offset) - start).value
+
+
+def _nests(short, offset):
+    """Return True if each period of offset is made of whole periods of
+    short, so bars of offset could be computed from bars of short.
+
+    Positional arguments:
+    short  -- The shorter period, as a pandas offset
+    offset -- The longer period, as a pandas offset
+    """
+    if not isinstance(short, Tick):
+        return False
+
+    if isinstance(offset, Tick):
+        return offset.nanos % short.nanos == 0
+
+    # Periods of offset should start and end at midnight (like weeks or
+    # months, unlike business hours), and periods of short should never
+    # span midnight
+    edge = pd.Timestamp('2000-01-01') + offset
+    return (_DAY_NANOS % short.nanos == 0 and edge == edge.normalize() and
+            edge + offset == (edge + offset).normalize())
+
+
+def _cascade(periods, aggregate):
+    """Return a dictionnary of bars (not filled), by period.
+
+    Bars of a period are computed from the bars of the longest shorter
+    period nesting in it, or by aggregate if there is none.
+
+    Positional arguments:
+    periods   -- The list of resampling periods
+    aggregate -- A function returning the bars of a period (as a pandas
+                 offset) from trades
+    """
+    offsets = dict((period, to_offset(period)) for period in periods)
+    bars = {}
+
+    for period in sorted(offsets, key=lambda period:
+                         _duration(offsets[period])):
+        offset = offsets[period]
+        shorts = [short for short in bars if _nests(offsets[short], offset)]
+
+        if shorts:
+            short = max(shorts, key=lambda short: _duration(offsets[short]))
+            bars[period] = _aggregate_bars(bars[short], offset)
+        else:
+            bars[period] = aggregate(offset)
+
+    return bars
+
+
+def _fill_empty(re_df, previous_close=None):
+    """Fill empty periods as resample does, and return re_df.
+
+    Positional arguments:
+    re_df          -- The data frame returned by _aggregate
+
+    Keyword arguments:
+    previous_close -- The close of the period before re_df
+    """
+    re_df['close'] = re_df.close.fillna(method='ffill')
+    if previous_close is not None:
+        re_df['close'] = re_df.close.fillna(previous_close)
+
+    re_df['volume'] = re_df.volume.fillna(0)
+
+    empty = re_df.open.isnull()
+    for column in ['open', 'high', 'low']:
+        re_df.loc[empty, column] = re_df.close[empty]
+
+    return re_df
+
+
+def _resample_periods(period, aggregate):
+    """Return the resampled data frame of period, or a dictionnary of
+    resampled data frames by period if period is a list.
+
+    Positional arguments:
+    period    -- The resampling period, or a list of periods
+    aggregate -- A function returning the bars of a period (as a pandas
+                 offset) from trades
+    """
+    periods = [period] if isinstance(period, basestring) else period
+    bars = _cascade(periods, aggregate)
+
+    re_dfs = dict((name, _fill_empty(bars[name])) for name in periods)
+    return re_dfs[period] if isinstance(period, basestring) else re_dfs
 
 
 def resample(df, period):
@@ -53,45 +407,944 @@ def resample(df, period):
     Return a resampled data frame with the following columns:
     time, open, high, low, close, volume
 
+    If period is a list, return a dictionnary of resampled data frames, by
+    period. Trades are then aggregated only for the shortest periods: bars of
+    a longer period are computed from the bars of a shorter one when its
+    periods are made of whole shorter periods (for example 1H from 5T, or 1W
+    from 1D). Volumes could then differ from a direct resampling by rounding
+    errors.
+
     Positional argument:
     df     -- The pandas data frame to resample
+    period -- The resampling period, or a list of periods
+    """
+    return _resample_periods(period, lambda offset: _aggregate(df, offset))
+
+
+def _iter_csv_chunks(file_path, chunk_rows, offset=None, end=None):
+    """Yield (trades, positions) for each chunk of a CSV file.
+
+    trades is a pandas data frame (as returned by load_file), positions a
+    numpy array with the offset (in bytes) of the line of each trade. A last
+    line which is not terminated (being written) is ignored.
+
+    Offsets of a compressed file are offsets in the decompressed stream.
+
+    Positional arguments:
+    file_path  -- The path of the CSV file
+    chunk_rows -- The maximum number of trades of a chunk
+
+    Keyword arguments:
+    offset     -- The offset of the first line to read (default: the line
+                  after the header)
+    end        -- The offset of the first line not to read (default: the end
+                  of the file)
+    """
+    _check_header(file_path)
+
+    with open_trade_file(file_path) as csv_file:
+        names = csv_file.readline().rstrip('\r\n').split(',')
+
+        if offset is None:
+            offset = csv_file.tell()
+
+        csv_file.seek(offset)
+
+        while end is None or offset < end:
+            lines = list(itertools.islice(csv_file, chunk_rows))
+
+            if lines and not lines[-1].endswith('\n'):
+                lines.pop()
+
+            if not lines:
+                return
+
+            positions = offset + np.cumsum([0] + [len(line)
+                                                  for line in lines])
+
+            if end is not None and positions[-1] > end:
+                # Lines after end
+                del lines[np.searchsorted(positions, end):]
+                positions = positions[:len(lines) + 1]
+
+            offset = positions[-1]
+
+            df = read_trades(io.BytesIO(''.join(lines)), names,
+                             _MANDATORY_COLS)
+            yield df, positions[:-1]
+
+
+def _iter_store_chunks(file_path, chunk_rows, offset=None, start=None,
+                       end=None):
+    """Yield (trades, positions) for each chunk of a columnar store.
+
+    trades is a pandas data frame (as returned by load_file), positions a
+    numpy array with the row number (in the whole store) of each trade.
+
+    Positional arguments:
+    file_path  -- The path of the columnar store
+    chunk_rows -- The maximum number of trades of a chunk
+
+    Keyword arguments:
+    offset     -- The row number of the first trade to read (default: 0)
+    start      -- The first day to read, formatted as YYYY-MM-DD
+    end        -- The last day to read, formatted as YYYY-MM-DD
+    """
+    store = ColumnarStore(file_path)
+    offset = offset or 0
+    first_row = 0
+
+    for partition in store.partitions():
+        nb_rows = store.nb_rows(partition)
+
+        # Do not read partitions before offset, or outside the days
+        if (first_row + nb_rows > offset and
+                (start is None or partition >= start) and
+                (end is None or partition <= end)):
+            columns = store.read(columns=['time', 'price', 'size'],
+                                 start=partition, end=partition)
+
+            for start in range(max(0, offset - first_row), nb_rows,
+                               chunk_rows):
+                df = _store_data_frame(store, dict(
+                    (name, column[start:start + chunk_rows])
+                    for name, column in columns.items()))
+                yield df, first_row + start + np.arange(len(df))
+
+        first_row += nb_rows
+
+
+def _iter_chunks(file_path, chunk_rows, offset=None):
+    """Yield (trades, positions) for each chunk of a file (see
+    _iter_csv_chunks and _iter_store_chunks).
+
+    Positional arguments:
+    file_path  -- The path of the file (CSV file or columnar store)
+    chunk_rows -- The maximum number of trades of a chunk
+
+    Keyword arguments:
+    offset     -- The position of the first trade to read
+    """
+    if is_columnar(file_path):
+        return _iter_store_chunks(file_path, chunk_rows, offset)
+
+    return _iter_csv_chunks(file_path, chunk_rows, offset)
+
+
+def iter_chunks(file_path, chunk_rows=DEFAULT_CHUNK_ROWS, start=None,
+                end=None):
+    """Yield the trades of a file as pandas data frames of up to chunk_rows
+    trades, with the same shape as the data frame returned by load_file.
+
+    If start or end is given, only the trades of this time range are
+    yielded (see load_file).
+
+    Raise RuntimeError if an issue is detected with header
+
+    Positional arguments:
+    file_path  -- The path of the file to read (CSV file or columnar store)
+
+    Keyword arguments:
+    chunk_rows -- The maximum number of trades of a chunk
+    start      -- The first time (default: no lower bound)
+    end        -- The last time (default: no upper bound)
+    """
+    if start is None and end is None:
+        for df, _ in _iter_chunks(file_path, chunk_rows):
+            yield df
+        return
+
+    if is_columnar(file_path):
+        chunks = _iter_store_chunks(file_path, chunk_rows,
+                                    start=utc_day(start), end=utc_day(end))
+    else:
+        offset, end_offset = _csv_range(file_path, start, end)
+        chunks = _iter_csv_chunks(file_path, chunk_rows, offset, end_offset)
+
+    for df, _ in chunks:
+        df = select_times(df, start, end)
+        if len(df):
+            yield df
+
+
+class _ChunkResampler(object):
+    """Resample trades given chunk by chunk.
+
+    The last period of a chunk may continue in the next chunk: it is carried
+    to the next chunk as 4 trades (its open, high, low and close, the first
+    one with its volume), so the result does not depend on chunk boundaries.
+
+    If positions of trades are given, the position of the first trade of the
+    last period is kept, so the resampling could be resumed from it.
+    """
+
+    def __init__(self, period, origin=None):
+        """Create the resampler.
+
+        Positional arguments:
+        period -- The resampling period
+
+        Keyword arguments:
+        origin -- The midnight of the first trade, in nano-seconds since
+                  epoch: the origin of periods, for periods shorter than a
+                  day (default: computed from the first chunk)
+        """
+        self.offset = to_offset(period)
+        self.origin = origin
+
+        self.last_bars = None
+        self.last_time = None
+
+        # Position and time of the first trade of the last period
+        self.position = None
+        self.position_time = None
+
+    def add(self, df, positions=None):
+        """Add a chunk of trades, and return the bars (not filled) of the
+        periods it completes, None if there is none.
+
+        Raise ValueError if the chunk contains a trade older than the last
+        trade of the previous chunk.
+
+        Positional arguments:
+        df        -- The trades, as returned by load_file
+
+        Keyword arguments:
+        positions -- The positions of the trades
+        """
+        if df.empty:
+            return None
+
+        if self.origin is None:
+            self.origin = df.index.min().normalize().value
+        elif self.last_time is not None and df.index.min() < self.last_time:
+            raise ValueError('Trades should be sorted by time, but a trade '
+                             'at ' + str(df.index.min()) + ' follows a '
+                             'trade at ' + str(self.last_time))
+
+        times = df.index.values
+        first_chunk = self.last_bars is None
+
+        if not first_chunk:
+            last_bar = self.last_bars.iloc[0]
+            index = pd.DatetimeIndex([self.last_time] * 4,
+                                     name=df.index.name)
+            carried = pd.DataFrame(dict(price=[last_bar.open, last_bar.high,
+                                               last_bar.low, last_bar.close],
+                                        size=[last_bar.volume, 0., 0., 0.]),
+                                   index=index, columns=df.columns)
+            df = pd.concat([carried, df])
+
+        # Align periods on the origin, whatever the first trade of the chunk
+        base = 0
+        if isinstance(self.offset, Tick):
+            first_day = df.index.min().normalize().value
+            base = _base(self.offset, self.origin, first_day)
+
+        re_df = _aggregate(df, self.offset, base)
+
+        self.last_bars = re_df.iloc[-1:]
+        self.last_time = df.index.max()
+
+        if positions is not None and (len(re_df) > 1 or first_chunk):
+            # Trades of the last period are the last ones of the chunk, if
+            # trades are sorted
+            sizes = df.resample(self.offset, base=base).size()
+            first = len(times) - sizes.iloc[-1]
+
+            if first > 0 and times[:first].max() >= times[first:].min():
+                self.position = self.position_time = None
+            else:
+                self.position = positions[first].item()
+                self.position_time = times[first].astype('int64').item()
+
+        if len(re_df) > 1:
+            return re_df.iloc[:-1].copy()
+
+        return None
+
+
+def iter_resample(chunks, period, fill=True):
+    """Resample trades given by chunks, and yield the resampled data frames.
+
+    The concatenation of the yielded data frames is identical to the data
+    frame returned by resample on all trades at once, while only one chunk
+    is in memory.
+
+    Raise ValueError if a chunk contains a trade older than the last trade of
+    the previous chunk.
+
+    Positional arguments:
+    chunks -- An iterable on pandas data frames, as returned by iter_chunks
     period -- The resampling period
+
+    Keyword arguments:
+    fill   -- If False, empty periods are not filled (their values are NaN)
+    """
+    resampler = _ChunkResampler(period)
+    previous_close = None
+
+    for df in chunks:
+        re_df = resampler.add(df)
+
+        if re_df is not None:
+            if fill:
+                re_df = _fill_empty(re_df, previous_close)
+                previous_close = re_df.close.iloc[-1]
+
+            yield re_df
+
+    if resampler.last_bars is not None:
+        last_bars = resampler.last_bars.copy()
+        yield _fill_empty(last_bars, previous_close) if fill else last_bars
+
+
+def resample_file(file_path, period, chunk_rows=DEFAULT_CHUNK_ROWS,
+                  start=None, end=None):
+    """Resample a file by chunks of trades.
+
+    Return the same result as resample(load_file(file_path, start, end),
+    period), while at most chunk_rows trades are in memory. The file is read
+    once per period which could not be computed from a shorter one (see
+    resample).
+
+    Positional arguments:
+    file_path  -- The path of the file to read (CSV file or columnar store)
+    period     -- The resampling period, or a list of periods
+
+    Keyword arguments:
+    chunk_rows -- The maximum number of trades read at once
+    start      -- The first time (default: no lower bound)
+    end        -- The last time (default: no upper bound)
+    """
+    def aggregate(offset):
+        """Return the bars (not filled) of a period, from the file."""
+        chunks = iter_chunks(file_path, chunk_rows, start, end)
+        bars = list(iter_resample(chunks, offset, fill=False))
+
+        if not bars:
+            return _aggregate(load_file(file_path, start, end), offset)
+
+        return pd.concat(bars)
+
+    return _resample_periods(period, aggregate)
+
+
+def _time_range(file_path, start=None, end=None):
+    """Return (first, last) in nano-seconds since epoch, first being the time
+    of the first trade of a file from start to end, and last the time of the
+    last one, or end if it is earlier. Return (None, None) if there is no
+    trade.
+
+    Only the first trades and the last line of the file are read.
+
+    Positional arguments:
+    file_path -- The path of the file (CSV file or columnar store)
+
+    Keyword arguments:
+    start     -- The first time (default: no lower bound)
+    end       -- The last time (default: no upper bound)
+    """
+    chunks = iter_chunks(file_path, 1000, start, end)
+    df = next(chunks, None)
+    chunks.close()
+
+    if df is None or df.empty:
+        return None, None
+
+    first = df.index.asi8[0].item()
+
+    if is_columnar(file_path):
+        last = ColumnarStore(file_path).last_row()['time']
+    else:
+        with open_trade_file(file_path) as csv_file:
+            names = csv_file.readline().rstrip('\r\n').split(',')
+
+        row = read_last_line(file_path).split(',')
+        last = parse_time(row[names.index('time')])
+
+    if end is not None:
+        last = min(last, time_value(end))
+
+    return first, last
+
+
+def _aggregate_shard(task):
+    """Return the bars (not filled) of a shard of a file, None if it has no
+    trade.
+
+    Positional arguments:
+    task -- A (file path, offset, origin, start, end) tuple: the periods of
+            offset are aligned on origin, and the shard holds the trades
+            from start to end (both in nano-seconds since epoch, included)
+    """
+    file_path, offset, origin, start, end = task
+    df = load_file(file_path, start, end)
+
+    if df.empty:
+        return None
+
+    first_day = df.index.min().normalize().value
+    return _aggregate(df, offset, _base(offset, origin, first_day))
+
+
+def resample_parallel(file_path, period, jobs=DEFAULT_JOBS, start=None,
+                      end=None):
+    """Resample a file in parallel, by shards of time.
+
+    Return the same result as resample(load_file(file_path, start, end),
+    period). The time range of the trades is split into shards made of whole
+    periods, SHARDS_PER_JOB per process: each process loads the trades of
+    its shards only (thanks to the sparse index of a CSV file), and
+    aggregates them. Bars of the shards are then concatenated, and empty
+    periods, including the ones at the edges of shards, are filled as a
+    whole, so closes are forward-filled across shards.
+
+    Only periods of fixed duration (like 1S, 5T, 1H or 1D) are sharded.
+    Other periods (like W or M) are computed from the bars of a shorter
+    period if possible (see resample), else from all trades in this process.
+
+    Positional arguments:
+    file_path -- The path of the file to read (CSV file or columnar store)
+    period    -- The resampling period, or a list of periods
+
+    Keyword arguments:
+    jobs      -- The number of processes
+    start     -- The first time (default: no lower bound)
+    end       -- The last time (default: no upper bound)
+    """
+    first, last = _time_range(file_path, start, end)
+    pool = multiprocessing.Pool(jobs)
+
+    def aggregate(offset):
+        """Return the bars (not filled) of a period, from the shards."""
+        if first is None or not isinstance(offset, Tick):
+            return _aggregate(load_file(file_path, start, end), offset)
+
+        # Periods are aligned on the midnight of the first trade, as pandas
+        # does. Shards are made of whole periods.
+        origin = pd.Timestamp(first).normalize().value
+        shard = -(-(last - first + 1) // (jobs * SHARDS_PER_JOB))
+        shard = -(-shard // offset.nanos) * offset.nanos
+        first_edge = origin + (first - origin) // shard * shard
+
+        tasks = [(file_path, offset, origin, max(edge, first),
+                  min(edge + shard - 1, last))
+                 for edge in range(first_edge, last + 1, shard)]
+        bars = pd.concat([shard_bars for shard_bars
+                          in pool.imap(_aggregate_shard, tasks)
+                          if shard_bars is not None])
+
+        # Empty periods between shards
+        return bars.reindex(pd.date_range(bars.index[0], bars.index[-1],
+                                          freq=offset,
+                                          name=bars.index.name))
+
+    try:
+        return _resample_periods(period, aggregate)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _read_state(output_file, period):
+    """Return the state saved with an output file as a dictionnary, None if
+    there is no valid state.
+
+    Positional arguments:
+    output_file -- The output CSV file
+    period      -- The resampling period of the output file
+    """
+    try:
+        with open(output_file + STATE_SUFFIX, 'r') as state_file:
+            state = json.load(state_file)
+
+        if (state['period'] != period or
+                os.path.getsize(output_file) < state['size']):
+            return None
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    return state
+
+
+def _write_state(output_file, state):
+    """Save the state of an output file, or remove it if state is None.
+
+    The state is written in a temporary file first, then renamed, so it is
+    never partially written.
+
+    Positional arguments:
+    output_file -- The output CSV file
+    state       -- The state, as a dictionnary
+    """
+    state_path = output_file + STATE_SUFFIX
+
+    if state is None:
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return
+
+    with open(state_path + '.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+
+    os.rename(state_path + '.tmp', state_path)
+
+
+def _date_format(line):
+    """Return the date format of the index of an output file, from one of
+    its lines, as given to pandas.DataFrame.to_csv.
+
+    Raise ValueError if times have a fraction of second: the resolution of
+    the whole file (chosen by pandas) could then change with new bars.
+
+    Positional arguments:
+    line -- A line of the output file (not the header)
+    """
+    label = line.split(',')[0]
+
+    if '.' in label:
+        raise ValueError('Times with a fraction of second')
+    elif len(label) == 10:
+        return '%Y-%m-%d'
+    elif '+' in label:
+        # Time zone aware times: let pandas format them
+        return None
+
+    return '%Y-%m-%d %H:%M:%S'
+
+
+def _last_line_offset(file_path):
+    """Return the offset of the last line of a file.
+
+    Positional arguments:
+    file_path -- The path of the file
+    """
+    with open(file_path, 'rb') as out_file:
+        out_file.seek(0, os.SEEK_END)
+        size = out_file.tell()
+        out_file.seek(max(0, size - 4096))
+        tail = out_file.read()
+
+    return size - len(tail) + tail.rstrip('\n').rfind('\n') + 1
+
+
+def _resample_from(file_path, period, chunk_rows, state=None):
+    """Resample trades of a file, and return (bars, state).
+
+    bars is a list of filled data frames, state the state to resume the
+    resampling from the last period (None if it could not be resumed).
+
+    Positional arguments:
+    file_path  -- The path of the file (CSV file or columnar store)
+    period     -- The resampling period
+    chunk_rows -- The maximum number of trades read at once
+
+    Keyword arguments:
+    state      -- A state returned by a previous call: only trades from the
+                  last period of this call are read
     """
-    resampler = df.resample(period)
-    price = resampler['price']
-    volume = resampler['size']
+    if state is None:
+        resampler = _ChunkResampler(period)
+        previous_close = None
+        chunks = _iter_chunks(file_path, chunk_rows)
+    else:
+        resampler = _ChunkResampler(period, state['origin'])
+        previous_close = state['close']
+        chunks = _iter_chunks(file_path, chunk_rows, state['offset'])
+
+    re_dfs = []
+    for df, positions in chunks:
+        if state is not None and not re_dfs and resampler.last_bars is None:
+            # The file should be unchanged before the saved offset
+            if df.empty or df.index.values[0].astype('int64') != \
+                    state['time']:
+                raise _StateError()
+
+        re_df = resampler.add(df, positions)
+
+        if re_df is not None:
+            re_dfs.append(_fill_empty(re_df, previous_close))
+            previous_close = re_dfs[-1].close.iloc[-1]
+
+    if resampler.last_bars is None:
+        if state is not None:
+            raise _StateError()
+
+        return re_dfs, None
+
+    re_dfs.append(_fill_empty(resampler.last_bars.copy(), previous_close))
+
+    if resampler.position is None:
+        return re_dfs, None
 
-    opn = price.first()
-    high = price.max()
-    low = price.min()
-    clo = price.last()
+    return re_dfs, dict(period=period, origin=resampler.origin,
+                        offset=resampler.position,
+                        time=resampler.position_time, close=previous_close)
 
-    revol = volume.sum()
 
-    # Resample data frame
-    re_df = pd.DataFrame(dict(open=opn, high=high, low=low, close=clo,
-                              volume=revol))
+class _StateError(Exception):
+    """Raised when a saved state does not match the input file."""
 
-    # Replace NaN by correct values for close and volume
-    re_df.close.fillna(method='ffill', inplace=True)
-    re_df.volume.fillna(0, inplace=True)
 
-    def replace_nan(row):
-        """Replace NaN values for open, high and low.
+def _append_bars(output_file, re_dfs, state):
+    """Rewrite the last bar of an output file, and append new bars.
 
-        Positional argument:
-        row -- The row to modify
+    Return the offset of the last written bar.
+
+    Raise _StateError if the format of the new bars differs from the format
+    of the output file.
+
+    Positional arguments:
+    output_file -- The output CSV file
+    re_dfs      -- The list of bars, the first one being the last bar of the
+                   output file
+    state       -- The state of the output file
+    """
+    re_df = pd.concat(re_dfs)
+    date_format = state['date_format']
+
+    if date_format is not None:
+        labels = re_df.index
+        if (date_format == '%Y-%m-%d' and
+                (labels != labels.normalize()).any()):
+            raise _StateError()
+        if (labels.asi8 % 10**9).any():
+            raise _StateError()
+
+    with open(output_file, 'r+b') as out_file:
+        out_file.seek(state['size'])
+        out_file.truncate()
+
+        re_df.iloc[:-1].to_csv(out_file, header=False,
+                               date_format=date_format)
+        offset = out_file.tell()
+
+        re_df.iloc[-1:].to_csv(out_file, header=False,
+                               date_format=date_format)
+
+    return offset
+
+
+def resample_incremental(file_path, period, output_file,
+                         chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Resample a file into output_file, recomputing only the last bar and
+    the new ones if output_file was already computed by this function.
+
+    A state is saved next to output_file (OUTPUT_FILE.state), with the
+    position in the input file of the first trade of the last bar. The next
+    call reads the input file from this position, rewrites the last bar and
+    appends the new ones. If the state does not match the input file (for
+    example if the input file was rewritten), all bars are recomputed.
+
+    The output file is identical to the one computed from scratch.
+
+    Return True if only the last bars were recomputed.
+
+    Positional arguments:
+    file_path   -- The path of the file (CSV file or columnar store)
+    period      -- The resampling period
+    output_file -- The output CSV file
+
+    Keyword arguments:
+    chunk_rows  -- The maximum number of trades read at once
+    """
+    state = _read_state(output_file, period)
+
+    if state is not None:
+        try:
+            re_dfs, new_state = _resample_from(file_path, period, chunk_rows,
+                                               state)
+            size = _append_bars(output_file, re_dfs, state)
+
+            if new_state is not None:
+                new_state.update(size=size, date_format=state['date_format'])
+
+            _write_state(output_file, new_state)
+            return True
+        except _StateError:
+            pass
+
+    re_dfs, new_state = _resample_from(file_path, period, chunk_rows)
+
+    if not re_dfs:
+        # No trade
+        re_dfs = [resample(load_file(file_path), period)]
+
+    pd.concat(re_dfs).to_csv(output_file)
+
+    if new_state is not None:
+        size = _last_line_offset(output_file)
+
+        with open(output_file, 'rb') as out_file:
+            out_file.seek(size)
+            try:
+                date_format = _date_format(out_file.readline())
+                new_state.update(size=size, date_format=date_format)
+            except ValueError:
+                new_state = None
+
+    _write_state(output_file, new_state)
+    return False
+
+
+class LiveResampler(object):
+    """Resample trades as they are downloaded, and return the bars of each
+    period as soon as it closes.
+
+    A period closes when a trade of a later period is added, or when the
+    time until which all trades were added passes its end: empty periods
+    are then returned too, filled as resample does.
+
+    Periods should divide a day, so they are aligned on midnight whatever
+    the first trade. Bars are the ones resample returns, provided no trade
+    of a closed period is added afterwards: such a late trade is counted in
+    the first open period.
+    """
+
+    def __init__(self, period, next_label=None, close=None, tz=None):
+        """Create the resampler.
+
+        Raise ValueError if the period does not divide a day, or is not a
+        whole number of seconds.
+
+        Positional arguments:
+        period     -- The resampling period
+
+        Keyword arguments:
+        next_label -- The label (in nano-seconds since epoch) of the first
+                      bar to return (default: the period of the first trade)
+        close      -- The close of the bar before next_label
+        tz         -- The time zone of the returned bars (default: the one
+                      of the first added trades)
         """
+        self.offset = to_offset(period)
 
-        if pd.isnull(row.open):
-            row.open = row.high = row.low = row.close
+        if (not isinstance(self.offset, Tick) or
+                _DAY_NANOS % self.offset.nanos or self.offset.nanos % 10**9):
+            raise ValueError('The period ' + period + ' should divide a '
+                             'day, in whole seconds')
 
-        return row
+        self.next_label = next_label
+        self.close = close
+        self.tz = tz
 
-    # Replace NaN by correct valued for open, high and low
-    re_df.apply(replace_nan, axis=1)
+        # Bar of the last period holding a trade, not closed yet
+        self.bar = None
 
-    return re_df
+    def add(self, df=None, now=None):
+        """Add trades, and return the filled bars of the periods closed,
+        as a data frame (empty if no period closed).
+
+        Positional arguments:
+        df  -- The trades, as returned by load_file, sorted by time
+
+        Keyword arguments:
+        now -- The time (in nano-seconds since epoch) until which all trades
+               were added: periods ending before it are closed
+        """
+        nanos = self.offset.nanos
+        bars = []
+
+        if df is not None and len(df):
+            times = df.index.asi8
+
+            if self.tz is None:
+                self.tz = df.index.tz
+            if self.next_label is None:
+                self.next_label = times[0] // nanos * nanos
+
+            # The open bar is always the one of next_label
+            trades = pd.DataFrame(
+                dict(price=df.price.values, size=df['size'].values),
+                index=pd.DatetimeIndex(np.maximum(times, self.next_label),
+                                       name='time'),
+                columns=['price', 'size'])
+
+            if self.bar is not None:
+                bar = self.bar.iloc[0]
+                carried = pd.DataFrame(
+                    dict(price=[bar.open, bar.high, bar.low, bar.close],
+                         size=[bar.volume, 0., 0., 0.]),
+                    index=pd.DatetimeIndex([self.next_label] * 4,
+                                           name='time'),
+                    columns=trades.columns)
+                trades = pd.concat([carried, trades])
+
+            re_df = _aggregate(trades, self.offset)
+            bars.append(re_df.iloc[:-1])
+            self.bar = re_df.iloc[-1:]
+
+        end = None if self.bar is None else self.bar.index[0].value
+
+        if now is not None and self.next_label is not None:
+            current = now // nanos * nanos
+
+            if self.bar is not None and end < current:
+                bars.append(self.bar)
+                self.bar = None
+
+            if self.bar is None:
+                end = max(current, self.next_label)
+
+        # Labels of the closed periods (none if end is None)
+        start = self.next_label or 0
+        labels = pd.date_range(pd.Timestamp(start),
+                               pd.Timestamp(max(end or start, start)),
+                               freq=self.offset, closed='left', name='time')
+        re_df = pd.DataFrame(index=labels, columns=['close', 'high', 'low',
+                                                    'open', 'volume'],
+                             dtype=float)
+        if bars:
+            re_df = pd.concat(bars).reindex(labels)
+
+        if len(re_df):
+            re_df = _fill_empty(re_df, self.close)
+            self.close = re_df.close.iloc[-1]
+            self.next_label = end
+
+        if self.tz is not None:
+            re_df.index = re_df.index.tz_localize('UTC').tz_convert(self.tz)
+
+        return re_df
+
+
+def append_bars(output_file, bars):
+    """Append bars to an output file, created with its header if needed.
+
+    Times are formatted as resample would format them in the whole file.
+
+    Positional arguments:
+    output_file -- The output CSV file
+    bars        -- The bars, as returned by LiveResampler.add
+    """
+    if bars.empty:
+        return
+
+    date_format = None
+    if bars.index.tz is None:
+        date_format = ('%Y-%m-%d' if bars.index.freq is not None and
+                       bars.index.freq.nanos % _DAY_NANOS == 0 else
+                       '%Y-%m-%d %H:%M:%S')
+
+    exists = os.path.exists(output_file) and os.path.getsize(output_file)
+
+    with open(output_file, 'ab') as out_file:
+        bars.to_csv(out_file, header=not exists, date_format=date_format)
+
+
+def live_resampler(file_path, period, output_file,
+                   chunk_rows=DEFAULT_CHUNK_ROWS, now=None):
+    """Return a LiveResampler continuing the bars of output_file with the
+    trades appended to file_path.
+
+    The bars closed by the trades of file_path which are not in output_file
+    yet (all bars if output_file does not exist) are first appended to it,
+    reading only the trades after its last bar.
+
+    Positional arguments:
+    file_path   -- The path of the trade file (CSV file or columnar store)
+    period      -- The resampling period (see LiveResampler)
+    output_file -- The output CSV file, written by append_bars
+
+    Keyword arguments:
+    chunk_rows  -- The maximum number of trades read at once
+    now         -- The time (in nano-seconds since epoch) until which all
+                   trades are in file_path (see LiveResampler.add)
+    """
+    resampler = LiveResampler(period)
+    start = None
+
+    if os.path.exists(output_file) and os.path.getsize(output_file):
+        with open(output_file, 'rb') as out_file:
+            header = out_file.readline()
+        last_line = read_last_line(output_file)
+        last_bar = pd.read_csv(io.BytesIO(header + last_line), index_col=0)
+
+        label = pd.Timestamp(last_bar.index[0])
+        resampler.next_label = label.value + resampler.offset.nanos
+        resampler.close = last_bar.close.iloc[0]
+        resampler.tz = label.tz
+        start = pd.Timestamp(resampler.next_label)
+
+    if os.path.exists(file_path):
+        for df in iter_chunks(file_path, chunk_rows, start=start):
+            append_bars(output_file, resampler.add(df))
+
+    append_bars(output_file, resampler.add(now=now))
+    return resampler
+
+
+def bars_file(file_path, period, output_dir=None):
+    """Return the path of the output file of a period, named after the trade
+    file: PAIR_PERIOD.csv for PAIR.csv (or PAIR.csv.gz, PAIR.columns...).
+
+    Positional arguments:
+    file_path  -- The path of the trade file
+    period     -- The resampling period
+
+    Keyword arguments:
+    output_dir -- The output directory (default: the directory of the trade
+                  file)
+    """
+    # PAIR.csv.gz or PAIR.csv.zst give PAIR too
+    name = os.path.basename(file_path)
+    if codec_of(name) is not None:
+        name = os.path.splitext(name)[0]
+    name = os.path.splitext(name)[0]
+
+    if output_dir is None:
+        output_dir = os.path.dirname(file_path)
+
+    return os.path.join(output_dir, name + '_' + period + '.csv')
+
+
+def bar_writer(file_path, periods, delay=DEFAULT_BAR_DELAY, tz=None):
+    """Return a function appending the bars of each period to its output
+    file (see bars_file) as they close, to be called with the trades
+    appended to file_path (see brokers.follow.PairFollower).
+
+    The bars missing in the output files are first computed from file_path
+    (see live_resampler).
+
+    Positional arguments:
+    file_path -- The path of the trade file (CSV file or columnar store)
+    periods   -- The list of resampling periods (see LiveResampler)
+
+    Keyword arguments:
+    delay     -- The time (in seconds) after the end of a period before its
+                 bar is written without a later trade
+    tz        -- The time zone of the times of trades (default: naive)
+    """
+    now = int((time.time() - delay) * 1e9)
+    resamplers = [(live_resampler(file_path, period,
+                                  bars_file(file_path, period), now=now),
+                   bars_file(file_path, period))
+                  for period in periods]
+
+    def on_poll(pages, poll_time):
+        """Add the trades of the new pages, and write the closed bars.
+
+        Positional arguments:
+        pages     -- A list of trade columns (see brokers' decode_trades)
+        poll_time -- The time (in seconds since epoch) until which all
+                     trades were given, None if unknown
+        """
+        df = None
+        if pages:
+            index = pd.DatetimeIndex(
+                np.concatenate([trades['time'] for trades in pages]),
+                name='time', tz=tz)
+            df = pd.DataFrame(dict(
+                (name, np.concatenate([trades[name] for trades in pages]))
+                for name in ['price', 'size']), index=index)
+
+        now = None if poll_time is None else int((poll_time - delay) * 1e9)
+
+        for resampler, output_file in resamplers:
+            append_bars(output_file, resampler.add(df, now=now))
+
+    return on_poll
 
 
 def main():
@@ -140,6 +1393,9 @@ def main():
         Example: To resample every minute  : period = 'T' or freq = '1T'
                  To resample every 2 days  : period = '2D'
                  To resample every 6 months: period = '6M'
+
+        Several periods could be given (example: 1T 5T 1H 1D W). Each one is
+        written in its own output file.
         """
 
     # Parse CLI arguments
@@ -148,9 +1404,34 @@ def main():
     parser.add_argument('input_file', help='Input CSV file')
     parser.add_argument('output_dir',
                         help='Output directory. Will be created if needed')
-    parser.add_argument('period', help='Resampling period')
+    parser.add_argument('period', nargs='+',
+                        help='Resampling period. Several periods could be\n'
+                             'given: the input file is then loaded once')
+    parser.add_argument('--chunk-size', type=int,
+                        help='Read the input file by chunks of CHUNK_SIZE\n'
+                             'trades, to bound the memory usage (default:\n'
+                             'read the whole file at once)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only recompute the last bar and the new ones\n'
+                             'of output files computed by a previous\n'
+                             'incremental run')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of processes resampling shards of the\n'
+                             'input file at the same time (default: 1).\n'
+                             'Each process only loads its shards.')
+    parser.add_argument('--start',
+                        help='Only resample trades from this UTC time\n'
+                             '(example: "2018-01-31 12:00"), reading only\n'
+                             'the needed part of the input file')
+    parser.add_argument('--end',
+                        help='Only resample trades until this UTC time\n'
+                             '(included)')
     args = parser.parse_args()
 
+    if args.incremental and (args.start or args.end or args.jobs > 1):
+        parser.error('--start, --end and --jobs could not be used with '
+                     '--incremental')
+
     # Create output directory if needed
     sys.stdout.write('Create output directory if needed... ')
     sys.stdout.flush()
@@ -161,26 +1442,55 @@ def main():
         pass
     sys.stdout.write('OK\n')
 
-    # Load the file
-    sys.stdout.write('Load the input file... ')
-    sys.stdout.flush()
-    df = load_file(args.input_file)
-    sys.stdout.write('OK\n')
+    if args.incremental:
+        # Resample each period from the position saved by the previous run
+        for period in args.period:
+            sys.stdout.write('Resample ' + period + ' incrementally... ')
+            sys.stdout.flush()
+            output_file = bars_file(args.input_file, period,
+                                    args.output_dir)
+            tail_only = resample_incremental(
+                args.input_file, period, output_file,
+                args.chunk_size or DEFAULT_CHUNK_ROWS)
+            sys.stdout.write('OK (' + ('last bars' if tail_only else
+                                       'all bars') + ')\n')
+        return
 
-    # Resample the data frame
-    sys.stdout.write('Resample... ')
-    sys.stdout.flush()
-    re_df = resample(df, args.period)
-    sys.stdout.write('OK\n')
+    if args.jobs > 1:
+        # Resample shards of the file in parallel
+        sys.stdout.write('Resample the input file with ' + str(args.jobs) +
+                         ' processes... ')
+        sys.stdout.flush()
+        re_dfs = resample_parallel(args.input_file, args.period, args.jobs,
+                                   args.start, args.end)
+        sys.stdout.write('OK\n')
+    elif args.chunk_size:
+        # Load and resample the file chunk by chunk
+        sys.stdout.write('Load and resample the input file by chunks... ')
+        sys.stdout.flush()
+        re_dfs = resample_file(args.input_file, args.period, args.chunk_size,
+                               args.start, args.end)
+        sys.stdout.write('OK\n')
+    else:
+        # Load the file
+        sys.stdout.write('Load the input file... ')
+        sys.stdout.flush()
+        df = load_file(args.input_file, args.start, args.end)
+        sys.stdout.write('OK\n')
 
-    # Create the ouput file
-    sys.stdout.write('Create the output file... ')
-    sys.stdout.flush()
-    dum = os.path.splitext(os.path.basename(args.input_file))[0]
-    output_file_name = dum + '_' + args.period + '.csv'
-    output_file = os.path.join(args.output_dir, output_file_name)
-    re_df.to_csv(output_file)
-    sys.stdout.write('OK\n')
+        # Resample the data frame
+        sys.stdout.write('Resample... ')
+        sys.stdout.flush()
+        re_dfs = resample(df, args.period)
+        sys.stdout.write('OK\n')
+
+    # Create the ouput files, one per period
+    for period in args.period:
+        sys.stdout.write('Create the output file for ' + period + '... ')
+        sys.stdout.flush()
+        output_file = bars_file(args.input_file, period, args.output_dir)
+        re_dfs[period].to_csv(output_file)
+        sys.stdout.write('OK\n')
 
 
 if __name__ == '__main__':
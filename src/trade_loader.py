@@ -0,0 +1,365 @@
+# coding: utf8
+
+"""Load trades in a process, keeping parsed chunks in memory.
+
+Trade files are split into chunks which do not change when the file grows:
+the bytes between two entries of the sparse index of a CSV file (about
+DEFAULT_INDEX_BYTES bytes, see brokers.offset_index), or the days of a
+columnar store. A compressed file is a single chunk.
+
+Parsed chunks are kept in a least recently used cache, bounded in bytes. A
+query only parses the chunks of its time range which are not cached yet, so
+repeated or overlapping queries do not read the file again. A chunk is
+parsed again if it grew (the last one of a growing file), and all chunks of
+a file are dropped if the file was rewritten or truncated.
+
+Example:
+>>> from src.trade_loader import load_trades
+>>> df = load_trades('GDAX', 'BTC-EUR', '2018-01-01', '2018-01-31',
+...                  columns=['price', 'size'], data_dir='data')
+"""
+
+import collections
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from brokers.columnar import ColumnarStore
+from brokers.compression import codec_of, open_trade_file
+from brokers.offset_index import find_range, load_index
+from brokers.storage import SUFFIXES, is_columnar
+from resample import (COMPACT_DTYPES, KEY_COLS, read_trades, select_times,
+                      time_value, utc_day)
+
+
+# Default maximum size (in bytes) of the parsed chunks kept in memory
+DEFAULT_CACHE_BYTES = 256 << 20
+
+# Storage backends looked for by load_trades, in this order
+STORAGES = ['csv', 'columnar', 'gzip', 'zstd']
+
+
+def find_trade_file(broker_name, pair, data_dir='.'):
+    """Return the path of the trade file of a pair, as written by
+    download_trades.
+
+    Raise IOError if there is none.
+
+    Positional arguments:
+    broker_name -- The name of the broker ('GDAX' or 'Kraken')
+    pair        -- The pair
+
+    Keyword arguments:
+    data_dir    -- The output directory of download_trades
+    """
+    for storage in STORAGES:
+        file_path = os.path.join(data_dir, broker_name,
+                                 pair + SUFFIXES[storage])
+        if os.path.exists(file_path):
+            return file_path
+
+    raise IOError('No trade file for ' + broker_name + ' ' + pair + ' in "' +
+                  data_dir + '"')
+
+
+def _read_csv(data, names, compact=False):
+    """Return the trades of CSV lines as a data frame indexed by time.
+
+    Positional arguments:
+    data    -- The CSV lines, without header
+    names   -- The names of the columns
+
+    Keyword arguments:
+    compact -- If True, read prices and sizes as float32 and sides as
+               categories
+    """
+    if not data:
+        return pd.DataFrame(columns=[name for name in names
+                                     if name != 'time'],
+                            index=pd.DatetimeIndex([], name='time'))
+
+    return read_trades(io.BytesIO(data), names, compact=compact)
+
+
+def _concat(frames):
+    """Concatenate data frames of trades, categorical columns staying
+    categorical even if their chunks have different categories.
+
+    Positional arguments:
+    frames -- A non empty list of data frames with the same columns
+    """
+    for name in frames[0].columns:
+        if frames[0][name].dtype.name == 'category':
+            categories = sorted(set().union(*(frame[name].cat.categories
+                                              for frame in frames)))
+            frames = [frame.assign(**{name: frame[name].cat.set_categories(
+                categories)}) for frame in frames]
+
+    return pd.concat(frames)
+
+
+class TradeLoader(object):
+    """Load trades of files, keeping the parsed chunks in a LRU cache.
+
+    The loader could be shared by several threads.
+    """
+
+    def __init__(self, cache_bytes=DEFAULT_CACHE_BYTES, compact=False):
+        """Create a loader with an empty cache.
+
+        Keyword arguments:
+        cache_bytes -- The maximum size (in bytes) of the cached chunks
+        compact     -- If True, prices and sizes are float32 (about 7
+                       significant digits) and categorical columns (like
+                       side) are categories, so about twice as many trades
+                       fit in the cache
+        """
+        self.cache_bytes = cache_bytes
+        self.compact = compact
+        self.nb_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        # (file path, chunk) -> (version, data frame, size in bytes)
+        self.chunks = collections.OrderedDict()
+
+        # File path -> (inode, size) when the file was last read
+        self.files = {}
+
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """Drop all cached chunks."""
+        with self.lock:
+            self.chunks.clear()
+            self.files.clear()
+            self.nb_bytes = 0
+
+    def _forget(self, file_path):
+        """Drop the cached chunks of a file, the lock being held.
+
+        Positional arguments:
+        file_path -- The path of the file
+        """
+        for key in [key for key in self.chunks if key[0] == file_path]:
+            self.nb_bytes -= self.chunks.pop(key)[2]
+
+    def _check_file(self, file_path):
+        """Drop the cached chunks of a file if it was rewritten or truncated
+        since it was last read.
+
+        Positional arguments:
+        file_path -- The path of the file (CSV file or columnar store)
+        """
+        stat = os.stat(file_path)
+        state = (stat.st_ino, stat.st_size)
+
+        with self.lock:
+            previous = self.files.get(file_path)
+            self.files[file_path] = state
+
+            if previous is not None and not is_columnar(file_path) and (
+                    previous[0] != state[0] or previous[1] > state[1]):
+                self._forget(file_path)
+
+    def _get(self, file_path, chunk, version, parse):
+        """Return the data frame of a chunk, from the cache or parsed.
+
+        Positional arguments:
+        file_path -- The path of the file
+        chunk     -- The identifier of the chunk in the file
+        version   -- A value changing when the chunk changes
+        parse     -- The function returning the data frame of the chunk
+        """
+        key = (file_path, chunk)
+
+        with self.lock:
+            cached = self.chunks.pop(key, None)
+
+            if cached is not None:
+                if cached[0] == version:
+                    self.chunks[key] = cached
+                    self.hits += 1
+                    return cached[1]
+
+                self.nb_bytes -= cached[2]
+
+            self.misses += 1
+
+        df = parse()
+        size = df.memory_usage(deep=True).sum()
+
+        with self.lock:
+            if key not in self.chunks and size <= self.cache_bytes:
+                self.chunks[key] = (version, df, size)
+                self.nb_bytes += size
+
+                while self.nb_bytes > self.cache_bytes:
+                    self.nb_bytes -= self.chunks.popitem(last=False)[1][2]
+
+        return df
+
+    def _csv_frames(self, file_path, start, end):
+        """Return the data frames of the chunks of a CSV file holding the
+        trades from start to end.
+
+        Positional arguments:
+        file_path -- The path of the CSV file (compressed or not)
+        start     -- The first time (None: no lower bound)
+        end       -- The last time (None: no upper bound)
+        """
+        with open_trade_file(file_path) as csv_file:
+            header = csv_file.readline()
+
+        names = header.rstrip('\r\n').split(',')
+        keys = [column for column in KEY_COLS if column in names]
+
+        if codec_of(file_path) is not None or not keys:
+            def parse_file():
+                """Return the trades of the whole file."""
+                with open_trade_file(file_path) as csv_file:
+                    csv_file.readline()
+                    return _read_csv(csv_file.read(), names, self.compact)
+
+            return [self._get(file_path, 0, os.path.getsize(file_path),
+                              parse_file)]
+
+        entries = load_index(file_path, keys[0])
+        offsets = [entry[0] for entry in entries]
+        size = os.path.getsize(file_path)
+
+        first, last = find_range(entries, 'time', time_value(start),
+                                 time_value(end))
+        first = offsets.index(first) if first is not None else 0
+        last = offsets.index(last) if last is not None else len(offsets)
+
+        def parse(chunk_start, chunk_end):
+            """Return a function parsing the complete lines of a chunk."""
+            def parse_chunk():
+                """Return the trades of the chunk."""
+                with open(file_path, 'rb') as csv_file:
+                    csv_file.seek(chunk_start)
+                    data = csv_file.read(chunk_end - chunk_start)
+
+                return _read_csv(data[:data.rfind('\n') + 1], names,
+                                 self.compact)
+
+            return parse_chunk
+
+        frames = []
+        for number in range(first, last):
+            chunk_start = offsets[number]
+            chunk_end = (offsets[number + 1] if number + 1 < len(offsets)
+                         else size)
+            frames.append(self._get(file_path, chunk_start, chunk_end,
+                                    parse(chunk_start, chunk_end)))
+
+        return frames
+
+    def _store_frames(self, file_path, start, end):
+        """Return the data frames of the days of a columnar store holding
+        the trades from start to end.
+
+        Positional arguments:
+        file_path -- The path of the columnar store
+        start     -- The first time (None: no lower bound)
+        end       -- The last time (None: no upper bound)
+        """
+        store = ColumnarStore(file_path)
+        first, last = utc_day(start), utc_day(end)
+
+        def parse(partition):
+            """Return a function reading the trades of a day."""
+            def parse_partition():
+                """Return the trades of the day, categories decoded."""
+                columns = store.read(start=partition, end=partition)
+                index = pd.DatetimeIndex(columns.pop('time'), name='time',
+                                         tz=store.timezone('time'))
+
+                for name in columns:
+                    categories = store.categories(name)
+                    if categories is not None and self.compact:
+                        columns[name] = pd.Categorical.from_codes(
+                            columns[name], categories)
+                    elif categories is not None:
+                        columns[name] = np.array(categories,
+                                                 dtype=object)[columns[name]]
+                    elif self.compact and name in COMPACT_DTYPES:
+                        columns[name] = columns[name].astype(
+                            COMPACT_DTYPES[name])
+
+                names = [name for name in store.columns if name != 'time']
+                return pd.DataFrame(columns, index=index, columns=names)
+
+            return parse_partition
+
+        return [self._get(file_path, partition, store.nb_rows(partition),
+                          parse(partition))
+                for partition in store.partitions()
+                if (first is None or partition >= first) and
+                (last is None or partition <= last)]
+
+    def load_file(self, file_path, start=None, end=None, columns=None):
+        """Return the trades of a file from start to end (both included), as
+        a data frame indexed by time.
+
+        Positional arguments:
+        file_path -- The path of the file (CSV file, compressed or not, or
+                     columnar store)
+
+        Keyword arguments:
+        start     -- The first time (default: no lower bound), like
+                     '2018-01-31 12:00' (UTC)
+        end       -- The last time (default: no upper bound)
+        columns   -- The list of returned columns (default: all columns)
+        """
+        self._check_file(file_path)
+
+        if is_columnar(file_path):
+            frames = self._store_frames(file_path, start, end)
+        else:
+            frames = self._csv_frames(file_path, start, end)
+
+        # Empty frames would change the types of the concatenated columns
+        frames = [frame for frame in frames if len(frame)]
+
+        if columns is not None:
+            frames = [frame[columns] for frame in frames]
+
+        if not frames:
+            return pd.DataFrame(columns=columns,
+                                index=pd.DatetimeIndex([], name='time'))
+
+        return select_times(_concat(frames), start, end)
+
+
+# Loader used by load_trades
+_LOADER = TradeLoader()
+
+
+def load_trades(broker_name, pair, start=None, end=None, columns=None,
+                data_dir='.'):
+    """Return the trades of a pair from start to end (both included), as a
+    data frame indexed by time.
+
+    Parsed chunks of the trade file are kept in memory between calls (see
+    TradeLoader), so repeated or overlapping queries are fast.
+
+    Raise IOError if there is no trade file for the pair.
+
+    Positional arguments:
+    broker_name -- The name of the broker ('GDAX' or 'Kraken')
+    pair        -- The pair
+
+    Keyword arguments:
+    start       -- The first time (default: no lower bound), like
+                   '2018-01-31 12:00' (UTC)
+    end         -- The last time (default: no upper bound)
+    columns     -- The list of returned columns (default: all columns)
+    data_dir    -- The output directory of download_trades
+    """
+    return _LOADER.load_file(find_trade_file(broker_name, pair, data_dir),
+                             start, end, columns)
@@ -0,0 +1,14 @@
+"""Shared fixtures of the tests."""
+import pytest
+
+from src.brokers import telemetry
+
+
+@pytest.fixture
+def quiet_telemetry():
+    """Return an empty shared telemetry registry, progress messages being
+    turned off during the test."""
+    telemetry.configure(quiet=True)
+    yield telemetry.reset()
+    telemetry.configure(quiet=False)
+    telemetry.reset()
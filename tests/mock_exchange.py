@@ -0,0 +1,243 @@
+# coding: utf8
+
+"""A local stand-in for the public trade APIs of GDAX & Kraken.
+
+It serves a synthetic history of trades, the same for every pair:
+- GDAX  : /products/<pair>/trades?after=<trade ID>
+- Kraken: /0/public/Trades?pair=<pair>&since=<nano-seconds>
+
+Latency, page sizes, length of the history and rate of throttled requests
+(HTTP 429 on GDAX, 'EAPI:Rate limit exceeded' error on Kraken) could be
+configured.
+"""
+import BaseHTTPServer
+import datetime
+import json
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server answering each connection in its own thread."""
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer GDAX & Kraken requests, keeping connections alive."""
+    protocol_version = 'HTTP/1.1'
+
+    # Send answers at once (TCP_NODELAY), instead of waiting for the ACK of
+    # the previous packet
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Answer the request."""
+        exchange = self.server.exchange
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        parts = url.path.strip('/').split('/')
+
+        if exchange.latency:
+            time.sleep(exchange.latency)
+
+        throttled = exchange.count_request()
+
+        if len(parts) == 3 and parts[0] == 'products' and \
+                parts[2] == 'trades':
+            if throttled:
+                self.answer(429, dict(message='Rate limit exceeded'))
+            else:
+                after = int(params.get('after', exchange.nb_trades + 1))
+                self.answer(200, exchange.gdax_trades(after))
+        elif parts == ['0', 'public', 'Trades']:
+            if throttled:
+                self.answer(200, dict(error=['EAPI:Rate limit exceeded']))
+            else:
+                since = int(params.get('since', 0))
+                self.answer(200, exchange.kraken_trades(params['pair'],
+                                                        since))
+        else:
+            self.answer(404, dict(message='NotFound'))
+
+    def answer(self, status_code, content):
+        """Send a JSON answer.
+
+        Positional arguments:
+        status_code -- The HTTP status code
+        content     -- The content to encode in JSON
+        """
+        body = json.dumps(content)
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+
+class MockExchange(object):
+    """A local HTTP server serving synthetic GDAX & Kraken trades.
+
+    Trade number i (from 1 to nb_trades) occurs at start + i * interval.
+    Kraken times are rounded to 100 micro-seconds, so interval should be a
+    multiple of it.
+    """
+
+    def __init__(self, nb_trades=10000, gdax_page_size=100,
+                 kraken_page_size=1000, latency=0., throttle_rate=0.,
+                 kraken_pairs=None, start=1430000000., interval=0.01,
+                 seed=0):
+        """Create the server (not started).
+
+        Keyword arguments:
+        nb_trades        -- The number of trades of the history
+        gdax_page_size   -- The number of trades of a GDAX page
+        kraken_page_size -- The number of trades of a Kraken page
+        latency          -- The time (in seconds) before each answer
+        throttle_rate    -- The proportion of throttled requests
+        kraken_pairs     -- A dictionnary giving the name of Kraken pairs in
+                            answers (like Kraken.SPECIAL_PAIRS)
+        start            -- The time of the history start (seconds since
+                            epoch)
+        interval         -- The time (in seconds) between two trades
+        seed             -- The seed choosing throttled requests
+        """
+        self.nb_trades = nb_trades
+        self.gdax_page_size = gdax_page_size
+        self.kraken_page_size = kraken_page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.kraken_pairs = kraken_pairs or {}
+        self.start_timestamp = int(round(start * 1e9))
+        self.interval = int(round(interval * 1e9))
+
+        self.requests = 0
+        self.throttled = 0
+        # Time of the first request (reset to None to time the next one)
+        self.first_request = None
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+        self.httpd = None
+        self.thread = None
+
+    def count_request(self):
+        """Count a request, and return True if it should be throttled."""
+        with self.lock:
+            if self.first_request is None:
+                self.first_request = time.time()
+            self.requests += 1
+            throttled = self.random.random() < self.throttle_rate
+            self.throttled += throttled
+
+        return throttled
+
+    def trade_timestamp(self, trade_id):
+        """Return the time (in nano-seconds since epoch) of a trade.
+
+        Positional arguments:
+        trade_id -- The number of the trade
+        """
+        return self.start_timestamp + trade_id * self.interval
+
+    def trade_time(self, trade_id):
+        """Return the time (in seconds since epoch) of a trade.
+
+        Positional arguments:
+        trade_id -- The number of the trade
+        """
+        return round(self.trade_timestamp(trade_id) / 1e9, 4)
+
+    def gdax_trades(self, after):
+        """Return the GDAX trades older than the trade ID after, the most
+        recent first.
+
+        Positional arguments:
+        after -- The trade ID
+        """
+        last = min(after - 1, self.nb_trades)
+        first = max(1, last - self.gdax_page_size + 1)
+
+        return [dict(trade_id=trade_id,
+                     price='%.2f' % (200 + trade_id % 1000 / 100.),
+                     size='%.8f' % (0.01 + trade_id % 7 / 100.),
+                     side='buy' if trade_id % 2 else 'sell',
+                     time=datetime.datetime.utcfromtimestamp(
+                         self.trade_time(trade_id)).strftime(
+                             '%Y-%m-%dT%H:%M:%S.%fZ'))
+                for trade_id in range(last, first - 1, -1)]
+
+    def kraken_trades(self, pair, since):
+        """Return the Kraken answer for the trades after since.
+
+        Positional arguments:
+        pair  -- The pair
+        since -- The time (in nano-seconds since epoch)
+        """
+        # First trade strictly after since
+        first = max(1, (since - self.start_timestamp) // self.interval + 1)
+        last = min(self.nb_trades, first + self.kraken_page_size - 1)
+        trade_ids = range(first, last + 1)
+
+        trades = [['%.5f' % (200 + trade_id % 1000 / 100.),
+                   '%.8f' % (0.01 + trade_id % 7 / 100.),
+                   self.trade_time(trade_id),
+                   'b' if trade_id % 2 else 's',
+                   'l' if trade_id % 3 else 'm', '']
+                  for trade_id in trade_ids]
+
+        if trade_ids:
+            next_since = self.trade_timestamp(trade_ids[-1])
+        else:
+            next_since = since
+
+        result = {self.kraken_pairs.get(pair, pair): trades,
+                  'last': str(next_since)}
+        return dict(error=[], result=result)
+
+    @property
+    def url(self):
+        """The URL of the server."""
+        return 'http://127.0.0.1:' + str(self.httpd.server_address[1])
+
+    @property
+    def gdax_url(self):
+        """The URL to use as GDAX.BASE_URL."""
+        return self.url + '/products/'
+
+    @property
+    def kraken_url(self):
+        """The URL to use as Kraken.BASE_URL."""
+        return self.url + '/0/public/Trades'
+
+    def start(self, port=0):
+        """Start the server in a thread.
+
+        Keyword arguments:
+        port -- The port of the server (default: any free port)
+        """
+        self.httpd = _Server(('127.0.0.1', port), _Handler)
+        self.httpd.exchange = self
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        """Start the server and return it."""
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        """Stop the server."""
+        self.stop()
@@ -0,0 +1,91 @@
+"""Test the batch download of several pairs."""
+import shutil
+import threading
+import time
+
+import pytest
+
+from src.brokers import batch
+
+
+class FakeBroker(object):
+    """A broker recording downloads instead of sending requests."""
+    ALLOWED_PAIRS = ['AAA', 'AAB', 'BBB']
+
+    lock = threading.Lock()
+    downloaded = []
+    last_times = {}
+
+    @classmethod
+    def download_missing_trades(cls, out_f, pair, workers=1,
+                                full_check=False, repair=False):
+        if pair == 'BBB':
+            raise RuntimeError('boom')
+
+        with cls.lock:
+            cls.downloaded.append(pair)
+
+        cls.last_times[out_f] = time.time()
+
+    @classmethod
+    def get_last_trade_time_of_file(cls, file_path):
+        return cls.last_times.get(file_path)
+
+    @staticmethod
+    def check_file_ranges(file_path, full=False):
+        return []
+
+
+def test_select_pairs():
+    """Test pairs are selected with wildcards, across brokers."""
+    assert batch.select_pairs(['GDAX'], ['BTC-*']) == \
+        [('GDAX', 'BTC-EUR'), ('GDAX', 'BTC-GBP'), ('GDAX', 'BTC-USD')]
+
+    assert batch.select_pairs(['*'], ['LTCEUR', 'LTC-EUR', 'LTC-EUR']) == \
+        [('GDAX', 'LTC-EUR'), ('Kraken', 'LTCEUR')]
+
+    with pytest.raises(ValueError):
+        batch.select_pairs(['Foo'], ['BTC-EUR'])
+
+    with pytest.raises(ValueError):
+        batch.select_pairs(['GDAX'], ['XBTEUR'])
+
+
+def test_get_lag(tmpdir):
+    """Test the lag is computed from the last trade of the file."""
+    gdax_file = str(tmpdir.join('BTC-EUR.csv'))
+    shutil.copy('tests/data/gdax/BTC-EUR.csv', gdax_file)
+    # Last trade at 2015-04-28T23:32:25 (second resolution)
+    now = 1430263945 + 60
+
+    assert batch.get_lag(batch.GDAX, gdax_file, now) == pytest.approx(60)
+    assert batch.get_lag(batch.GDAX, str(tmpdir.join('foo.csv'))) is None
+
+    assert batch.format_lag(None) == 'no trade'
+    assert batch.format_lag(3661) == '01:01:01'
+    assert batch.format_lag(2 * 86400 + 5) == '2d 00:00:05'
+
+
+def test_download_batch(tmpdir, monkeypatch):
+    """Test the most behind pairs are downloaded first, and an error on a
+    pair does not stop the others."""
+    brokers = dict(Fake=FakeBroker)
+    output_dir = str(tmpdir)
+
+    now = time.time()
+    monkeypatch.setattr(FakeBroker, 'downloaded', [])
+    monkeypatch.setattr(FakeBroker, 'last_times', {
+        batch.output_file(output_dir, 'Fake', 'AAA'): now - 10,
+        batch.output_file(output_dir, 'Fake', 'AAB'): now - 1000})
+
+    jobs = batch.select_pairs(['Fake'], ['*'], brokers)
+    results = batch.download_batch(jobs, output_dir, nb_jobs=1,
+                                   brokers=brokers)
+
+    assert [result.pair for result in results] == ['BBB', 'AAB', 'AAA']
+    assert FakeBroker.downloaded == ['AAB', 'AAA']
+
+    assert [result.status for result in results] == \
+        ['error: boom', 'OK', 'OK']
+    assert results[1].lag_before == pytest.approx(1000, abs=5)
+    assert results[1].lag_after < 5
@@ -0,0 +1,87 @@
+"""Test the columnar store."""
+import os
+
+import pandas as pd
+
+import src.download_trades as dwnld
+import src.resample as resample
+from src.brokers.columnar import ColumnarStore, ColumnarTradeWriter
+
+
+def read_rows(file_path):
+    """Return the header and the rows of a CSV file."""
+    with open(file_path, 'r') as csv_file:
+        lines = csv_file.read().splitlines()
+
+    return lines[0].split(','), [line.split(',') for line in lines[1:]]
+
+
+def write_store(csv_path, store_path, schema):
+    """Write the rows of a CSV file in a columnar store."""
+    header, rows = read_rows(csv_path)
+
+    with ColumnarTradeWriter(store_path, header, schema, flush_rows=7) as wrt:
+        for row in rows:
+            wrt.write_rows([row])
+
+
+def test_gdax_store(tmpdir):
+    """Test GDAX trades written in a columnar store."""
+    store_path = str(tmpdir.join('BTC-EUR.columns'))
+    write_store('tests/data/gdax/BTC-EUR.csv', store_path,
+                dwnld.GDAX.COLUMNAR_SCHEMA)
+
+    store = ColumnarStore(store_path)
+    assert store.partitions()[:2] == ['2015-04-23', '2015-04-24']
+    assert store.last_row()['trade_id'] == 26
+    assert store.last_row()['side'] == 'sell'
+
+    assert dwnld.GDAX.get_last_trade_id_of_file(store_path) == 26
+    assert dwnld.GDAX.check_file_consistency(store_path) == []
+
+    missing = str(tmpdir.join('missing.columns'))
+    assert dwnld.GDAX.get_last_trade_id_of_file(missing) == 0
+
+    expected = resample.load_file('tests/data/gdax/BTC-EUR.csv')
+    pd.testing.assert_frame_equal(resample.load_file(store_path), expected)
+
+
+def test_kraken_store(tmpdir):
+    """Test Kraken trades written in a columnar store."""
+    store_path = str(tmpdir.join('XBTEUR.columns'))
+    write_store('tests/data/kraken/XBTEUR_non_cont.csv', store_path,
+                dwnld.Kraken.COLUMNAR_SCHEMA)
+
+    file_path = 'tests/data/kraken/XBTEUR_non_cont.csv'
+    assert dwnld.Kraken.check_file_consistency(store_path) == \
+        dwnld.Kraken.check_file_consistency(file_path)
+
+
+def test_interrupted_append(tmpdir):
+    """Test readers ignore an incomplete row, and a writer truncates the
+    columns to the same length."""
+    store_path = str(tmpdir.join('BTC-EUR.columns'))
+    write_store('tests/data/gdax/BTC-EUR.csv', store_path,
+                dwnld.GDAX.COLUMNAR_SCHEMA)
+
+    store = ColumnarStore(store_path)
+    partition = store.partitions()[-1]
+    with open(os.path.join(store_path, partition, 'trade_id.bin'), 'ab') as f:
+        f.write('\0' * 12)
+
+    names = ['trade_id.bin', 'price.bin', 'size.bin', 'time.bin']
+
+    def sizes():
+        """Return the set of sizes of the column files."""
+        return set(os.path.getsize(os.path.join(store_path, partition, name))
+                   for name in names)
+
+    # An append could be in progress: readers do not touch the files
+    store = ColumnarStore(store_path)
+    assert store.last_row()['trade_id'] == 26
+    assert dwnld.GDAX.check_file_consistency(store_path) == []
+    assert len(sizes()) == 2
+
+    ColumnarTradeWriter(store_path, [], dwnld.GDAX.COLUMNAR_SCHEMA).close()
+    assert ColumnarStore(store_path).last_row()['trade_id'] == 26
+    assert len(sizes()) == 1
@@ -0,0 +1,120 @@
+"""Test trade files compressed by independent frames."""
+import gzip
+import io
+import os
+
+import pandas as pd
+
+import src.download_trades as dwnld
+from src import resample
+from src.brokers import compression
+from src.brokers.rate_limit import RateLimiter
+from src.brokers.storage import read_last_line
+from src.brokers.trade_writer import CsvTradeWriter, read_commit, recover
+from tests.mock_exchange import MockExchange
+
+
+def write_frames(file_path, nb_rows, flush_bytes=100):
+    """Write rows 'i,i' with a compressed CSV writer, and return the
+    expected decompressed content."""
+    with CsvTradeWriter(file_path, ['a', 'b'],
+                        flush_bytes=flush_bytes) as writer:
+        for i in range(nb_rows):
+            writer.write_rows([(str(i), str(i))])
+
+    return 'a,b\n' + ''.join(str(i) + ',' + str(i) + '\n'
+                             for i in range(nb_rows))
+
+
+def test_frames(tmpdir):
+    """Test a compressed file is a valid multi-frame gzip file, whose last
+    line is read from its last frame."""
+    file_path = str(tmpdir.join('trades.csv.gz'))
+    expected = write_frames(file_path, 200)
+
+    assert gzip.open(file_path).read() == expected
+    assert read_last_line(file_path) == '199,199'
+    assert read_commit(file_path) == os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as csv_file:
+        data = csv_file.read()
+
+    # Several frames, the last one found from the end of the file
+    assert data.count('\x1f\x8b\x08') > 1
+    with open(file_path, 'rb') as csv_file:
+        start, end, output = compression.find_last_frame(
+            csv_file, len(data), 'gzip')
+    assert end == len(data)
+    assert expected.endswith(output)
+
+    # Resuming appends new frames
+    with CsvTradeWriter(file_path, ['a', 'b']) as writer:
+        writer.write_rows([('200', '200')])
+    assert gzip.open(file_path).read() == expected + '200,200\n'
+
+
+def test_recover(tmpdir):
+    """Test a torn last frame is removed, with or without a commit."""
+    file_path = str(tmpdir.join('trades.csv.gz'))
+    expected = write_frames(file_path, 200)
+    size = os.path.getsize(file_path)
+
+    torn = compression.compress_frame('200,200\n201,201\n', 'gzip')[:-5]
+    with open(file_path, 'ab') as csv_file:
+        csv_file.write(torn)
+
+    assert recover(file_path) == len(torn)
+    assert os.path.getsize(file_path) == size
+
+    # Without a commit, the last complete frame is looked for
+    os.remove(file_path + '.commit')
+    with open(file_path, 'ab') as csv_file:
+        csv_file.write(torn)
+
+    assert recover(file_path) == len(torn)
+    assert gzip.open(file_path).read() == expected
+    assert read_last_line(file_path) == '199,199'
+
+
+def test_open_trade_file(tmpdir):
+    """Test a compressed file is read and seeked as a decompressed stream."""
+    file_path = str(tmpdir.join('trades.csv.gz'))
+    expected = write_frames(file_path, 3000, flush_bytes=1000)
+
+    with compression.open_trade_file(file_path) as csv_file:
+        assert csv_file.read() == expected
+
+        csv_file.seek(10)
+        assert csv_file.read(20) == expected[10:30]
+
+        csv_file.seek(20000)
+        assert csv_file.readline() == expected[20000:].split('\n')[0] + '\n'
+        assert csv_file.tell() == expected.index('\n', 20000) + 1
+
+    with compression.open_trade_file(file_path) as csv_file:
+        assert list(csv_file) == io.BytesIO(expected).readlines()
+
+
+def test_download_gzip(tmpdir, monkeypatch):
+    """Test a gzip file is downloaded, resumed, checked and resampled like a
+    CSV file."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    csv_path = str(tmpdir.join('BTC-EUR.csv'))
+    gzip_path = str(tmpdir.join('BTC-EUR.csv.gz'))
+
+    with MockExchange(nb_trades=1234) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+
+        dwnld.GDAX.download_missing_trades(csv_path, 'BTC-EUR')
+        dwnld.GDAX.download_missing_trades(gzip_path, 'BTC-EUR')
+
+        exchange.nb_trades = 2345
+        dwnld.GDAX.download_missing_trades(csv_path, 'BTC-EUR')
+        dwnld.GDAX.download_missing_trades(gzip_path, 'BTC-EUR')
+
+    assert gzip.open(gzip_path).read() == open(csv_path, 'rb').read()
+    assert dwnld.GDAX.check_file_ranges(gzip_path) == []
+
+    expected = resample.load_file(csv_path)
+    pd.testing.assert_frame_equal(resample.load_file(gzip_path), expected)
@@ -0,0 +1,91 @@
+"""Test the chunked and checkpointed consistency check."""
+import shutil
+import subprocess
+import sys
+
+from src.brokers import consistency
+
+
+def test_find_issues():
+    """Test find_issues gives the same result whatever the chunk size."""
+    file_path = 'tests/data/gdax/BTC-EUR_non_cont.csv'
+    expected = [(3, 13), (13, 5), (8, 4), (4, 9), (12, 14)]
+
+    for chunk_bytes in [1, 7, 100, 1 << 20]:
+        issues, _, last = consistency.find_issues(
+            file_path, 'trade_id', 'contiguous', chunk_bytes=chunk_bytes)
+        assert issues == expected
+        assert last == 15
+
+    file_path = 'tests/data/kraken/XBTEUR_non_cont.csv'
+    issues, _, _ = consistency.find_issues(file_path, 'timestamp',
+                                           'increasing', chunk_bytes=50)
+    assert [timestamp for _, timestamp in issues] == \
+        [1379071113451500000, 1379177019796700000]
+
+
+def test_check_file_is_incremental(tmpdir):
+    """Test only lines appended since the last check are checked."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    shutil.copy('tests/data/gdax/BTC-EUR.csv', file_path)
+
+    assert consistency.check_file(file_path, 'trade_id', 'contiguous') == []
+    checkpoint = consistency.read_checkpoint(file_path)
+    assert checkpoint['last'] == 26
+
+    with open(file_path, 'a') as csv_file:
+        csv_file.write('27,205.95,sell,0.1,2015-04-28T23:32:25.726855Z\n')
+        csv_file.write('30,205.95,sell,0.1,2015-04-28T23:32:25.726855Z\n')
+        csv_file.write('31,205.95,sell,0.1,2015-04-28T23:')
+
+    # The torn last line is ignored
+    assert consistency.check_file(file_path, 'trade_id', 'contiguous') == \
+        [(27, 30)]
+    assert consistency.read_checkpoint(file_path) == checkpoint
+
+    # Lines before the checkpoint are not read again
+    assert consistency.find_issues(file_path, 'trade_id', 'contiguous',
+                                   offset=checkpoint['offset'],
+                                   previous=30)[0] == [(30, 27), (27, 30)]
+
+
+def test_checkpoint_invalidated(tmpdir):
+    """Test a checkpoint is dropped if the file changed before it."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    shutil.copy('tests/data/gdax/BTC-EUR.csv', file_path)
+    consistency.check_file(file_path, 'trade_id', 'contiguous')
+
+    with open(file_path, 'r+b') as csv_file:
+        content = csv_file.read().replace('\n26,', '\n28,')
+        csv_file.seek(0)
+        csv_file.write(content)
+
+    assert consistency.read_checkpoint(file_path) is None
+    assert consistency.check_file(file_path, 'trade_id', 'contiguous') == \
+        [(25, 28)]
+
+
+def test_parse_keys(monkeypatch):
+    """Test small and large blocks give the same keys."""
+    block = '3,a,b\n\n-1,c,d\n12,e\n'
+    expected = consistency.parse_keys(block, 0)
+    assert expected.dtype == 'int64'
+    assert expected.tolist() == [3, -1, 12]
+
+    monkeypatch.setattr(consistency, 'PANDAS_MIN_BYTES', 0)
+    assert consistency.parse_keys(block, 0).tolist() == [3, -1, 12]
+
+
+def test_download_path_without_pandas(tmpdir):
+    """Test importing download_trades and checking a file do not import
+    pandas."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    shutil.copy('tests/data/gdax/BTC-EUR.csv', file_path)
+
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         'import sys; sys.path.insert(0, "src"); '
+         'from download_trades import GDAX; '
+         'assert not GDAX.check_file_consistency(sys.argv[1]); '
+         'print("pandas" in sys.modules)', file_path])
+    assert output.strip() == 'False'
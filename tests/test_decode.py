@@ -0,0 +1,87 @@
+"""Test the decoding of broker responses into typed columns."""
+import numpy as np
+import pytest
+
+import src.download_trades as dwnld
+from src.brokers import decode
+
+
+def test_seconds_column():
+    """Test times are rounded, not truncated, to the micro-second."""
+    # 1378856831.5461 * 10**4 == 13788568315460.998
+    timestamps = decode.seconds_column([1378856831.5461, 1430000000.123456,
+                                        1378771200.0])
+
+    assert timestamps.tolist() == [1378856831546100000, 1430000000123456000,
+                                   1378771200000000000]
+    assert decode.seconds_column([]).dtype == np.int64
+
+
+def test_category_column():
+    """Test categories are coded by their index."""
+    codes = decode.category_column([u'sell', u'buy', u'sell'],
+                                   ['buy', 'sell'])
+
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [1, 0, 1]
+
+
+def test_datetime_column():
+    """Test times of all layouts and lengths are parsed as by numpy."""
+    times = ['2015-04-29T07:31:37.989314Z', '2015-04-29T07:31:37Z',
+             '2013-09-10 23:47:11.546', '2013-09-10 23:47:11.546000',
+             '2016-02-29 23:59:59.123456789', '1969-12-31T23:59:59.5',
+             '2013-09-10', '2013-09-10T23:47']
+    expected = [np.datetime64(time.rstrip('Z').replace(' ', 'T'), 'ns')
+                for time in times]
+
+    assert decode.datetime_column(times).tolist() == \
+        np.array(expected).tolist()
+    assert decode.datetime_column([]).dtype == np.dtype('datetime64[ns]')
+
+    for time in ['2015-02-29T00:00:00', '2015-13-01', '2015-04-29X07:31:37',
+                 '2015-04-29T07:31:3a']:
+        with pytest.raises(ValueError):
+            decode.datetime_column(['2015-04-29T07:31:37', time])
+
+
+def test_decode_gdax_trades():
+    """Test GDAX trades are sorted by trade ID, and typed."""
+    trades = decode.loads('[{"trade_id": 2, "price": "204.5", "size": "0.1",'
+                          ' "side": "buy", "time": "2015-04-29T07:31:37Z"},'
+                          ' {"trade_id": 1, "price": "204.0", "size": "1e-8",'
+                          ' "side": "sell",'
+                          ' "time": "2015-04-29T07:31:36.989314Z"}]')
+    columns = dwnld.GDAX.decode_trades(trades)
+
+    assert columns['trade_id'].tolist() == [1, 2]
+    assert columns['price'].tolist() == [204.0, 204.5]
+    assert columns['side'].tolist() == [1, 0]
+    assert columns['time'].view(np.int64).tolist() == [1430292696989314000,
+                                                       1430292697000000000]
+
+    assert dwnld.GDAX.format_trades(columns) == \
+        [('1', '204.0', 'sell', '1e-08', u'2015-04-29T07:31:36.989314Z'),
+         ('2', '204.5', 'buy', '0.1', u'2015-04-29T07:31:37Z')]
+
+    assert decode.nb_rows(dwnld.GDAX.decode_trades([])) == 0
+
+
+def test_decode_kraken_trades():
+    """Test the last Kraken timestamp is replaced, and not the time."""
+    trades = decode.loads('[["97.00000", "1.00000000", 1378856831.5461, "s",'
+                          ' "m", ""], ["97.50000", "0.50000000", 1378856832,'
+                          ' "b", "l", "", 12]]')
+    columns = dwnld.Kraken.decode_trades(trades, '1378856832000123456')
+
+    assert columns['price'].tolist() == [97.0, 97.5]
+    assert columns['timestamp'].tolist() == [1378856831546100000,
+                                             1378856832000123456]
+    assert columns['time'].view(np.int64).tolist() == [1378856831546100000,
+                                                       1378856832000000000]
+
+    assert dwnld.Kraken.format_trades(columns) == \
+        [('2013-09-10 23:47:11.546100', u'97.00000', u'1.00000000',
+          '1378856831546100000', 's', 'm', u''),
+         ('2013-09-10 23:47:12.000000', u'97.50000', u'0.50000000',
+          '1378856832000123456', 'b', 'l', u'')]
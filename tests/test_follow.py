@@ -0,0 +1,95 @@
+"""Test following pairs live."""
+import threading
+import time
+
+import src.download_trades as dwnld
+import src.resample as resample
+from src.brokers import follow
+from src.brokers.rate_limit import RateLimiter
+from tests.mock_exchange import MockExchange
+
+
+def test_adaptive_interval():
+    """Test busy pairs are polled as often as allowed, and quiet pairs less
+    and less often."""
+    interval = follow.AdaptiveInterval(min_interval=1., max_interval=30.,
+                                       target_trades=10)
+
+    assert interval.update(100, 1.) == 1.
+
+    intervals = [interval.update(0, 1.) for _ in range(20)]
+    assert intervals == sorted(intervals)
+    assert intervals[-1] == 30.
+
+    assert 1. < interval.update(10, 5.) < 30.
+
+
+def test_follow_gdax(tmpdir, monkeypatch, quiet_telemetry):
+    """Test new trades are appended at once, and bars written as their
+    period closes."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+
+    # Trades occurred from 25 to 4 minutes ago: bars are closed by the time
+    # until 10 minutes ago, then by later trades
+    with MockExchange(nb_trades=1000, interval=1.,
+                      start=time.time() - 1500) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+        dwnld.GDAX.write_trades_from(0, file_path, 'BTC-EUR')
+
+        on_poll = resample.bar_writer(file_path, ['1T'], delay=600.,
+                                      tz='UTC')
+        follower = follow.PairFollower(dwnld.GDAX, file_path, 'BTC-EUR',
+                                       on_poll=on_poll)
+
+        assert follower.poll() == 0
+
+        exchange.nb_trades = 1234
+        assert follower.poll() == 234
+        assert dwnld.GDAX.get_last_trade_id_of_file(file_path) == 1234
+
+        follower.writer.close()
+
+    assert dwnld.GDAX.check_file_consistency(file_path) == []
+
+    expected = resample.resample(resample.load_file(file_path), '1T')
+    with open(resample.bars_file(file_path, '1T'), 'r') as bars_file:
+        assert bars_file.read() == expected.iloc[:-1].to_csv()
+
+
+def test_follow_pairs(tmpdir, monkeypatch, quiet_telemetry):
+    """Test followed pairs get new trades within a few polls, until they are
+    stopped."""
+    monkeypatch.setattr(dwnld.Kraken, 'RATE_LIMITER', RateLimiter(1000))
+    file_path = str(tmpdir.join('XBTEUR.csv'))
+
+    with MockExchange(nb_trades=500,
+                      kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS) as exchange:
+        monkeypatch.setattr(dwnld.Kraken, 'BASE_URL', exchange.kraken_url)
+        dwnld.Kraken.write_trades_from(0, file_path, 'XBTEUR')
+
+        interval = follow.AdaptiveInterval(min_interval=0.01,
+                                           max_interval=0.1)
+        follower = follow.PairFollower(dwnld.Kraken, file_path, 'XBTEUR',
+                                       interval=interval)
+        stop = threading.Event()
+        thread = threading.Thread(target=follow.follow_pairs,
+                                  args=([follower], stop))
+        thread.start()
+
+        exchange.nb_trades = 2500
+        last = exchange.trade_timestamp(2500)
+        deadline = time.time() + 10
+
+        while (dwnld.Kraken.get_last_trade_timestamp_of_file(file_path) !=
+               last and time.time() < deadline):
+            time.sleep(0.01)
+
+        stop.set()
+        thread.join()
+
+    assert dwnld.Kraken.get_last_trade_timestamp_of_file(file_path) == last
+    assert follower.writer.file is None
+    assert dwnld.Kraken.check_file_consistency(file_path) == []
+    assert len(open(file_path).readlines()) == 2501
@@ -1,5 +1,7 @@
 """Test GDAX broker."""
 import src.download_trades as dwnld
+from src.brokers.rate_limit import RateLimiter
+from tests.mock_exchange import MockExchange
 
 import pytest
 import requests
@@ -9,20 +11,17 @@ def test_get_trades():
     """Test get_trades."""
     trades = dwnld.GDAX.get_trades(1, 'BTC-EUR')
 
-    assert trades[0][0] == {'price': 204.0,
-                            'time': u'2015-04-29T07:31:37.989314Z',
-                            'side': u'sell',
-                            'trade_id': 100,
-                            'size': 0.048}
+    assert dwnld.GDAX.format_trades(trades[0])[-1] == \
+        ('100', '204.0', 'sell', '0.048', u'2015-04-29T07:31:37.989314Z')
 
-    assert len(trades[0]) == dwnld.GDAX.LIMIT
+    assert len(trades[0]['trade_id']) == dwnld.GDAX.LIMIT
     assert not trades[1]
 
     trades = requests.get(dwnld.GDAX.BASE_URL + 'BTC-EUR' + '/trades')
     last_trade = trades.json()[0]['trade_id']
 
     trades = dwnld.GDAX.get_trades(last_trade - 20, 'BTC-EUR')
-    assert len(trades[0]) == 21
+    assert len(trades[0]['trade_id']) == 21
     assert trades[1]
 
 
@@ -46,3 +45,50 @@ def test_check_file_consistency():
 
     diff = dwnld.GDAX.check_file_consistency('tests/data/gdax/BTC-EUR.csv')
     assert diff == []
+
+
+def test_write_trades_from(tmpdir, monkeypatch):
+    """Test write_trades_from with concurrent workers."""
+    last_trade_id = 1234
+
+    def get_trades(base_trade_number, pair):
+        trades = [dict(trade_id=tid, price=str(200.0 + tid), side='buy',
+                       size='0.1', time='2015-04-23T01:42:34.182104Z')
+                  for tid in range(base_trade_number + 99,
+                                   base_trade_number - 1, -1)
+                  if tid <= last_trade_id]
+        return (dwnld.GDAX.decode_trades(trades),
+                base_trade_number + 99 > last_trade_id)
+
+    monkeypatch.setattr(dwnld.GDAX, 'get_trades', staticmethod(get_trades))
+
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    dwnld.GDAX.write_trades_from(0, file_path, 'BTC-EUR', workers=8)
+
+    assert dwnld.GDAX.get_last_trade_id_of_file(file_path) == last_trade_id
+    assert dwnld.GDAX.check_file_consistency(file_path) == []
+
+
+def test_download_missing_trades(tmpdir, monkeypatch):
+    """Test download_missing_trades on a local mock exchange, with throttled
+    requests."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+
+    # With this seed, the first request is throttled, whatever the number
+    # of requests
+    with MockExchange(nb_trades=1234, throttle_rate=0.2,
+                      seed=1) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR', workers=4)
+        assert dwnld.GDAX.get_last_trade_id_of_file(file_path) == 1234
+
+        # Resume the download
+        exchange.nb_trades = 1500
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR', workers=4)
+
+    assert dwnld.GDAX.get_last_trade_id_of_file(file_path) == 1500
+    assert dwnld.GDAX.check_file_consistency(file_path) == []
+    assert exchange.throttled > 0
@@ -0,0 +1,64 @@
+"""Test the shared HTTP session."""
+import BaseHTTPServer
+import threading
+
+import pytest
+
+from src.brokers import http_session
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer 'ok' to every GET request, keeping the connection alive."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """Answer the request."""
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+
+@pytest.fixture
+def server():
+    """Start a local HTTP server and return its URL."""
+    httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield 'http://127.0.0.1:' + str(httpd.server_address[1]) + '/'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_session_reuses_connections(server):
+    """Test connections are kept alive and timings are recorded."""
+    session = http_session.TimedSession()
+
+    responses = [session.get(server) for _ in range(5)]
+
+    assert [response.text for response in responses] == ['ok'] * 5
+    assert responses[0].timings['connect'] > 0
+    assert all(response.timings['connect'] == 0 for response in responses[1:])
+    assert session.stats.requests == 5
+    assert session.stats.connections == 1
+
+
+def test_configure():
+    """Test configure drops the shared session."""
+    session = http_session.get_session()
+    assert http_session.get_session() is session
+
+    http_session.configure(timeout=5, gzip=False)
+    new_session = http_session.get_session()
+
+    assert new_session is not session
+    assert new_session.timeout == 5
+    assert new_session.headers['Accept-Encoding'] == 'identity'
+
+    http_session.configure(timeout=http_session.DEFAULT_TIMEOUT, gzip=True)
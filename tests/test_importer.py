@@ -0,0 +1,128 @@
+"""Test the import of published dumps of trades."""
+import os
+
+import pytest
+
+import src.download_trades as dwnld
+from src.brokers import importer
+from src.brokers.consistency import CHECKPOINT_SUFFIX, read_checkpoint
+from src.brokers.rate_limit import RateLimiter
+from src.brokers.trade_writer import CsvTradeWriter
+from tests.mock_exchange import MockExchange
+
+
+class FakeBroker(object):
+    """A broker whose keys could be shared by several trades."""
+    COLUMNS = ['key', 'value']
+    KEY_COLUMN = 'key'
+    KEY_RULE = 'increasing'
+
+
+def write_gdax_file(file_path, first, last):
+    """Write the synthetic GDAX trades first to last in a trade file
+    (compressed or not)."""
+    exchange = MockExchange(nb_trades=last, interval=60.)
+
+    with CsvTradeWriter(file_path, dwnld.GDAX.COLUMNS, flush_bytes=3000,
+                        format_rows=dwnld.GDAX.format_trades) as writer:
+        for after in range(first + 100, last + 101, 100):
+            trades = exchange.gdax_trades(min(after, last + 1))
+            trades = [trade for trade in trades
+                      if trade['trade_id'] >= max(first, after - 100)]
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+
+def test_import_gdax(tmpdir, monkeypatch):
+    """Test overlapping dumps are merged with the output file, which is then
+    resumed without being checked again."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    expected_path = str(tmpdir.join('expected.csv'))
+    dump_paths = [str(tmpdir.join('dump1.csv.gz')),
+                  str(tmpdir.join('dump2.csv'))]
+
+    write_gdax_file(file_path, 1, 1000)
+    write_gdax_file(dump_paths[0], 801, 2200)
+    write_gdax_file(dump_paths[1], 1, 3000)
+    write_gdax_file(expected_path, 1, 3000)
+
+    nb_lines, issues = importer.import_dumps(dwnld.GDAX, file_path,
+                                             dump_paths, chunk_bytes=5000)
+
+    assert (nb_lines, issues) == (3000, [])
+    assert open(file_path, 'rb').read() == open(expected_path, 'rb').read()
+    assert read_checkpoint(file_path)['last'] == 3000
+    assert not os.path.exists(file_path + importer.IMPORT_SUFFIX)
+
+    with MockExchange(nb_trades=3456, interval=60.) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR')
+
+    write_gdax_file(expected_path, 3001, 3456)
+    assert open(file_path, 'rb').read() == open(expected_path, 'rb').read()
+
+
+def test_import_issues(tmpdir):
+    """Test missing trades are reported, and unsorted or foreign dumps
+    rejected."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    dump_paths = [str(tmpdir.join('dump1.csv')),
+                  str(tmpdir.join('dump2.csv'))]
+
+    write_gdax_file(dump_paths[0], 1, 1000)
+    write_gdax_file(dump_paths[1], 1011, 2000)
+
+    assert importer.import_dumps(dwnld.GDAX, file_path, dump_paths) == \
+        (1990, [(1000, 1011)])
+    assert not os.path.exists(file_path + CHECKPOINT_SUFFIX)
+
+    with open(dump_paths[1], 'rb') as csv_file:
+        lines = csv_file.readlines()
+    lines[10:12] = lines[11:9:-1]
+    with open(dump_paths[1], 'wb') as csv_file:
+        csv_file.writelines(lines)
+
+    with pytest.raises(ValueError):
+        importer.import_dumps(dwnld.GDAX, file_path, dump_paths[1:],
+                              chunk_bytes=1000)
+    assert len(open(file_path).readlines()) == 1991
+    assert not os.path.exists(file_path + importer.IMPORT_SUFFIX)
+
+    with pytest.raises(ValueError):
+        importer.import_dumps(dwnld.Kraken, file_path, dump_paths[:1])
+
+
+def test_import_failure(tmpdir, monkeypatch):
+    """Test the temporary file is removed if the import fails."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    dump_path = str(tmpdir.join('dump.csv'))
+    write_gdax_file(dump_path, 1, 1000)
+
+    def fail(*args):
+        """Fail as a full disk."""
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(os, 'fsync', fail)
+    with pytest.raises(OSError):
+        importer.import_dumps(dwnld.GDAX, file_path, [dump_path])
+
+    assert not os.path.exists(file_path)
+    assert not os.path.exists(file_path + importer.IMPORT_SUFFIX)
+
+
+def test_merge_shared_keys(tmpdir):
+    """Test trades sharing a key are taken from the first input having
+    it."""
+    file_path = str(tmpdir.join('trades.csv'))
+    dump_path = str(tmpdir.join('dump.csv'))
+
+    with open(file_path, 'w') as csv_file:
+        csv_file.write('key,value\n1,a\n2,b\n2,c\n4,d\n')
+    with open(dump_path, 'w') as csv_file:
+        csv_file.write('key,value\n2,x\n3,y\n3,z\n4,w\n4,v\n5,u')
+
+    assert importer.import_dumps(FakeBroker, file_path, [dump_path],
+                                 chunk_bytes=4) == (7, [])
+    assert open(file_path).read() == \
+        'key,value\n1,a\n2,b\n2,c\n3,y\n3,z\n4,d\n5,u\n'
@@ -1,5 +1,13 @@
 """Test Kraken broker."""
+import time
+
+import pandas as pd
+
 import src.download_trades as dwnld
+from src.brokers import kraken
+from src.brokers.rate_limit import RateLimiter
+from tests.mock_exchange import MockExchange
+
 import pytest
 import requests
 
@@ -8,10 +16,10 @@ def test_get_trades():
     """Test Kraken get_trades."""
     trades = dwnld.Kraken.get_trades(0, 'XBTEUR')
 
-    trade = ["97.00000", "1.00000000", 1378856831.546, "s", "m", ""]
-    assert trades[0][0] == trade
+    row = (u'97.00000', u'1.00000000', '1378856831546000000', 's', 'm', u'')
+    assert dwnld.Kraken.format_trades(trades[0])[0][1:] == row
 
-    assert len(trades[0]) == dwnld.Kraken.LIMIT
+    assert len(trades[0]['timestamp']) == dwnld.Kraken.LIMIT
     assert not trades[1]
 
     response = requests.get(dwnld.Kraken.BASE_URL, params=dict(pair='XBTEUR'))
@@ -45,3 +53,114 @@ def test_check_file_consistency():
 
     diff = dwnld.Kraken.check_file_consistency('tests/data/kraken/XBTEUR.csv')
     assert diff == []
+
+
+def test_download_missing_trades(tmpdir, monkeypatch):
+    """Test download_missing_trades on a local mock exchange, with throttled
+    requests."""
+    monkeypatch.setattr(dwnld.Kraken, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    monkeypatch.setattr(dwnld.Kraken, 'LIMIT', 100)
+    file_path = str(tmpdir.join('XBTEUR.csv'))
+
+    with MockExchange(nb_trades=2345, kraken_page_size=100,
+                      throttle_rate=0.2,
+                      kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS) as exchange:
+        monkeypatch.setattr(dwnld.Kraken, 'BASE_URL', exchange.kraken_url)
+
+        dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR')
+
+        # Resume the download
+        exchange.nb_trades = 3000
+        dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR')
+
+    with open(file_path, 'r') as csv_file:
+        assert len(csv_file.readlines()) == 3000 + 1
+
+    assert dwnld.Kraken.check_file_consistency(file_path) == []
+    assert exchange.throttled > 0
+
+
+def test_download_shards(tmpdir, monkeypatch):
+    """Test time shards downloaded concurrently give the same file as a
+    sequential download, resumed as usual."""
+    monkeypatch.setattr(dwnld.Kraken, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    monkeypatch.setattr(dwnld.Kraken, 'LIMIT', 30)
+    monkeypatch.setattr(dwnld.Kraken, 'SHARD_DURATION', 10**9)
+    sequential_path = str(tmpdir.join('sequential.csv'))
+    sharded_path = str(tmpdir.join('sharded.csv'))
+
+    # The history ends now, a shard holding 3 or 4 pages. Trades at shard
+    # boundaries have their time rounded after the boundary.
+    with MockExchange(nb_trades=2345, kraken_page_size=30,
+                      throttle_rate=0.2, start=int(time.time()) - 30.00003,
+                      kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS) as exchange:
+        monkeypatch.setattr(dwnld.Kraken, 'BASE_URL', exchange.kraken_url)
+
+        dwnld.Kraken.download_missing_trades(sequential_path, 'XBTEUR')
+        dwnld.Kraken.download_missing_trades(sharded_path, 'XBTEUR',
+                                             workers=4)
+
+        exchange.nb_trades = 3000
+        dwnld.Kraken.download_missing_trades(sequential_path, 'XBTEUR')
+        dwnld.Kraken.download_missing_trades(sharded_path, 'XBTEUR',
+                                             workers=4)
+
+    assert dwnld.Kraken.check_file_consistency(sharded_path) == []
+
+    # Timestamps of the last trades of pages are the cursors of the next
+    # pages, which depend on where pages start
+    sequential = pd.read_csv(sequential_path).drop('timestamp', axis=1)
+    sharded = pd.read_csv(sharded_path).drop('timestamp', axis=1)
+    assert len(sharded) == 3000
+    pd.testing.assert_frame_equal(sharded, sequential)
+
+
+def test_resume_interrupted_shards(tmpdir, monkeypatch):
+    """Test a sharded download interrupted between two shards is resumed
+    without missing or duplicated trades."""
+    monkeypatch.setattr(dwnld.Kraken, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    monkeypatch.setattr(dwnld.Kraken, 'LIMIT', 30)
+    monkeypatch.setattr(dwnld.Kraken, 'SHARD_DURATION', 10**9)
+    file_path = str(tmpdir.join('XBTEUR.csv'))
+
+    class Interrupted(Exception):
+        """Raised to interrupt the download."""
+
+    messages = []
+
+    def interrupt(message):
+        """Interrupt the download before writing the third shard."""
+        messages.append(message)
+        if len([line for line in messages
+                if line.startswith('Get trades from time ')]) == 3:
+            raise Interrupted()
+
+    # Times are rounded 30 micro-seconds before the cursors, so resuming
+    # from the time of a trade would get it again
+    with MockExchange(nb_trades=2345, kraken_page_size=30,
+                      start=int(time.time()) - 29.99997,
+                      kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS) as exchange:
+        monkeypatch.setattr(dwnld.Kraken, 'BASE_URL', exchange.kraken_url)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(kraken, 'progress', interrupt)
+            with pytest.raises(Interrupted):
+                dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR',
+                                                     workers=4)
+
+        assert 0 < len(pd.read_csv(file_path)) < 2345
+
+        dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR',
+                                             workers=4)
+        times = [exchange.trade_time(trade_id)
+                 for trade_id in range(1, 2346)]
+
+    assert dwnld.Kraken.check_file_consistency(file_path) == []
+    trades = pd.read_csv(file_path)
+    assert len(trades) == 2345
+    assert (pd.to_datetime(trades['time']).values.astype('int64') ==
+            (pd.Series(times) * 10**6).round().astype('int64').values *
+            1000).all()
@@ -0,0 +1,123 @@
+"""Test the sparse index of trade files, and reading ranges with it."""
+import os
+
+import pandas as pd
+
+import src.download_trades as dwnld
+from src import resample
+from src.brokers import offset_index
+from src.brokers.trade_writer import CsvTradeWriter, recover
+from tests.mock_exchange import MockExchange
+
+
+def write_gdax_file(file_path, nb_trades, index_bytes=1000):
+    """Write a GDAX trade file of nb_trades synthetic trades, by pages of 100
+    trades, with an index entry about every index_bytes bytes."""
+    exchange = MockExchange(nb_trades=nb_trades, interval=60.)
+
+    with CsvTradeWriter(file_path, dwnld.GDAX.COLUMNS, flush_bytes=3000,
+                        format_rows=dwnld.GDAX.format_trades,
+                        index_key='trade_id',
+                        index_bytes=index_bytes) as writer:
+        for after in range(101, nb_trades + 101, 100):
+            trades = exchange.gdax_trades(after)
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+
+def test_writer_index(tmpdir):
+    """Test the index written with the file is the one built from it, and
+    points to the indexed lines."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 1000)
+
+    entries = offset_index.read_index(file_path)
+    assert len(entries) > 10
+
+    with open(file_path, 'rb') as csv_file:
+        for offset, key, time in entries:
+            csv_file.seek(offset)
+            row = csv_file.readline().rstrip('\n').split(',')
+            assert int(row[0]) == key
+            assert offset_index.parse_time(row[4]) == time
+
+    # Resuming continues the index
+    with CsvTradeWriter(file_path, dwnld.GDAX.COLUMNS,
+                        format_rows=dwnld.GDAX.format_trades,
+                        index_key='trade_id', index_bytes=1000) as writer:
+        trades = MockExchange(nb_trades=1100, interval=60.).gdax_trades(1101)
+        writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+    entries = offset_index.read_index(file_path)
+    assert offset_index.build_index(file_path, 'trade_id', 1000) == entries
+    assert entries[-1][1] > 1000
+
+
+def test_find_range():
+    """Test the byte range holds the lines of a range of keys."""
+    entries = [(10, 1, 100), (50, 5, 500), (90, 9, 900)]
+
+    assert offset_index.find_range(entries, 'key') == (None, None)
+    assert offset_index.find_range(entries, 'key', 5, 5) == (10, 90)
+    assert offset_index.find_range(entries, 'key', 6, 8) == (50, 90)
+    assert offset_index.find_range(entries, 'time', 1000) == (90, None)
+    assert offset_index.find_range(entries, 'time', end=50) == (None, 10)
+
+
+def test_recover_truncates_index(tmpdir):
+    """Test entries after a removed uncommitted tail are removed."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 500)
+    size = os.path.getsize(file_path)
+    entries = offset_index.read_index(file_path)
+
+    with open(file_path, 'ab') as csv_file:
+        csv_file.write('501,200.01,sell,0.02,2015-04-25T22:13:20.000000Z\n')
+    offset_index.append_index(file_path, [(size, 501, 0)])
+
+    assert recover(file_path) > 0
+    assert offset_index.read_index(file_path) == entries
+
+
+def test_check_range(tmpdir):
+    """Test only issues of a range of trade IDs are reported, and an
+    outdated index is built again."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 2000)
+
+    with open(file_path, 'rb') as csv_file:
+        lines = csv_file.readlines()
+    del lines[300]
+    del lines[1500:1502]
+    with open(file_path, 'wb') as csv_file:
+        csv_file.writelines(lines)
+
+    assert dwnld.GDAX.check_file_ranges(file_path, full=True) == \
+        [(299, 301), (1500, 1503)]
+    assert dwnld.GDAX.check_file_ranges(file_path, start=1000) == \
+        [(1500, 1503)]
+    assert dwnld.GDAX.check_file_ranges(file_path, start=200, end=300) == \
+        [(299, 301)]
+    assert dwnld.GDAX.check_file_ranges(file_path, start=400,
+                                        end=1400) == []
+
+
+def test_load_range(tmpdir):
+    """Test a time range of a file is loaded, as a whole or by chunks, and
+    resampled."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 3000)
+    offset_index.remove_index(file_path)
+
+    start, end = '2015-04-26 04:00', '2015-04-26 11:30'
+    trades = resample.load_file(file_path)
+    expected = trades[(trades.index >= start) & (trades.index <= end)]
+
+    df = resample.load_file(file_path, start, end)
+    pd.testing.assert_frame_equal(df, expected)
+    assert os.path.exists(file_path + offset_index.INDEX_SUFFIX)
+
+    chunks = list(resample.iter_chunks(file_path, 100, start, end))
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+    re_df = resample.resample_file(file_path, '1H', 100, start, end)
+    pd.testing.assert_frame_equal(re_df, resample.resample(expected, '1H'))
@@ -0,0 +1,61 @@
+"""Test the page fetcher."""
+import itertools
+import random
+import time
+
+import pytest
+
+from src.brokers.page_fetcher import PageFetcher
+
+
+def test_iter_pages_keeps_order():
+    """Test pages are given back in the order of keys."""
+    def fetch(key):
+        time.sleep(random.random() / 100)
+        return key * 2
+
+    fetcher = PageFetcher(fetch, workers=8)
+    pages = list(fetcher.iter_pages(range(50)))
+
+    assert pages == [(key, key * 2) for key in range(50)]
+
+
+def test_iter_pages_retries():
+    """Test pages failing with RuntimeError are fetched again."""
+    failures = []
+
+    def fetch(key):
+        if key == 3 and not failures:
+            raise RuntimeError('Error code 500')
+        return key
+
+    def on_error(key, exception):
+        failures.append((key, str(exception)))
+
+    fetcher = PageFetcher(fetch, workers=4, on_error=on_error)
+    pages = [page for _, page in fetcher.iter_pages(range(10))]
+
+    assert pages == list(range(10))
+    assert failures == [(3, 'Error code 500')]
+
+
+def test_iter_pages_raises():
+    """Test unexpected exceptions are raised to the caller."""
+    def fetch(key):
+        raise KeyError(key)
+
+    with pytest.raises(KeyError):
+        list(PageFetcher(fetch, workers=2).iter_pages(range(10)))
+
+
+def test_iter_pages_infinite_keys():
+    """Test iterating can be stopped on an infinite iterator on keys."""
+    fetcher = PageFetcher(lambda key: key, workers=4)
+    pages = []
+
+    for key, page in fetcher.iter_pages(itertools.count(0, 100)):
+        pages.append(page)
+        if key == 500:
+            break
+
+    assert pages == [0, 100, 200, 300, 400, 500]
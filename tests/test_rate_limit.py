@@ -0,0 +1,57 @@
+"""Test the rate limiter."""
+import time
+
+from src.brokers.rate_limit import RateLimiter
+
+
+def test_acquire():
+    """Test acquire allows a burst, then waits for new tokens."""
+    limiter = RateLimiter(50, burst=5)
+
+    start = time.time()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.time() - start < 0.05
+
+    for _ in range(5):
+        limiter.acquire()
+    assert time.time() - start >= 0.08
+
+
+def test_aimd():
+    """Test the rate decreases when throttled and increases on success."""
+    limiter = RateLimiter(10, backoff_base=0.001)
+
+    limiter.record_status(429)
+    assert limiter.rate == 5
+    limiter.record_status(503)
+    assert limiter.rate == 2.5
+    assert limiter.failures == 2
+
+    limiter.record_status(200)
+    assert limiter.rate == 3
+    assert limiter.failures == 0
+
+    for _ in range(100):
+        limiter.success()
+    assert limiter.rate == 10
+
+    for _ in range(100):
+        limiter.throttled()
+    assert limiter.rate == 1
+
+
+def test_backoff():
+    """Test failures block requests during a bounded backoff delay."""
+    limiter = RateLimiter(1000, backoff_base=0.05, backoff_max=0.2)
+
+    for failures in range(1, 20):
+        delay = limiter.backoff_delay(failures)
+        assert 0 <= delay <= min(0.2, 0.05 * 2 ** (failures - 1))
+
+    limiter.record_status(404)
+    assert limiter.rate == 1000
+    assert limiter.blocked_until <= time.time() + 0.05
+
+    limiter.acquire()
+    assert time.time() >= limiter.blocked_until
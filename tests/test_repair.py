@@ -0,0 +1,180 @@
+"""Test the repair of inconsistent trade files."""
+import os
+import resource
+
+import pandas as pd
+import pytest
+
+import src.download_trades as dwnld
+from src.brokers import consistency, repair
+from src.brokers.rate_limit import RateLimiter
+from tests.mock_exchange import MockExchange
+
+
+def test_merge_ranges():
+    """Test overlapping and adjacent ranges are merged, then split."""
+    ranges = repair.merge_ranges([(10, 12), (1, 3), (4, 5), (11, 20)])
+    assert ranges == [(1, 5), (10, 20)]
+
+    assert repair.split_ranges(ranges, 4) == [(1, 4), (5, 5), (10, 13),
+                                              (14, 17), (18, 20)]
+
+
+def test_rewrite_file(tmpdir):
+    """Test sorted runs are merged, and lines within ranges replaced."""
+    file_path = str(tmpdir.join('trades.csv'))
+    with open(file_path, 'w') as csv_file:
+        csv_file.write('key,value\n1,a\n2,b\n6,c\n3,d\n4,e\n4,f\n7,g\n5,h\n')
+
+    assert repair.find_runs(file_path, 'key') == [(10, 22), (22, 38),
+                                                  (38, 42)]
+
+    nb_lines = repair.rewrite_file(file_path, 'key', [(4, 4)],
+                                   [('4', 'x')])
+
+    assert nb_lines == 7
+    assert open(file_path).read() == \
+        'key,value\n1,a\n2,b\n3,d\n4,x\n5,h\n6,c\n7,g\n'
+    assert not tmpdir.join('trades.csv' + repair.REPAIR_SUFFIX).exists()
+
+
+def test_rewrite_many_runs(tmpdir, monkeypatch):
+    """Test a file with more sorted runs than allowed file handles is
+    rewritten, and a failed rewrite leaves the file as it was."""
+    file_path = str(tmpdir.join('trades.csv'))
+    keys = [key ^ 1 for key in range(4000)]
+    content = 'key,value\n' + ''.join(str(key) + ',' + str(key) + '\n'
+                                      for key in keys)
+    with open(file_path, 'w') as csv_file:
+        csv_file.write(content[:-1])
+
+    # Chunks smaller than the runs, cut within lines
+    monkeypatch.setattr(repair, '_RUN_CHUNK_BYTES', 5)
+    limits = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (256, limits[1]))
+    try:
+        nb_lines = repair.rewrite_file(file_path, 'key', [], [])
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, limits)
+
+    assert nb_lines == 4000
+    assert open(file_path).read() == 'key,value\n' + ''.join(
+        str(key) + ',' + str(key) + '\n' for key in range(4000))
+
+    with open(file_path, 'w') as csv_file:
+        csv_file.write(content)
+
+    # The fetched rows are parsed while the file is rewritten
+    with pytest.raises(ValueError):
+        repair.rewrite_file(file_path, 'key', [(0, 0)], [('x', 'y')])
+    assert open(file_path).read() == content
+    assert not tmpdir.join('trades.csv' + repair.REPAIR_SUFFIX).exists()
+
+
+def corrupt(file_path, moves):
+    """Remove, duplicate and move lines of a CSV file.
+
+    Positional arguments:
+    file_path -- The CSV file
+    moves     -- A list of (slice, destination index) tuples: lines of the
+                 slice are removed, then inserted before destination index
+                 (if not None)
+    """
+    with open(file_path, 'r') as csv_file:
+        lines = csv_file.readlines()
+
+    for part, destination in moves:
+        moved = lines[part]
+        del lines[part]
+
+        if destination is not None:
+            lines[destination:destination] = moved
+
+    with open(file_path, 'w') as csv_file:
+        csv_file.writelines(lines)
+
+
+def test_repair_gdax(tmpdir, monkeypatch):
+    """Test missing, duplicated and unordered GDAX trades are repaired."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+
+    with MockExchange(nb_trades=1234, throttle_rate=0.2) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR', workers=4)
+        expected = open(file_path, 'rb').read()
+
+        # Missing trades, unordered trades and a duplicated trade
+        corrupt(file_path, [(slice(100, 250), None),
+                            (slice(500, 510), 700),
+                            (slice(900, 901), 901)])
+        with open(file_path, 'a') as csv_file:
+            csv_file.write(expected.splitlines(True)[-1])
+
+        assert dwnld.GDAX.check_file_ranges(file_path) != []
+        assert repair.repair_file(dwnld.GDAX, file_path, 'BTC-EUR') > 0
+
+    assert open(file_path, 'rb').read() == expected
+    assert dwnld.GDAX.check_file_ranges(file_path, full=True) == []
+
+
+def test_full_repair(tmpdir, monkeypatch):
+    """Test a full check repairs issues before a valid checkpoint."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+
+    with MockExchange(nb_trades=1234) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR', workers=4)
+        expected = open(file_path, 'rb').read()
+
+        # Missing trades, before a checkpoint at the end of the file
+        corrupt(file_path, [(slice(100, 250), None)])
+        consistency.write_checkpoint(file_path, os.path.getsize(file_path),
+                                     1234)
+        assert dwnld.GDAX.check_file_ranges(file_path) == []
+
+        dwnld.GDAX.download_missing_trades(file_path, 'BTC-EUR',
+                                           full_check=True, repair=True)
+
+    assert open(file_path, 'rb').read() == expected
+
+
+def test_repair_kraken(tmpdir, monkeypatch):
+    """Test Kraken trades are sorted back, and missing ones fetched again,
+    through download_missing_trades."""
+    monkeypatch.setattr(dwnld.Kraken, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    monkeypatch.setattr(dwnld.Kraken, 'LIMIT', 100)
+    file_path = str(tmpdir.join('XBTEUR.csv'))
+
+    with MockExchange(nb_trades=2345, kraken_page_size=100,
+                      throttle_rate=0.2,
+                      kraken_pairs=dwnld.Kraken.SPECIAL_PAIRS) as exchange:
+        monkeypatch.setattr(dwnld.Kraken, 'BASE_URL', exchange.kraken_url)
+
+        dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR')
+        expected = pd.read_csv(file_path)
+
+        # Unordered trades, some of them missing (timestamps of the missing
+        # ones are between the unordered ones, or they could not be detected)
+        corrupt(file_path, [(slice(300, 350), 1000),
+                            (slice(400, 410), None)])
+        assert dwnld.Kraken.check_file_ranges(file_path) != []
+
+        exchange.nb_trades = 3000
+        dwnld.Kraken.download_missing_trades(file_path, 'XBTEUR',
+                                             repair=True)
+
+    trades = pd.read_csv(file_path)
+
+    assert len(trades) == 3000
+    assert (trades['timestamp'].values[:len(expected)] ==
+            expected['timestamp'].values).all()
+    assert (trades['price'].values[:len(expected)] ==
+            expected['price'].values).all()
+    assert dwnld.Kraken.check_file_ranges(file_path, full=True) == []
@@ -1,4 +1,9 @@
 """Test the file resample.py."""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
 import pytest
 
 import src.resample as resample
@@ -9,6 +14,19 @@ def test_load_file():
     with pytest.raises(RuntimeError):
         resample.load_file('tests/data/gdax/BTC-EUR_bad_header.csv')
 
+    # Times are parsed as by read_csv, in UTC for GDAX and naive for Kraken
+    for file_path in ['tests/data/gdax/BTC-EUR.csv',
+                      'tests/data/kraken/XBTEUR.csv']:
+        expected = pd.read_csv(file_path, usecols=['time', 'price', 'size'],
+                               index_col='time', parse_dates=True)
+        pd.testing.assert_frame_equal(resample.load_file(file_path),
+                                      expected)
+
+        df = resample.load_file(file_path, compact=True)
+        assert df.dtypes.tolist() == [np.float32, np.float32]
+        assert (df.index == expected.index).all()
+        assert np.allclose(df.values, expected.values)
+
 
 def test_resample():
     """Test resample."""
@@ -25,3 +43,151 @@ def test_resample():
     assert(re_df.high['2015-04-28'] == 209.53)
     assert(re_df.low['2015-04-28'] == 204.48)
     assert(re_df.close['2015-04-28'] == 205.95)
+
+
+def test_resample_file():
+    """Test resampling by chunks gives the same result as in memory."""
+    for file_path in ['tests/data/gdax/BTC-EUR.csv',
+                      'tests/data/kraken/XBTEUR.csv']:
+        df = resample.load_file(file_path)
+
+        for period in ['1D', '7H', '13T', 'W', 'M']:
+            expected = resample.resample(df.copy(), period)
+
+            for chunk_rows in [1, 2, 5, 100]:
+                re_df = resample.resample_file(file_path, period, chunk_rows)
+                pd.testing.assert_frame_equal(re_df, expected)
+                assert re_df.to_csv() == expected.to_csv()
+
+
+def test_resample_parallel(tmpdir):
+    """Test resampling shards in parallel gives the same result as in
+    memory."""
+    for file_name in ['gdax/BTC-EUR.csv', 'kraken/XBTEUR.csv']:
+        # The index of the file is written next to it
+        file_path = str(tmpdir.join(os.path.basename(file_name)))
+        shutil.copy(os.path.join('tests/data', file_name), file_path)
+        df = resample.load_file(file_path)
+
+        for period in ['1T', '13T', '7H', '1D', 'W', 'M']:
+            expected = resample.resample(df.copy(), period)
+
+            for jobs in [1, 3]:
+                re_df = resample.resample_parallel(file_path, period, jobs)
+                pd.testing.assert_frame_equal(re_df, expected)
+                assert re_df.to_csv() == expected.to_csv()
+
+    # Kraken trades of a time range
+    start, end = '2013-09-12 03:00', '2013-09-14 12:00'
+    re_df = resample.resample_parallel(file_path, '1H', 2, start, end)
+    pd.testing.assert_frame_equal(
+        re_df, resample.resample(resample.load_file(file_path, start, end),
+                                 '1H'))
+
+
+def test_iter_resample_unsorted():
+    """Test iter_resample refuses trades unsorted across chunks."""
+    df = resample.load_file('tests/data/gdax/BTC-EUR.csv')
+
+    with pytest.raises(ValueError):
+        list(resample.iter_resample([df.iloc[10:], df.iloc[:10]], '1D'))
+
+
+def test_resample_periods():
+    """Test resampling several periods at once, longer periods being
+    computed from shorter ones."""
+    df = resample.load_file('tests/data/kraken/XBTEUR.csv')
+    periods = ['1T', '5T', '7T', '1H', '7H', '1D', 'W', 'M', 'B']
+
+    re_dfs = resample.resample(df, periods)
+    chunked_re_dfs = resample.resample_file('tests/data/kraken/XBTEUR.csv',
+                                            periods, 4)
+
+    for period in periods:
+        expected = resample.resample(df, period)
+
+        for re_df in [re_dfs[period], chunked_re_dfs[period]]:
+            # Volumes could differ by rounding errors
+            pd.testing.assert_frame_equal(re_df, expected, check_exact=False)
+            pd.testing.assert_frame_equal(re_df.drop('volume', axis=1),
+                                          expected.drop('volume', axis=1),
+                                          check_exact=True)
+
+
+def test_resample_incremental(tmpdir):
+    """Test incremental resampling gives the same file as a full resampling,
+    while only the last bars are recomputed."""
+    with open('tests/data/kraken/XBTEUR.csv', 'r') as csv_file:
+        lines = csv_file.readlines()
+
+    input_file = str(tmpdir.join('XBTEUR.csv'))
+
+    for period in ['1D', '7H', '13T', 'W']:
+        output_file = str(tmpdir.join('XBTEUR_' + period + '.csv'))
+        tail_only = []
+
+        for nb_lines in [3, 10, 20, 20, len(lines)]:
+            with open(input_file, 'w') as csv_file:
+                csv_file.writelines(lines[:nb_lines])
+
+            tail_only.append(resample.resample_incremental(
+                input_file, period, output_file, chunk_rows=4))
+
+            expected = resample.resample(resample.load_file(input_file),
+                                         period)
+            with open(output_file, 'r') as out_file:
+                assert out_file.read() == expected.to_csv()
+
+        assert tail_only == [False, True, True, True, True]
+
+    # A rewritten input file is fully resampled again
+    with open(input_file, 'w') as csv_file:
+        csv_file.writelines(lines[:1] + lines[5:])
+
+    assert not resample.resample_incremental(input_file, 'W', output_file)
+
+
+def test_live_resampler(tmpdir):
+    """Test bars returned as periods close are the bars of resample, and are
+    resumed from an output file."""
+    with pytest.raises(ValueError):
+        resample.LiveResampler('7H')
+
+    for data_path in ['tests/data/gdax/BTC-EUR.csv',
+                      'tests/data/kraken/XBTEUR.csv']:
+        # The sparse index is built next to the file
+        file_path = str(tmpdir.join(os.path.basename(data_path)))
+        shutil.copy(data_path, file_path)
+        df = resample.load_file(file_path)
+
+        for period in ['1D', '8H', '15T']:
+            expected = resample.resample(df.copy(), period)
+            resampler = resample.LiveResampler(period)
+
+            # Periods are closed by later trades, or by the time
+            bars = [resampler.add(df.iloc[index:index + 1],
+                                  now=df.index.asi8[index] if index % 2
+                                  else None)
+                    for index in range(len(df))]
+            bars.append(resampler.add(now=df.index.asi8[-1] +
+                                      24 * 3600 * 10**9))
+            re_df = pd.concat(bars)
+
+            assert re_df.index[len(expected) - 1] == expected.index[-1]
+            assert (re_df.iloc[len(expected):].volume == 0).all()
+            pd.testing.assert_frame_equal(re_df.iloc[:len(expected)],
+                                          expected)
+
+            # Closed bars are appended to the output file, which is resumed
+            output_file = resample.bars_file(file_path, period)
+            resample.live_resampler(file_path, period, output_file)
+            with open(output_file, 'r') as out_file:
+                lines = out_file.readlines()
+            with open(output_file, 'w') as out_file:
+                out_file.writelines(lines[:len(lines) // 2 + 1])
+
+            resampler = resample.live_resampler(file_path, period,
+                                                output_file, chunk_rows=3)
+            with open(output_file, 'r') as out_file:
+                assert out_file.read() == expected.iloc[:-1].to_csv()
+            assert resampler.bar.index[0].value == expected.index[-1].value
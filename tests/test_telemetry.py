@@ -0,0 +1,85 @@
+"""Test the instrumentation of downloads."""
+import json
+
+import src.download_trades as dwnld
+from src.brokers import telemetry
+from src.brokers.rate_limit import RateLimiter
+from tests.mock_exchange import MockExchange
+
+
+def test_export(tmpdir):
+    """Test stats are exported as JSON and as a Prometheus textfile."""
+    registry = telemetry.Telemetry()
+    registry.count('GDAX', 'BTC-EUR', 'trades', 100)
+    registry.count('GDAX', 'BTC-EUR', 'pages')
+    for seconds in [0.0005, 0.02, 0.02, 20.]:
+        registry.observe('GDAX', 'BTC-EUR', 'network', seconds)
+
+    json_path = str(tmpdir.join('stats.json'))
+    registry.write(json_path)
+    [pair] = json.load(open(json_path))['pairs']
+
+    assert pair['counters'] == dict(requests=0, failed_requests=0, pages=1,
+                                    trades=100)
+    network = pair['stages']['network']
+    assert network['count'] == 4
+    assert dict((str(bound), total) for bound, total in network['buckets'])[
+        '0.025'] == 3
+    assert network['buckets'][-1] == ['+Inf', 4]
+
+    prometheus_path = str(tmpdir.join('stats.prom'))
+    registry.write(prometheus_path)
+    lines = open(prometheus_path).read().splitlines()
+
+    assert 'crypto_downloader_trades_total{broker="GDAX",pair="BTC-EUR"} ' \
+        '100' in lines
+    assert 'crypto_downloader_stage_seconds_bucket{broker="GDAX",' \
+        'pair="BTC-EUR",le="0.001",stage="network"} 1' in lines
+    assert 'crypto_downloader_stage_seconds_count{broker="GDAX",' \
+        'pair="BTC-EUR",stage="write"} 0' in lines
+
+
+def test_download_stats(tmpdir, monkeypatch, capsys,
+                        quiet_telemetry):
+    """Test a quiet download prints no line per page, and records its
+    pages, failed requests and stage timings."""
+    monkeypatch.setattr(dwnld.GDAX, 'RATE_LIMITER',
+                        RateLimiter(1000, burst=100, backoff_base=0.001))
+    stats_path = str(tmpdir.join('stats.json'))
+
+    exporter = telemetry.start_export(stats_path, interval=0.01)
+
+    with MockExchange(nb_trades=1234, throttle_rate=0.5) as exchange:
+        monkeypatch.setattr(dwnld.GDAX, 'BASE_URL', exchange.gdax_url)
+        dwnld.GDAX.write_trades_from(0, str(tmpdir.join('BTC-EUR.csv')),
+                                     'BTC-EUR', workers=4)
+
+    exporter.stop()
+
+    assert 'Get trades' not in capsys.readouterr().out
+
+    [pair] = json.load(open(stats_path))['pairs']
+    counters = pair['counters']
+
+    # Pages after the last one could have been fetched
+    assert counters['trades'] >= 1234
+    assert counters['requests'] == exchange.requests
+    assert counters['failed_requests'] == exchange.throttled > 0
+    assert counters['requests'] == \
+        counters['pages'] + counters['failed_requests']
+    assert pair['stages']['network']['count'] == counters['requests']
+    assert pair['stages']['build']['count'] == counters['pages']
+    assert pair['stages']['write']['count'] == 13
+
+    [line] = telemetry.get_telemetry().summary()
+    assert line.startswith('GDAX BTC-EUR: ')
+
+
+def test_reset(quiet_telemetry):
+    """Test reset replaces the shared registry by an empty one."""
+    telemetry.get_telemetry().count('GDAX', 'BTC-EUR', 'pages')
+
+    registry = telemetry.reset()
+    assert telemetry.get_telemetry() is registry
+    assert registry.snapshot()['pairs'] == []
+    assert len(quiet_telemetry.snapshot()['pairs']) == 1
@@ -0,0 +1,163 @@
+"""Test the in-process trade loader and its chunk cache."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.download_trades as dwnld
+from src import resample
+from src import trade_loader
+from src.brokers import offset_index
+from src.brokers.columnar import ColumnarTradeWriter
+from src.brokers.trade_writer import CsvTradeWriter
+from tests.mock_exchange import MockExchange
+
+
+def write_gdax_file(file_path, first, last):
+    """Append the synthetic GDAX trades first to last to a trade file, with
+    an index entry about every 1000 bytes."""
+    exchange = MockExchange(nb_trades=last, interval=60.)
+
+    if file_path.endswith('.columns'):
+        writer = ColumnarTradeWriter(file_path, dwnld.GDAX.COLUMNS,
+                                     dwnld.GDAX.COLUMNAR_SCHEMA)
+    else:
+        writer = CsvTradeWriter(file_path, dwnld.GDAX.COLUMNS,
+                                format_rows=dwnld.GDAX.format_trades,
+                                index_key='trade_id', index_bytes=1000)
+
+    with writer:
+        for after in range(first + 100, last + 101, 100):
+            trades = exchange.gdax_trades(min(after, last + 1))
+            trades = [trade for trade in trades if trade['trade_id'] >= first]
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+
+def expected_trades(file_path, start, end, columns):
+    """Return the trades of a file from start to end, read by load_file."""
+    trades = pd.read_csv(file_path, index_col='time', parse_dates=True)
+    return trades[(trades.index >= start) & (trades.index <= end)][columns]
+
+
+def test_load_trades(tmpdir):
+    """Test trades are loaded from the trade file of a pair, chunks being
+    parsed only once."""
+    file_path = str(tmpdir.mkdir('GDAX').join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 1, 3000)
+
+    loader = trade_loader.TradeLoader()
+    start, end = '2015-04-26 04:00', '2015-04-26 11:30'
+    columns = ['trade_id', 'price']
+
+    df = loader.load_file(file_path, start, end, columns)
+    pd.testing.assert_frame_equal(
+        df, expected_trades(file_path, start, end, columns))
+    misses = loader.misses
+    assert 0 < misses < len(offset_index.read_index(file_path)) / 4
+
+    # The same and an overlapping query are answered from the cache
+    loader.load_file(file_path, start, end, columns)
+    df = loader.load_file(file_path, '2015-04-26 06:00', '2015-04-26 08:00')
+    assert loader.misses == misses
+    assert loader.hits > misses
+    assert list(df.columns) == ['trade_id', 'price', 'side', 'size']
+
+    # Through load_trades
+    df = trade_loader.load_trades('GDAX', 'BTC-EUR', start, end, columns,
+                                  data_dir=str(tmpdir))
+    pd.testing.assert_frame_equal(
+        df, expected_trades(file_path, start, end, columns))
+
+    with pytest.raises(IOError):
+        trade_loader.load_trades('GDAX', 'BTC-USD', data_dir=str(tmpdir))
+
+
+def test_cache_invalidation(tmpdir):
+    """Test only the last chunk is parsed again when the file grows, and all
+    chunks when it is rewritten."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 1, 2000)
+
+    loader = trade_loader.TradeLoader()
+    assert len(loader.load_file(file_path)) == 2000
+    misses = loader.misses
+    nb_chunks = len(offset_index.read_index(file_path))
+
+    # Only the former last chunk and the new ones are parsed
+    write_gdax_file(file_path, 2001, 2500)
+    df = loader.load_file(file_path)
+    assert len(df) == 2500
+    assert df['trade_id'].is_monotonic_increasing
+    assert loader.misses - misses == \
+        len(offset_index.read_index(file_path)) - nb_chunks + 1
+
+    # A rewritten file
+    with open(file_path, 'rb') as csv_file:
+        lines = csv_file.readlines()
+    os.remove(file_path)
+    with open(file_path + '.tmp', 'wb') as csv_file:
+        csv_file.writelines(lines[:1001])
+    os.rename(file_path + '.tmp', file_path)
+
+    pd.testing.assert_frame_equal(
+        loader.load_file(file_path),
+        pd.read_csv(file_path, index_col='time', parse_dates=True))
+
+
+def test_cache_is_bounded(tmpdir):
+    """Test the least recently used chunks are dropped."""
+    file_path = str(tmpdir.join('BTC-EUR.csv'))
+    write_gdax_file(file_path, 1, 3000)
+
+    loader = trade_loader.TradeLoader(cache_bytes=20000)
+    df = loader.load_file(file_path)
+
+    assert len(df) == 3000
+    assert 0 < loader.nb_bytes <= 20000
+    assert len(loader.chunks) < loader.misses
+
+
+def test_load_columnar(tmpdir):
+    """Test trades are loaded from a columnar store, by days."""
+    csv_path = str(tmpdir.join('BTC-EUR.csv'))
+    store_path = str(tmpdir.join('BTC-EUR.columns'))
+    write_gdax_file(csv_path, 1, 3000)
+    write_gdax_file(store_path, 1, 3000)
+
+    loader = trade_loader.TradeLoader()
+    start, end = '2015-04-25 22:00', '2015-04-27 01:00'
+    df = loader.load_file(store_path, start, end)
+
+    assert loader.misses == 3
+    expected = loader.load_file(csv_path, start, end)
+    assert (df.index.asi8 == expected.index.asi8).all()
+    assert (df['side'].values == expected['side'].values).all()
+    assert (df['price'].values == expected['price'].values).all()
+
+    re_df = resample.resample(df, '1H')
+    assert re_df.volume.sum() == pytest.approx(df['size'].sum())
+
+
+def test_load_compact(tmpdir):
+    """Test a compact loader returns float32 prices and sizes, and
+    categorical sides, from a CSV file or a columnar store."""
+    csv_path = str(tmpdir.join('BTC-EUR.csv'))
+    store_path = str(tmpdir.join('BTC-EUR.columns'))
+    write_gdax_file(csv_path, 1, 3000)
+    write_gdax_file(store_path, 1, 3000)
+
+    expected = trade_loader.TradeLoader().load_file(csv_path)
+    loader = trade_loader.TradeLoader(compact=True)
+
+    for file_path in [csv_path, store_path]:
+        df = loader.load_file(file_path)
+
+        assert df.dtypes.to_dict() == dict(trade_id=np.int64,
+                                           price=np.float32,
+                                           side='category',
+                                           size=np.float32)
+        assert sorted(df['side'].cat.categories) == ['buy', 'sell']
+        assert (df.index.asi8 == expected.index.asi8).all()
+        assert (df['side'].astype(str) == expected['side']).all()
+        assert np.allclose(df['price'], expected['price'])
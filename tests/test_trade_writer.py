@@ -0,0 +1,173 @@
+"""Test the CSV trade writer."""
+import random
+
+import numpy as np
+import pandas as pd
+
+import src.download_trades as dwnld
+from src.brokers.trade_writer import (CsvTradeWriter, format_datetimes,
+                                      read_commit, recover)
+
+
+def gdax_pages(nb_pages):
+    """Return random GDAX pages, as decoded from GDAX answers."""
+    rand = random.Random(42)
+    pages = []
+
+    for page in range(nb_pages):
+        trades = [dict(trade_id=tid, price=round(rand.uniform(1, 2e4), 2),
+                       side=rand.choice([u'buy', u'sell']),
+                       size=rand.random() * 10 ** rand.randint(-8, 3),
+                       time=u'2015-04-23T01:42:34.182104Z')
+                  for tid in range(page * 100 + 1, page * 100 + 101)]
+        rand.shuffle(trades)
+        pages.append(trades)
+
+    return pages
+
+
+def kraken_pages(nb_pages):
+    """Return random Kraken pages, as decoded from Kraken answers."""
+    rand = random.Random(42)
+    pages = []
+    timestamp = 1378856831.5461
+
+    for _ in range(nb_pages):
+        trades = []
+        for _ in range(rand.randint(1, 1000)):
+            timestamp += rand.choice([0, 0.001, 1, 86400, rand.random()])
+            trades.append(['%.5f' % rand.uniform(90, 2e4),
+                           '%.8f' % rand.random(), timestamp,
+                           rand.choice('bs'), rand.choice('ml'), ''])
+        pages.append((trades, str(int(timestamp * 10**9) + 1)))
+
+    # Pages with whole seconds, milli-seconds and days only
+    pages.append(([['1.0', '1.0', 1378856831.0, 'b', 'm', ''],
+                   ['1.0', '1.0', 1378856832.0, 'b', 'm', '']], '1'))
+    pages.append(([['1.0', '1.0', 1378856831.546, 'b', 'm', ''],
+                   ['1.0', '1.0', 1378856832.0, 'b', 'm', '']], '2'))
+    pages.append(([['1.0', '1.0', 1378771200.0, 'b', 'm', '']], '3'))
+
+    return pages
+
+
+def write_gdax_with_pandas(pages, file_path):
+    """Write GDAX pages as the former pandas implementation."""
+    write_header = True
+    for trades in pages:
+        df = pd.DataFrame.from_records(trades, index='trade_id')
+        df.sort_index(inplace=True)
+        df.to_csv(file_path, mode='a', header=write_header)
+        write_header = False
+
+
+def write_kraken_with_pandas(pages, file_path):
+    """Write Kraken pages with pandas, timestamps being rounded to the
+    micro-second as the trade writer does (the former pandas
+    implementation truncated them)."""
+    write_header = True
+    for trades, next_timestamp in pages:
+        cols = ['price', 'size', 'timestamp', 'side', 'type', 'misc']
+        df = pd.DataFrame(trades, columns=cols)
+        # Timestamps are rounded to the micro-second
+        df.timestamp = df.timestamp * 10**6
+        df.timestamp = df.timestamp.round().astype(np.int64)
+        df.timestamp = df.timestamp * 10**3
+        df['time'] = pd.to_datetime(df['timestamp'])
+        df.iloc[-1, df.columns.get_loc('timestamp')] = next_timestamp
+        df.set_index('time', inplace=True)
+        df.to_csv(file_path, mode='a', header=write_header)
+        write_header = False
+
+
+def test_format_datetimes():
+    """Test format_datetimes."""
+    assert format_datetimes([1378856831546000000, 1378859634762600000]) == \
+        ['2013-09-10 23:47:11.546000', '2013-09-11 00:33:54.762600']
+    assert format_datetimes([1378856831546000001]) == \
+        ['2013-09-10 23:47:11.546000001']
+    assert format_datetimes([1378856831546000000]) == \
+        ['2013-09-10 23:47:11.546']
+    assert format_datetimes([1378856831000000000]) == ['2013-09-10 23:47:11']
+    assert format_datetimes([1378771200000000000]) == ['2013-09-10']
+
+
+def test_gdax_output_is_identical(tmpdir):
+    """Test GDAX output is byte-identical to the pandas output."""
+    pages = gdax_pages(20)
+
+    expected = str(tmpdir.join('expected.csv'))
+    write_gdax_with_pandas(pages, expected)
+
+    output = str(tmpdir.join('output.csv'))
+    with CsvTradeWriter(output, dwnld.GDAX.COLUMNS, flush_bytes=1000,
+                        format_rows=dwnld.GDAX.format_trades) as writer:
+        for trades in pages:
+            writer.write_columns(dwnld.GDAX.decode_trades(trades))
+
+    assert open(output, 'rb').read() == open(expected, 'rb').read()
+
+
+def test_kraken_output_is_identical(tmpdir):
+    """Test Kraken output is byte-identical to the pandas output, with
+    timestamps rounded to the micro-second."""
+    pages = kraken_pages(20)
+
+    expected = str(tmpdir.join('expected.csv'))
+    write_kraken_with_pandas(pages, expected)
+
+    output = str(tmpdir.join('output.csv'))
+    with CsvTradeWriter(output, dwnld.Kraken.COLUMNS,
+                        format_rows=dwnld.Kraken.format_trades) as writer:
+        for trades, next_timestamp in pages:
+            writer.write_columns(dwnld.Kraken.decode_trades(trades,
+                                                            next_timestamp))
+
+    assert open(output, 'rb').read() == open(expected, 'rb').read()
+
+
+def test_writer_appends(tmpdir):
+    """Test the header is written once and the file is created lazily."""
+    file_path = str(tmpdir.join('trades.csv'))
+
+    with CsvTradeWriter(file_path, ['a', 'b']) as writer:
+        writer.write_rows([])
+    assert not tmpdir.join('trades.csv').exists()
+
+    for value in ['1', '2']:
+        with CsvTradeWriter(file_path, ['a', 'b'], flush_bytes=1) as writer:
+            writer.write_rows([(value, value)])
+
+    assert open(file_path).read() == 'a,b\n1,1\n2,2\n'
+
+
+def test_recover(tmpdir):
+    """Test an uncommitted tail is removed, and only a torn line without
+    commit."""
+    file_path = str(tmpdir.join('trades.csv'))
+
+    with CsvTradeWriter(file_path, ['a', 'b']) as writer:
+        writer.write_rows([('1', '1'), ('2', '2')])
+    assert read_commit(file_path) == len('a,b\n1,1\n2,2\n')
+
+    # A batch partially written by a killed run
+    with open(file_path, 'ab') as csv_file:
+        csv_file.write('3,3\n4,')
+
+    assert recover(file_path) == len('3,3\n4,')
+    assert open(file_path).read() == 'a,b\n1,1\n2,2\n'
+    assert recover(file_path) == 0
+
+    # Without commit (written by a former version), keep complete lines
+    tmpdir.join('trades.csv.commit').remove()
+    with open(file_path, 'ab') as csv_file:
+        csv_file.write('3,3\n4,')
+
+    assert read_commit(file_path) is None
+    assert recover(file_path) == len('4,')
+    assert open(file_path).read() == 'a,b\n1,1\n2,2\n3,3\n'
+
+    with CsvTradeWriter(file_path, ['a', 'b']) as writer:
+        writer.write_rows([('4', '4')])
+    assert open(file_path).read() == 'a,b\n1,1\n2,2\n3,3\n4,4\n'
+    assert recover(file_path) == 0